@@ -9,15 +9,22 @@
     """,
     'author': 'Tu Nombre',
     'website': 'https://www.tuempresa.com',
-    'depends': ['base', 'mail', 'portal', 'website'],
+    'depends': ['base', 'bus', 'mail', 'portal', 'website'],
     'data': [
         'security/security_groups.xml',
         'security/ir.model.access.csv',
         'data/sequence_data.xml',
+        'data/cron_data.xml',
         'views/cancha_views.xml',
         'views/reserva_views.xml',
         'views/cliente_views.xml',
+        'views/recurrencia_views.xml',
+        'views/espera_views.xml',
+        'views/historico_views.xml',
+        'views/report_ocupacion_views.xml',
         'views/menu_views.xml',
+        'wizard/importar_reservas_views.xml',
+        'wizard/exportar_reservas_views.xml',
         'views/portal_templates.xml',
         'views/portal_templates_2.xml',
         'views/portal_templates_3.xml',
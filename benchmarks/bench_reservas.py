@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Generador de carga y benchmark de latencia del módulo de Reserva de Canchas
+
+Genera datos sintéticos reproducibles (misma semilla, mismos datos) en una base
+local y mide percentiles de latencia y rendimiento de las rutas de reserva y de
+los cálculos clave del ORM. Los resultados se guardan en JSON para comparar
+ejecuciones antes y después de un cambio.
+
+    # 1. Datos: 30 canchas, 5000 clientes y 2 años de reservas
+    $ python benchmarks/bench_reservas.py -c odoo.conf -d bench generar --canchas 30 --clientes 5000 --anios 2
+
+    # 2. Medición contra un servidor en marcha sobre esa base
+    $ python benchmarks/bench_reservas.py -c odoo.conf -d bench medir --url http://localhost:8069 \\
+          --peticiones 200 --concurrencia 4 --salida antes.json
+
+    # 3. Comparación de dos ejecuciones
+    $ python benchmarks/bench_reservas.py comparar antes.json despues.json
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+# Usuarios que crea `generar` y usa `medir`
+LOGIN_PORTAL = 'bench_portal'
+LOGIN_ADMIN = 'bench_admin'
+
+# Reservas por create: igual que el importador
+TAMANO_LOTE = 1000
+
+DEPORTES = ['futbol', 'futsal', 'basquet', 'voley', 'tenis', 'padel']
+SUPERFICIES = ['cesped_natural', 'cesped_sintetico', 'cemento', 'parquet', 'tierra']
+METODOS_PAGO = ['efectivo', 'tarjeta', 'transferencia', 'yape']
+
+
+# ---------------------------------------------------------------------------
+# Entorno de Odoo
+# ---------------------------------------------------------------------------
+
+def abrir_registro(args):
+    import odoo
+    opciones = ['-d', args.base]
+    if args.config:
+        opciones += ['-c', args.config]
+    odoo.tools.config.parse_config(opciones)
+    return odoo.registry(args.base)
+
+
+def entorno(cr):
+    import odoo
+    return odoo.api.Environment(cr, odoo.SUPERUSER_ID, {'tz': 'America/Lima'})
+
+
+# ---------------------------------------------------------------------------
+# Generación de datos
+# ---------------------------------------------------------------------------
+
+def generar(args):
+    rnd = random.Random(args.semilla)
+    registry = abrir_registro(args)
+    inicio = time.perf_counter()
+
+    with registry.cursor() as cr:
+        env = entorno(cr)
+        contexto = {'tracking_disable': True, 'mail_create_nolog': True, 'reserva_historico': True}
+
+        canchas = env['reserva.cancha'].with_context(contexto).create([{
+            'name': 'Bench %s %03d' % (DEPORTES[i % len(DEPORTES)], i),
+            'tipo_deporte': DEPORTES[i % len(DEPORTES)],
+            'tipo_superficie': rnd.choice(SUPERFICIES),
+            'capacidad': rnd.choice([10, 12, 14, 22]),
+            'precio_hora': rnd.choice([30.0, 35.0, 40.0, 50.0, 60.0]),
+            'techada': rnd.random() < 0.5,
+            'iluminacion': rnd.random() < 0.7,
+            'vestuarios': rnd.random() < 0.6,
+            'estacionamiento': rnd.random() < 0.4,
+        } for i in range(args.canchas)])
+        print('Canchas: %s' % len(canchas))
+
+        cliente_ids = []
+        for desde in range(0, args.clientes, TAMANO_LOTE):
+            cliente_ids += env['reserva.cliente'].with_context(contexto).create([{
+                'name': 'Cliente Bench %06d' % i,
+                'dni': 'B%08d' % i,
+                'telefono': '9%08d' % i,
+                'email': 'cliente%06d@bench.example' % i,
+            } for i in range(desde, min(desde + TAMANO_LOTE, args.clientes))]).ids
+        print('Clientes: %s' % len(cliente_ids))
+
+        cliente_portal = crear_usuarios(env, args.password)
+        cliente_ids.append(cliente_portal.id)
+        cr.commit()
+
+        # Reservas sin solapes: cada cancha y día se recorre de la apertura al cierre
+        hoy = date.today()
+        primer_dia = hoy - timedelta(days=int(365 * args.anios))
+        ultimo_dia = hoy + timedelta(days=args.dias_futuros)
+        lote = []
+        total = 0
+        dia = primer_dia
+        while dia <= ultimo_dia:
+            for cancha in canchas:
+                hora = 6
+                while hora < 23:
+                    duracion = rnd.choice([1, 1, 1, 2])
+                    if hora + duracion > 23:
+                        break
+                    if rnd.random() < args.ocupacion:
+                        lote.append(vals_reserva(rnd, cancha.id, rnd.choice(cliente_ids), dia, hora, duracion, hoy))
+                    hora += duracion
+            if len(lote) >= TAMANO_LOTE:
+                total += insertar(env, lote, contexto)
+                lote = []
+                print('Reservas: %s (hasta %s)' % (total, dia), end='\r')
+            dia += timedelta(days=1)
+        total += insertar(env, lote, contexto)
+        cr.commit()
+        print('Reservas: %s' % total)
+
+    print('Generación terminada en %.1f s' % (time.perf_counter() - inicio))
+
+
+def vals_reserva(rnd, cancha_id, cliente_id, dia, hora, duracion, hoy):
+    if dia < hoy:
+        estado = rnd.choices(['completada', 'cancelada', 'no_asistio'], [85, 10, 5])[0]
+    else:
+        estado = rnd.choices(['confirmada', 'borrador'], [90, 10])[0]
+    return {
+        'cancha_id': cancha_id,
+        'cliente_id': cliente_id,
+        'fecha': dia,
+        'hora_inicio': float(hora),
+        'hora_fin': float(hora + duracion),
+        'estado': estado,
+        'metodo_pago': rnd.choice(METODOS_PAGO),
+        'pagado': estado == 'completada',
+    }
+
+
+def insertar(env, lote, contexto):
+    if not lote:
+        return 0
+    env['reserva.reserva'].with_context(contexto).create(lote)
+    env.cr.commit()
+    env.invalidate_all()
+    return len(lote)
+
+
+def crear_usuarios(env, password):
+    """Un usuario portal con su cliente y un administrador del módulo"""
+    Users = env['res.users'].with_context(no_reset_password=True)
+    portal = Users.search([('login', '=', LOGIN_PORTAL)]) or Users.create({
+        'name': 'Bench Portal',
+        'login': LOGIN_PORTAL,
+        'password': password,
+        'groups_id': [(6, 0, [env.ref('base.group_portal').id])],
+    })
+    Users.search([('login', '=', LOGIN_ADMIN)]) or Users.create({
+        'name': 'Bench Admin',
+        'login': LOGIN_ADMIN,
+        'password': password,
+        'groups_id': [(6, 0, [env.ref('base.group_user').id,
+                              env.ref('reserva_canchas.group_reserva_admin').id])],
+    })
+    Cliente = env['reserva.cliente']
+    return Cliente.search([('partner_id', '=', portal.partner_id.id)], limit=1) or Cliente.create({
+        'name': portal.name,
+        'dni': 'BPORTAL',
+        'telefono': '900000000',
+        'partner_id': portal.partner_id.id,
+    })
+
+
+# ---------------------------------------------------------------------------
+# Medición
+# ---------------------------------------------------------------------------
+
+def resumen(tiempos, duracion_total=None, errores=0):
+    """Percentiles en milisegundos y rendimiento en peticiones por segundo"""
+    ordenados = sorted(tiempos)
+    if not ordenados:
+        return {'n': 0, 'errores': errores}
+
+    def percentil(p):
+        return round(ordenados[min(len(ordenados) - 1, int(round(p / 100.0 * (len(ordenados) - 1))))] * 1000, 2)
+
+    datos = {
+        'n': len(ordenados),
+        'errores': errores,
+        'media_ms': round(statistics.mean(ordenados) * 1000, 2),
+        'p50_ms': percentil(50),
+        'p90_ms': percentil(90),
+        'p95_ms': percentil(95),
+        'p99_ms': percentil(99),
+        'max_ms': round(ordenados[-1] * 1000, 2),
+    }
+    if duracion_total:
+        datos['por_segundo'] = round(len(ordenados) / duracion_total, 2)
+    return datos
+
+
+def cronometrar(funcion, peticiones, concurrencia):
+    """Ejecuta `funcion(i)` `peticiones` veces con `concurrencia` hilos"""
+    def una(i):
+        inicio = time.perf_counter()
+        try:
+            ok = funcion(i)
+        except Exception:
+            ok = False
+        return time.perf_counter() - inicio, ok
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        resultados = list(pool.map(una, range(peticiones)))
+    duracion = time.perf_counter() - inicio
+    tiempos = [t for t, ok in resultados if ok]
+    return resumen(tiempos, duracion, errores=len(resultados) - len(tiempos))
+
+
+def sesion(url, base, login, password):
+    import requests
+    s = requests.Session()
+    respuesta = s.post(url + '/web/session/authenticate', json={
+        'jsonrpc': '2.0', 'method': 'call',
+        'params': {'db': base, 'login': login, 'password': password},
+    })
+    respuesta.raise_for_status()
+    if respuesta.json().get('error'):
+        raise SystemExit('No se pudo iniciar sesión como %s' % login)
+    return s
+
+
+def json_rpc(s, url, params):
+    respuesta = s.post(url, json={'jsonrpc': '2.0', 'method': 'call', 'params': params}, timeout=30)
+    return respuesta.ok and not respuesta.json().get('error')
+
+
+def medir(args):
+    import requests
+    rnd = random.Random(args.semilla)
+    url = args.url.rstrip('/')
+
+    registry = abrir_registro(args)
+    with registry.cursor() as cr:
+        env = entorno(cr)
+        cancha_ids = env['reserva.cancha'].search([('estado', '=', 'disponible')]).ids
+        conteos = {
+            'canchas': len(cancha_ids),
+            'clientes': env['reserva.cliente'].search_count([]),
+            'reservas': env['reserva.reserva'].search_count([]),
+            'reservas_archivadas': env['reserva.reserva.historico'].search_count([]),
+        }
+        # Las confirmaciones van a días sin reservas: después de la última
+        # (incluidas las de ejecuciones anteriores) y nunca antes de mañana
+        cr.execute("SELECT MAX(fecha) FROM reserva_reserva WHERE cancha_id IN %s", [tuple(cancha_ids or [0])])
+        ultima = cr.fetchone()[0]
+        orm = medir_orm(env, args.repeticiones)
+    if not cancha_ids:
+        raise SystemExit('No hay canchas: ejecute antes el subcomando generar')
+
+    publica = requests.Session()
+    portal = sesion(url, args.base, LOGIN_PORTAL, args.password)
+    admin = sesion(url, args.base, LOGIN_ADMIN, args.password)
+    hoy = date.today()
+
+    def fecha_futura(i):
+        return (hoy + timedelta(days=1 + i % 30)).strftime('%Y-%m-%d')
+
+    def catalogo(i):
+        return publica.get(url + '/reservas', timeout=30).ok
+
+    def disponibilidad(i):
+        return json_rpc(publica, url + '/reservas/disponibilidad', {
+            'cancha_id': rnd.choice(cancha_ids), 'fecha': fecha_futura(i)})
+
+    def mis_reservas(i):
+        return portal.get(url + '/mis-reservas', timeout=30).ok
+
+    def dashboard(i):
+        return admin.get(url + '/reservas/dashboard', timeout=30).ok
+
+    # Cada confirmación usa un hueco distinto de un día libre para no chocar
+    primer_dia = max(hoy, ultima or hoy) + timedelta(days=1)
+    formularios = preparar_confirmaciones(portal, url, cancha_ids, args.peticiones, primer_dia)
+
+    def confirmar(i):
+        datos = formularios[i]
+        respuesta = portal.post(url + '/reservas/confirmar', data=datos, allow_redirects=False, timeout=30)
+        return respuesta.status_code in (200, 303) and '/reservas/confirmacion/' in respuesta.headers.get('Location', '')
+
+    rutas = {
+        '/reservas': catalogo,
+        '/reservas/disponibilidad': disponibilidad,
+        '/reservas/confirmar': confirmar,
+        '/mis-reservas': mis_reservas,
+        '/reservas/dashboard': dashboard,
+    }
+    resultados = {}
+    for nombre, funcion in rutas.items():
+        # Calentamiento con el índice que sigue a los medidos: en /reservas/confirmar
+        # es el formulario sobrante, así ninguna medición reenvía uno ya usado
+        funcion(args.peticiones)
+        resultados[nombre] = cronometrar(funcion, args.peticiones, args.concurrencia)
+        print('%-28s %s' % (nombre, resultados[nombre]))
+
+    salida = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit_actual(),
+        'parametros': {
+            'url': url, 'peticiones': args.peticiones,
+            'concurrencia': args.concurrencia, 'semilla': args.semilla,
+        },
+        'datos': conteos,
+        'rutas': resultados,
+        'orm': orm,
+    }
+    with open(args.salida, 'w') as f:
+        json.dump(salida, f, indent=2)
+    print('Resultados en %s' % args.salida)
+
+
+def preparar_confirmaciones(s, url, cancha_ids, cantidad, primer_dia):
+    """Formularios de confirmación con token CSRF y token de envío reales:
+    `cantidad` para medir y uno más para el calentamiento.
+
+    Cada uno ocupa una hora distinta de 6:00 a 23:00, recorriendo las canchas
+    y, cuando se acaban, los días siguientes a `primer_dia`.
+    """
+    formularios = []
+    for i in range(cantidad + 1):
+        dia = (primer_dia + timedelta(days=i // (17 * len(cancha_ids)))).strftime('%Y-%m-%d')
+        cancha_id = cancha_ids[(i // 17) % len(cancha_ids)]
+        hora = 6 + i % 17
+        pagina = s.get(url + '/reservas/crear', params={
+            'cancha_id': cancha_id, 'fecha': dia, 'hora_inicio': hora, 'hora_fin': hora + 1,
+        }, timeout=30).text
+        formularios.append({
+            'csrf_token': buscar_input(pagina, 'csrf_token'),
+            'token_envio': buscar_input(pagina, 'token_envio'),
+            'cancha_id': cancha_id,
+            'fecha': dia,
+            'hora_inicio': hora,
+            'hora_fin': hora + 1,
+            'telefono': '900000000',
+        })
+    return formularios
+
+
+def buscar_input(html, nombre):
+    encontrado = re.search(r'name="%s"[^>]*value="([^"]*)"' % nombre, html)
+    return encontrado.group(1) if encontrado else ''
+
+
+def medir_orm(env, repeticiones):
+    """Cálculos clave del ORM, dentro de una transacción que se descarta"""
+    Cancha = env['reserva.cancha']
+    Cliente = env['reserva.cliente']
+    canchas = Cancha.search([])
+    clientes = Cliente.search([], limit=1000)
+    pruebas = {
+        'cancha._compute_disponibilidad_hoy': lambda: Cancha.browse(canchas.ids)._compute_disponibilidad_hoy(),
+        'cancha._compute_contadores': lambda: Cancha.browse(canchas.ids)._compute_contadores(),
+        'cliente._compute_contadores[1000]': lambda: Cliente.browse(clientes.ids)._compute_contadores(),
+        'reserva.stats.daily._reconstruir': lambda: env['reserva.stats.daily']._reconstruir(),
+        'reserva.ocupacion._reconstruir': lambda: env['reserva.ocupacion']._reconstruir(),
+    }
+    resultados = {}
+    for nombre, funcion in pruebas.items():
+        tiempos = []
+        for _i in range(repeticiones):
+            env.invalidate_all()
+            inicio = time.perf_counter()
+            funcion()
+            env.flush_all()
+            tiempos.append(time.perf_counter() - inicio)
+        env.cr.rollback()
+        resultados[nombre] = resumen(tiempos)
+        print('%-36s %s' % (nombre, resultados[nombre]))
+    return resultados
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Comparación
+# ---------------------------------------------------------------------------
+
+def comparar(args):
+    with open(args.antes) as f:
+        antes = json.load(f)
+    with open(args.despues) as f:
+        despues = json.load(f)
+    print('%-36s %10s %10s %8s' % ('', 'p95 antes', 'p95 desp.', 'cambio'))
+    for seccion in ('rutas', 'orm'):
+        for nombre, datos in despues.get(seccion, {}).items():
+            previo = antes.get(seccion, {}).get(nombre, {}).get('p95_ms')
+            actual = datos.get('p95_ms')
+            if previo and actual:
+                print('%-36s %10.1f %10.1f %+7.0f%%' % (nombre, previo, actual, (actual - previo) / previo * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', help='archivo de configuración de Odoo')
+    parser.add_argument('-d', '--base', help='base de datos')
+    parser.add_argument('--semilla', type=int, default=42)
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('generar', help='genera datos sintéticos')
+    p.add_argument('--canchas', type=int, default=20)
+    p.add_argument('--clientes', type=int, default=2000)
+    p.add_argument('--anios', type=float, default=1)
+    p.add_argument('--dias-futuros', type=int, default=60)
+    p.add_argument('--ocupacion', type=float, default=0.5, help='probabilidad de que una franja esté reservada')
+    p.add_argument('--password', default='bench')
+    p.set_defaults(funcion=generar)
+
+    p = sub.add_parser('medir', help='mide rutas y cálculos del ORM')
+    p.add_argument('--url', default='http://localhost:8069')
+    p.add_argument('--peticiones', type=int, default=100)
+    p.add_argument('--concurrencia', type=int, default=1)
+    p.add_argument('--repeticiones', type=int, default=5, help='repeticiones de cada cálculo del ORM')
+    p.add_argument('--password', default='bench')
+    p.add_argument('--salida', default='bench_%s.json' % datetime.now().strftime('%Y%m%d_%H%M%S'))
+    p.set_defaults(funcion=medir)
+
+    p = sub.add_parser('comparar', help='compara dos archivos de resultados')
+    p.add_argument('antes')
+    p.add_argument('despues')
+    p.set_defaults(funcion=comparar)
+
+    args = parser.parse_args()
+    if args.comando != 'comparar' and not args.base:
+        parser.error('indique la base de datos con -d')
+    args.funcion(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,5 @@
 from . import main
 from . import portal
 from . import dashboard
+from . import exportar
+from . import calendario
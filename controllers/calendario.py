@@ -0,0 +1,156 @@
+from odoo import http
+from odoo.http import request, content_disposition
+from datetime import timedelta, timezone
+import hashlib
+import logging
+
+from werkzeug.http import http_date
+
+from odoo.addons.reserva_canchas.models.reserva import ahora_sede
+
+_logger = logging.getLogger(__name__)
+
+# Ventana móvil de cada calendario, en días antes y después de hoy
+DIAS_ANTES_CALENDARIO = 7
+DIAS_DESPUES_CALENDARIO = 60
+
+# Tipo en la URL -> (tabla del dueño, columna de reserva_reserva que lo referencia,
+# tabla y columna de la otra parte, cuyo nombre también sale en los eventos)
+CALENDARIOS = {
+    'cancha': ('reserva_cancha', 'cancha_id', 'reserva_cliente', 'cliente_id'),
+    'cliente': ('reserva_cliente', 'cliente_id', 'reserva_cancha', 'cancha_id'),
+}
+
+ESTADOS_EVENTO = {
+    'borrador': 'TENTATIVE',
+    'confirmada': 'CONFIRMED',
+    'en_curso': 'CONFIRMED',
+    'completada': 'CONFIRMED',
+    'no_asistio': 'CONFIRMED',
+}
+
+
+def _texto_ical(valor):
+    return (valor or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _linea_ical(linea):
+    """Parte las líneas de más de 75 octetos (RFC 5545, 3.1)"""
+    datos = linea.encode('utf-8')
+    if len(datos) <= 75:
+        return linea
+    partes, actual = [], ''
+    for caracter in linea:
+        limite = 75 if not partes else 74
+        if len((actual + caracter).encode('utf-8')) > limite:
+            partes.append(actual)
+            actual = ''
+        actual += caracter
+    partes.append(actual)
+    return '\r\n '.join(partes)
+
+
+def _fecha_hora_ical(fecha, hora):
+    minutos = round(hora * 60)
+    return '%sT%02d%02d00' % (fecha.strftime('%Y%m%d'), minutos // 60, minutos % 60)
+
+
+class CalendarioController(http.Controller):
+
+    @http.route('/reservas/calendario/<string:tipo>/<string:token>.ics', auth='public', type='http',
+                methods=['GET'], sitemap=False)
+    def calendario(self, tipo, token, **kw):
+        """Calendario iCal de las reservas de una cancha o de un cliente.
+
+        Las aplicaciones de calendario lo consultan cada pocos minutos: una
+        primera consulta agregada da el ETag y Last-Modified y, si no hubo
+        cambios, se responde 304 sin leer ninguna reserva. Si los hubo, los
+        eventos salen de una sola consulta con los nombres unidos en SQL.
+        """
+        if tipo not in CALENDARIOS:
+            return request.not_found()
+        tabla, campo, tabla_otra, campo_otra = CALENDARIOS[tipo]
+        hoy = ahora_sede(request.env).date()
+        desde = hoy - timedelta(days=DIAS_ANTES_CALENDARIO)
+        hasta = hoy + timedelta(days=DIAS_DESPUES_CALENDARIO)
+        cr = request.env.cr
+
+        # Cualquier cambio de una reserva de la ventana, o del nombre de su
+        # cancha o cliente, mueve la última modificación; borrarla o
+        # cancelarla cambia las cuentas
+        cr.execute("""
+            SELECT o.id, o.name, GREATEST(o.write_date, MAX(r.write_date), MAX(x.write_date)),
+                   COUNT(r.id), COUNT(r.id) FILTER (WHERE r.estado != 'cancelada')
+              FROM %s AS o
+         LEFT JOIN reserva_reserva AS r
+                ON r.%s = o.id AND r.fecha BETWEEN %%s AND %%s
+         LEFT JOIN %s AS x
+                ON x.id = r.%s
+             WHERE o.token_calendario = %%s
+          GROUP BY o.id
+        """ % (tabla, campo, tabla_otra, campo_otra), [desde, hasta, token])
+        fila = cr.fetchone()
+        if not fila:
+            return request.not_found()
+        dueno_id, nombre, modificado, cuantas, vigentes = fila
+
+        etag = hashlib.sha1(('%s:%s:%s:%s:%s:%s' % (
+            tipo, dueno_id, desde, modificado, cuantas, vigentes)).encode()).hexdigest()[:20]
+        modificado = modificado.replace(microsecond=0, tzinfo=timezone.utc)
+        headers = [
+            ('ETag', '"%s"' % etag),
+            ('Last-Modified', http_date(modificado)),
+            ('Cache-Control', 'private, no-cache'),
+        ]
+        peticion = request.httprequest
+        if peticion.if_none_match:
+            sin_cambios = peticion.if_none_match.contains(etag)
+        else:
+            sin_cambios = bool(peticion.if_modified_since) and peticion.if_modified_since >= modificado
+        if sin_cambios:
+            return request.make_response('', headers=headers, status=304)
+
+        try:
+            cr.execute("""
+                SELECT r.name, r.fecha, r.hora_inicio, r.hora_fin, r.estado, r.write_date, c.name, cl.name
+                  FROM reserva_reserva AS r
+                  JOIN reserva_cancha AS c ON c.id = r.cancha_id
+                  JOIN reserva_cliente AS cl ON cl.id = r.cliente_id
+                 WHERE r.%s = %%s AND r.fecha BETWEEN %%s AND %%s AND r.estado != 'cancelada'
+              ORDER BY r.fecha, r.hora_inicio
+            """ % campo, [dueno_id, desde, hasta])
+            cuerpo = self._ical(tipo, nombre, cr.fetchall(), cr.dbname)
+        except Exception as e:
+            _logger.error(f'Error al generar el calendario: {str(e)}')
+            return request.make_response('Error al generar el calendario', status=500)
+
+        return request.make_response(cuerpo, headers=headers + [
+            ('Content-Type', 'text/calendar; charset=utf-8'),
+            ('Content-Disposition', content_disposition('reservas_%s.ics' % tipo, 'inline')),
+        ])
+
+    def _ical(self, tipo, nombre, reservas, dbname):
+        lineas = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//reserva_canchas//Reservas//ES',
+            'CALSCALE:GREGORIAN',
+            'METHOD:PUBLISH',
+            'X-WR-CALNAME:%s' % _texto_ical('Reservas - %s' % nombre),
+        ]
+        for numero, fecha, inicio, fin, estado, modificada, cancha, cliente in reservas:
+            # Horas locales de la cancha, sin zona horaria (hora flotante)
+            lineas += [
+                'BEGIN:VEVENT',
+                'UID:%s-%s@reserva_canchas' % (numero, dbname),
+                'DTSTAMP:%sZ' % modificada.strftime('%Y%m%dT%H%M%S'),
+                'DTSTART:%s' % _fecha_hora_ical(fecha, inicio),
+                'DTEND:%s' % _fecha_hora_ical(fecha, fin),
+                'SUMMARY:%s' % _texto_ical(cliente if tipo == 'cancha' else cancha),
+                'LOCATION:%s' % _texto_ical(cancha),
+                'DESCRIPTION:%s' % _texto_ical('Reserva %s' % numero),
+                'STATUS:%s' % ESTADOS_EVENTO.get(estado, 'CONFIRMED'),
+                'END:VEVENT',
+            ]
+        lineas.append('END:VCALENDAR')
+        return '\r\n'.join(_linea_ical(linea) for linea in lineas) + '\r\n'
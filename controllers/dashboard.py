@@ -20,78 +20,62 @@ class DashboardController(http.Controller):
                     'error': 'No tienes permisos para acceder al dashboard'
                 })
             
-            Reserva = request.env['reserva.reserva'].sudo()
+            Stats = request.env['reserva.stats.daily'].sudo()
             Cancha = request.env['reserva.cancha'].sudo()
             Cliente = request.env['reserva.cliente'].sudo()
             
             hoy = datetime.now().date()
             mes_actual = hoy.replace(day=1)
+            inicio_semana = hoy - timedelta(days=6)
             
-            # Estadísticas
-            reservas_hoy = Reserva.search_count([
-                ('fecha', '=', hoy),
-                ('estado', 'in', ['confirmada', 'en_curso'])
-            ])
-            
-            reservas_mes = Reserva.search_count([
-                ('fecha', '>=', mes_actual),
-                ('estado', 'in', ['confirmada', 'completada'])
-            ])
-            
-            reservas_completadas_mes = Reserva.search([
-                ('fecha', '>=', mes_actual),
-                ('estado', '=', 'completada')
-            ])
-            ingresos_mes = sum(r.monto_total for r in reservas_completadas_mes)
+            # Estadísticas del mes
+            totales_mes = {
+                estado: (count, monto)
+                for estado, count, monto in Stats._read_group(
+                    [('fecha', '>=', mes_actual)],
+                    ['estado'], ['reservas_count:sum', 'monto_total:sum'])
+            }
+            reservas_mes = sum(totales_mes.get(estado, (0, 0.0))[0] for estado in ['confirmada', 'completada'])
+            ingresos_mes = totales_mes.get('completada', (0, 0.0))[1]
             
             total_canchas = Cancha.search_count([('estado', '=', 'disponible')])
             
             # Top canchas
-            cancha_stats = []
-            canchas = Cancha.search([])
-            for cancha in canchas:
-                reservas = Reserva.search([
-                    ('cancha_id', '=', cancha.id),
-                    ('estado', 'in', ['confirmada', 'completada'])
-                ])
-                ingresos = sum(r.monto_total for r in reservas)
-                cancha_stats.append({
-                    'nombre': cancha.name,
-                    'reservas': len(reservas),
-                    'ingresos': ingresos
-                })
-            cancha_stats = sorted(cancha_stats, key=lambda x: x['reservas'], reverse=True)[:5]
+            cancha_stats = [
+                {'nombre': cancha.name, 'reservas': count, 'ingresos': monto}
+                for cancha, count, monto in Stats._read_group(
+                    [('estado', 'in', ['confirmada', 'completada'])],
+                    ['cancha_id'], ['reservas_count:sum', 'monto_total:sum'],
+                    order='reservas_count:sum DESC', limit=5)
+            ]
             
             # Top clientes
             clientes_top = Cliente.search([], order='total_gastado DESC', limit=5)
             
             # Horarios populares
-            horarios_stats = {}
-            reservas_todas = Reserva.search([
-                ('fecha', '>=', hoy - timedelta(days=7)),
-                ('estado', 'in', ['confirmada', 'completada'])
-            ])
-            for res in reservas_todas:
-                hora = int(res.hora_inicio)
-                horarios_stats[hora] = horarios_stats.get(hora, 0) + 1
+            horarios_populares = Stats._read_group(
+                [('fecha', '>=', hoy - timedelta(days=7)), ('estado', 'in', ['confirmada', 'completada'])],
+                ['hora'], ['reservas_count:sum'],
+                order='reservas_count:sum DESC', limit=5)
             
-            horarios_populares = sorted(
-                [(h, c) for h, c in horarios_stats.items()],
-                key=lambda x: x[1],
-                reverse=True
-            )[:5]
+            # Reservas de hoy y datos para gráfico
+            reservas_hoy = 0
+            conteo_por_dia = {}
+            for fecha, estado, count in Stats._read_group(
+                    [('fecha', '>=', inicio_semana), ('fecha', '<=', hoy),
+                     ('estado', 'in', ['confirmada', 'en_curso', 'completada'])],
+                    ['fecha:day', 'estado'], ['reservas_count:sum']):
+                if fecha == hoy and estado in ['confirmada', 'en_curso']:
+                    reservas_hoy += count
+                if estado in ['confirmada', 'completada']:
+                    conteo_por_dia[fecha] = conteo_por_dia.get(fecha, 0) + count
             
-            # Datos para gráfico
             reservas_por_dia = []
             for i in range(7):
-                fecha = hoy - timedelta(days=6-i)
-                count = Reserva.search_count([
-                    ('fecha', '=', fecha),
-                    ('estado', 'in', ['confirmada', 'completada'])
-                ])
+                fecha = inicio_semana + timedelta(days=i)
                 reservas_por_dia.append({
                     'fecha': fecha.strftime('%d/%m'),
-                    'count': count
+                    'count': conteo_por_dia.get(fecha, 0)
                 })
             
             return request.render('reserva_canchas.dashboard_template', {
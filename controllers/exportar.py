@@ -0,0 +1,166 @@
+from odoo import http, fields
+from odoo.http import request, content_disposition
+import csv
+import io
+import logging
+import os
+import tempfile
+
+import odoo
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# Filas que se traen del cursor del servidor en cada vuelta
+FILAS_POR_LOTE = 2000
+
+# Bytes por trozo al enviar el XLSX terminado
+TROZO_ARCHIVO = 64 * 1024
+
+ENCABEZADOS = [
+    'Número', 'Fecha', 'Hora Inicio', 'Hora Fin', 'Código Cancha', 'Cancha', 'DNI', 'Cliente',
+    'Estado', 'Método de Pago', 'Pagado', 'Monto',
+]
+
+# Columnas de reserva.reserva y del histórico que usa la exportación
+COLUMNAS = [
+    'name', 'fecha', 'hora_inicio', 'hora_fin', 'cancha_id', 'cliente_id',
+    'estado', 'metodo_pago', 'pagado', 'monto_total',
+]
+
+CONSULTA = """
+    SELECT r.name, r.fecha, r.hora_inicio, r.hora_fin, c.codigo, c.name, cl.dni, cl.name,
+           r.estado, r.metodo_pago, r.pagado, r.monto_total
+      FROM %s AS r
+      JOIN reserva_cancha AS c ON c.id = r.cancha_id
+      JOIN reserva_cliente AS cl ON cl.id = r.cliente_id
+     WHERE r.fecha BETWEEN %%s AND %%s
+  ORDER BY r.fecha, r.hora_inicio, r.name
+"""
+
+
+# Una hoja de cálculo toma como fórmula el texto que empieza así
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _hora(valor):
+    return '%02d:%02d' % (int(valor), round((valor % 1) * 60))
+
+
+def _texto_csv(valor):
+    """Los nombres vienen del portal: el apóstrofo evita que se evalúen como fórmula"""
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+class ExportarController(http.Controller):
+
+    @http.route('/reservas/exportar', auth='user', type='http', methods=['GET'])
+    def exportar(self, desde, hasta, formato='csv', **kw):
+        """Exporta las reservas de un rango de fechas (incluidas las archivadas)
+        en CSV o XLSX, leyendo por lotes de un cursor del servidor: la memoria
+        no crece con la cantidad de filas."""
+        if not request.env.user.has_group('reserva_canchas.group_reserva_admin'):
+            return request.not_found()
+        try:
+            desde = fields.Date.to_date(desde)
+            hasta = fields.Date.to_date(hasta)
+        except ValueError:
+            return request.make_response('Fechas inválidas', status=400)
+        if formato == 'xlsx' and not xlsxwriter:
+            return request.make_response('La exportación a XLSX necesita la librería xlsxwriter', status=501)
+
+        Reserva = request.env['reserva.reserva']
+        consulta = CONSULTA % request.env['reserva.reserva.historico']._origen_sql(COLUMNAS)
+        etiquetas = {
+            'estado': dict(Reserva._fields['estado']._description_selection(request.env)),
+            'metodo_pago': dict(Reserva._fields['metodo_pago']._description_selection(request.env)),
+        }
+        # Las filas se leen mientras se envía la respuesta, cuando el cursor de
+        # la petición ya está cerrado: el generador abre el suyo
+        filas = self._filas(request.env.cr.dbname, consulta, [desde, hasta], etiquetas)
+        nombre = 'reservas_%s_%s.%s' % (desde, hasta, 'xlsx' if formato == 'xlsx' else 'csv')
+        if formato == 'xlsx':
+            cuerpo = self._xlsx(filas)
+            tipo = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            cuerpo = self._csv(filas)
+            tipo = 'text/csv; charset=utf-8'
+        return http.Response(cuerpo, headers=[
+            ('Content-Type', tipo),
+            ('Content-Disposition', content_disposition(nombre)),
+        ], direct_passthrough=True)
+
+    def _filas(self, dbname, consulta, params, etiquetas):
+        """Lotes de filas ya formateadas, desde un cursor con nombre (del lado del servidor)"""
+        try:
+            with odoo.registry(dbname).cursor() as cr:
+                servidor = cr._cnx.cursor('exportar_reservas')
+                servidor.itersize = FILAS_POR_LOTE
+                servidor.execute(consulta, params)
+                while True:
+                    lote = servidor.fetchmany(FILAS_POR_LOTE)
+                    if not lote:
+                        break
+                    yield [
+                        (numero, fields.Date.to_string(fecha), _hora(inicio), _hora(fin), codigo, cancha,
+                         dni, cliente, etiquetas['estado'].get(estado, estado or ''),
+                         etiquetas['metodo_pago'].get(metodo, metodo or ''), 'Sí' if pagado else 'No',
+                         monto or 0.0)
+                        for numero, fecha, inicio, fin, codigo, cancha, dni, cliente, estado, metodo, pagado, monto
+                        in lote
+                    ]
+                servidor.close()
+        except Exception as e:
+            # La respuesta ya empezó a enviarse: solo queda registrarlo y cortarla
+            _logger.error(f'Error al exportar reservas: {str(e)}')
+            raise
+
+    def _csv(self, filas):
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        # BOM para que Excel reconozca el UTF-8
+        buffer.write('\ufeff')
+        escritor.writerow(ENCABEZADOS)
+        for lote in filas:
+            escritor.writerows([_texto_csv(valor) for valor in valores] for valores in lote)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def _xlsx(self, filas):
+        """El XLSX es un ZIP que solo se puede cerrar al final: las filas van a
+        disco a medida que llegan (constant_memory) y el archivo terminado se
+        envía por trozos."""
+        descriptor, ruta = tempfile.mkstemp(suffix='.xlsx')
+        os.close(descriptor)
+        try:
+            libro = xlsxwriter.Workbook(ruta, {'constant_memory': True})
+            hoja = libro.add_worksheet('Reservas')
+            hoja.write_row(0, 0, ENCABEZADOS)
+            fila = 1
+            for lote in filas:
+                for valores in lote:
+                    # write_row tomaría como fórmula el texto que empieza con '='
+                    for columna, valor in enumerate(valores):
+                        if isinstance(valor, str):
+                            hoja.write_string(fila, columna, valor)
+                        else:
+                            hoja.write_number(fila, columna, valor)
+                    fila += 1
+            libro.close()
+            with open(ruta, 'rb') as archivo:
+                while True:
+                    trozo = archivo.read(TROZO_ARCHIVO)
+                    if not trozo:
+                        break
+                    yield trozo
+        finally:
+            os.unlink(ruta)
@@ -1,26 +1,76 @@
 from odoo import http, fields
 from odoo.http import request
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+from psycopg2 import OperationalError
+import hashlib
 import json
 import logging
+import uuid
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from odoo.addons.reserva_canchas.models.disponibilidad_cache import cache_disponibilidad
+from odoo.addons.reserva_canchas.models.reserva_ocupacion import (
+    HORA_APERTURA, HORA_CIERRE, horas_ocupadas,
+)
+from odoo.addons.reserva_canchas.models.reserva_tarifa import precios_por_hora
 
 _logger = logging.getLogger(__name__)
 
+# Máximo de días que se pueden pedir en una consulta de rango
+MAX_DIAS_RANGO = 31
+
+# Canchas por página del catálogo público
+CANCHAS_POR_PAGINA = 12
+
+# Campos que muestra la tarjeta de una cancha en el catálogo
+CAMPOS_TARJETA = [
+    'name', 'tipo_deporte', 'capacidad', 'precio_hora',
+    'techada', 'iluminacion', 'vestuarios', 'imagen_512', 'write_date',
+]
+
+# Reservas por página en Mis Reservas
+RESERVAS_POR_PAGINA = 20
+
+# Campos que muestra Mis Reservas (las canchas se leen aparte, en bloque)
+CAMPOS_MIS_RESERVAS = [
+    'name', 'cancha_id', 'fecha', 'hora_inicio', 'hora_fin', 'duracion', 'monto_total', 'estado', 'notas',
+]
+
+# Características que se pueden exigir como filtro del catálogo
+CARACTERISTICAS = [
+    ('techada', 'Techada'),
+    ('iluminacion', 'Iluminación'),
+    ('vestuarios', 'Vestuarios'),
+    ('estacionamiento', 'Estacionamiento'),
+]
+
 class ReservaController(http.Controller):
 
     @http.route('/reservas', auth='public', website=True)
-    def reservas_list(self, **kw):
+    def reservas_list(self, despues=0, **kw):
         """Página principal de canchas"""
         try:
-            Cancha = request.env['reserva.cancha'].sudo()
-            canchas = Cancha.search([('estado', '=', 'disponible')])
+            Cancha = request.env['reserva.cancha']
+            filtros = self._filtros_catalogo(kw)
+            canchas, siguiente = self._buscar_canchas(filtros, despues)
             
             tipos_deporte = [('futbol', 'Fútbol'), ('futsal', 'Futsal'), ('basquet', 'Básquetbol'), 
                             ('voley', 'Vóleibol'), ('tenis', 'Tenis'), ('padel', 'Pádel')]
             
+            def url_filtros(**cambios):
+                # Cambiar un filtro vuelve a la primera página
+                params = dict(filtros, **cambios)
+                return '/reservas?' + urlencode({k: v for k, v in params.items() if v})
+            
             return request.render('reserva_canchas.website_canchas_template', {
                 'canchas': canchas,
+                'siguiente': siguiente,
+                'filtros': filtros,
+                'url_filtros': url_filtros,
                 'tipos_deporte': tipos_deporte,
+                'tipos_superficie': Cancha._fields['tipo_superficie'].selection,
+                'caracteristicas': CARACTERISTICAS,
             })
         except Exception as e:
             _logger.error(f'Error en reservas_list: {str(e)}')
@@ -28,11 +78,66 @@ class ReservaController(http.Controller):
                 'error': 'Error al cargar las canchas'
             })
 
+    @http.route('/reservas/canchas/mas', auth='public', type='json', website=True)
+    def reservas_list_mas(self, despues=0, **kw):
+        """API AJAX: siguiente página del catálogo, ya renderizada"""
+        try:
+            canchas, siguiente = self._buscar_canchas(self._filtros_catalogo(kw), despues)
+            html = request.env['ir.ui.view']._render_template('reserva_canchas.website_canchas_items', {
+                'canchas': canchas,
+                'website': request.website,
+            })
+            return {'html': html, 'siguiente': siguiente, 'error': None}
+        except Exception as e:
+            _logger.error(f'Error en reservas_list_mas: {str(e)}')
+            return {'error': str(e), 'html': '', 'siguiente': False}
+
+    def _filtros_catalogo(self, kw):
+        """Filtros del catálogo presentes en la petición, descartando valores desconocidos"""
+        Cancha = request.env['reserva.cancha']
+        filtros = {}
+        if kw.get('deporte') in dict(Cancha._fields['tipo_deporte'].selection):
+            filtros['deporte'] = kw['deporte']
+        if kw.get('superficie') in dict(Cancha._fields['tipo_superficie'].selection):
+            filtros['superficie'] = kw['superficie']
+        for campo, _etiqueta in CARACTERISTICAS:
+            if kw.get(campo):
+                filtros[campo] = 1
+        return filtros
+
+    def _buscar_canchas(self, filtros, despues=0):
+        """Una página del catálogo a partir del id `despues` y el cursor de la siguiente.
+
+        Se pagina por id en lugar de por offset para que cada página cueste lo
+        mismo, y solo se leen los campos de la tarjeta (la imagen, como tamaño).
+        """
+        Cancha = request.env['reserva.cancha'].sudo().with_context(bin_size=True)
+        try:
+            despues = int(despues or 0)
+        except ValueError:
+            despues = 0
+        
+        domain = [('estado', '=', 'disponible'), ('id', '>', despues)]
+        if filtros.get('deporte'):
+            domain.append(('tipo_deporte', '=', filtros['deporte']))
+        if filtros.get('superficie'):
+            domain.append(('tipo_superficie', '=', filtros['superficie']))
+        for campo, _etiqueta in CARACTERISTICAS:
+            if filtros.get(campo):
+                domain.append((campo, '=', True))
+        
+        canchas = Cancha.search_fetch(domain, CAMPOS_TARJETA, order='id', limit=CANCHAS_POR_PAGINA + 1)
+        if len(canchas) > CANCHAS_POR_PAGINA:
+            canchas = canchas[:CANCHAS_POR_PAGINA]
+            return canchas, canchas[-1].id
+        return canchas, False
+
     @http.route('/reservas/cancha/<int:cancha_id>', auth='public', website=True)
     def cancha_detalle(self, cancha_id, **kw):
         """Detalle de cancha y disponibilidad"""
         try:
-            Cancha = request.env['reserva.cancha'].sudo()
+            # bin_size: la plantilla solo comprueba si hay imagen, los bytes los sirve /web/image
+            Cancha = request.env['reserva.cancha'].sudo().with_context(bin_size=True)
             cancha = Cancha.browse(cancha_id)
             
             if not cancha.exists():
@@ -59,38 +164,22 @@ class ReservaController(http.Controller):
     def get_disponibilidad(self, cancha_id, fecha, **kw):
         """API AJAX para obtener horarios disponibles"""
         try:
-            Cancha = request.env['reserva.cancha'].sudo()
-            Reserva = request.env['reserva.reserva'].sudo()
-            
-            cancha = Cancha.browse(int(cancha_id))
-            if not cancha.exists() or cancha.estado != 'disponible':
-                return {'error': 'Cancha no disponible', 'horarios': []}
-            
             fecha_obj = datetime.strptime(fecha, '%Y-%m-%d').date()
             
             # Validar que no sea fecha pasada
             if fecha_obj < datetime.now().date():
                 return {'error': 'No puedes reservar en fechas pasadas', 'horarios': []}
             
-            # Obtener reservas existentes
-            reservas_dia = Reserva.search([
-                ('cancha_id', '=', cancha.id),
-                ('fecha', '=', fecha_obj),
-                ('estado', 'in', ['confirmada', 'en_curso'])
-            ])
+            datos = self._disponibilidad_en_cache(int(cancha_id), fecha_obj)
+            if datos['error']:
+                return {'error': datos['error'], 'horarios': []}
             
-            horas_reservadas = set()
-            for res in reservas_dia:
-                for hora in range(int(res.hora_inicio), int(res.hora_fin)):
-                    horas_reservadas.add(hora)
-            
-            # Generar horarios (6 AM a 10 PM)
             horarios = []
-            for hora in range(6, 23):
+            for i, precio in enumerate(datos['precios']):
                 horarios.append({
-                    'hora': hora,
-                    'disponible': hora not in horas_reservadas,
-                    'precio': cancha.precio_hora
+                    'hora': datos['apertura'] + i,
+                    'disponible': not datos['ocupadas'] & (1 << i),
+                    'precio': precio
                 })
             
             return {
@@ -101,6 +190,101 @@ class ReservaController(http.Controller):
             _logger.error(f'Error en get_disponibilidad: {str(e)}')
             return {'error': str(e), 'horarios': []}
 
+    @http.route('/reservas/disponibilidad/<int:cancha_id>/<string:fecha>', auth='public', type='http',
+                methods=['GET'])
+    def get_disponibilidad_dia(self, cancha_id, fecha, **kw):
+        """API AJAX compacta y con GET condicional: máscara de horas ocupadas
+        (bit i = hora de apertura + i) y una sola tabla de precios por hora.
+        Si el ETag coincide con If-None-Match responde 304 sin cuerpo."""
+        try:
+            fecha_obj = datetime.strptime(fecha, '%Y-%m-%d').date()
+        except ValueError:
+            return request.make_json_response({'error': 'Fecha inválida'}, status=400)
+        if fecha_obj < datetime.now().date():
+            return request.make_json_response({'error': 'No puedes reservar en fechas pasadas'})
+        
+        datos = self._disponibilidad_en_cache(cancha_id, fecha_obj)
+        # El ETag sale del contenido: cambia con cada reserva del día y con el precio o estado de la cancha
+        etag = hashlib.sha1(json.dumps(datos, sort_keys=True).encode()).hexdigest()[:20]
+        headers = [('ETag', '"%s"' % etag), ('Cache-Control', 'no-cache')]
+        if request.httprequest.if_none_match.contains(etag):
+            return request.make_response('', headers=headers, status=304)
+        return request.make_json_response(datos, headers=headers)
+
+    def _disponibilidad_en_cache(self, cancha_id, fecha):
+        return cache_disponibilidad.obtener(
+            request.env.cr.dbname, cancha_id, fields.Date.to_string(fecha),
+            lambda: self._disponibilidad(cancha_id, fecha))
+
+    def _disponibilidad(self, cancha_id, fecha):
+        """Disponibilidad compacta de un día de una cancha; el resultado se guarda
+        en la caché por proceso"""
+        Cancha = request.env['reserva.cancha'].sudo()
+        Ocupacion = request.env['reserva.ocupacion'].sudo()
+        
+        cancha = Cancha.browse(cancha_id)
+        if not cancha.exists() or cancha.estado != 'disponible':
+            return {'error': 'Cancha no disponible'}
+        
+        # Mapa de franjas ocupadas del día
+        mapa = Ocupacion._leer_mapas([(cancha.id, fecha)]).get((cancha.id, fecha), 0)
+        
+        return {
+            'error': None,
+            'apertura': HORA_APERTURA,
+            'cierre': HORA_CIERRE,
+            'ocupadas': horas_ocupadas(mapa),
+            'precios': precios_por_hora(cancha.tabla_precios, fecha.weekday()),
+        }
+
+    @http.route('/reservas/disponibilidad/cache', auth='user', type='json')
+    def get_disponibilidad_cache(self, **kw):
+        """Aciertos y fallos de la caché de disponibilidad de este proceso"""
+        if not request.env.user.has_group('reserva_canchas.group_reserva_admin'):
+            return {'error': 'Acceso denegado'}
+        return cache_disponibilidad.estadisticas()
+
+    @http.route('/reservas/disponibilidad/rango', auth='public', type='json', website=True)
+    def get_disponibilidad_rango(self, fecha_desde, dias=14, cancha_ids=None, tipo_deporte=None, **kw):
+        """API AJAX: grilla de disponibilidad de varias canchas y días en una sola llamada"""
+        try:
+            Cancha = request.env['reserva.cancha'].sudo()
+            Ocupacion = request.env['reserva.ocupacion'].sudo()
+            
+            domain = [('estado', '=', 'disponible')]
+            if cancha_ids:
+                domain.append(('id', 'in', [int(cancha_id) for cancha_id in cancha_ids]))
+            if tipo_deporte:
+                domain.append(('tipo_deporte', '=', tipo_deporte))
+            canchas = Cancha.search_read(domain, ['precio_hora', 'tabla_precios'])
+            
+            hoy = datetime.now().date()
+            desde = max(datetime.strptime(fecha_desde, '%Y-%m-%d').date(), hoy)
+            dias = min(max(int(dias), 1), MAX_DIAS_RANGO)
+            fechas = [desde + timedelta(days=i) for i in range(dias)]
+            
+            mapas = Ocupacion._leer_rango([c['id'] for c in canchas], fechas[0], fechas[-1])
+            
+            # Por cada cancha, una máscara de horas ocupadas por fecha (bit i = hora de apertura + i)
+            return {
+                'hora_apertura': HORA_APERTURA,
+                'hora_cierre': HORA_CIERRE,
+                'fechas': [fecha.strftime('%Y-%m-%d') for fecha in fechas],
+                'canchas': {
+                    c['id']: {
+                        'precio': c['precio_hora'],
+                        # Precio de cada hora por día de la semana (lunes = 0)
+                        'precios': [precios_por_hora(c['tabla_precios'], dia) for dia in range(7)],
+                        'ocupadas': [horas_ocupadas(mapas.get((c['id'], fecha), 0)) for fecha in fechas],
+                    }
+                    for c in canchas
+                },
+                'error': None
+            }
+        except Exception as e:
+            _logger.error(f'Error en get_disponibilidad_rango: {str(e)}')
+            return {'error': str(e), 'canchas': {}}
+
     @http.route('/reservas/crear', auth='user', website=True)
     def crear_reserva(self, cancha_id=None, fecha=None, hora_inicio=None, hora_fin=None, **kw):
         """Formulario de creación de reserva"""
@@ -110,16 +294,8 @@ class ReservaController(http.Controller):
             
             cancha = request.env['reserva.cancha'].sudo().browse(int(cancha_id)) if cancha_id else None
             
-            Cliente = request.env['reserva.cliente']
-            cliente = Cliente.search([('partner_id', '=', partner.id)], limit=1)
-            
-            if not cliente:
-                cliente = Cliente.create({
-                    'name': partner.name,
-                    'email': partner.email,
-                    'telefono': partner.phone or '',
-                    'partner_id': partner.id
-                })
+            # El cliente se crea al confirmar la primera reserva
+            cliente = request.env['reserva.cliente']._de_partner(partner.id)
             
             return request.render('reserva_canchas.website_crear_reserva_template', {
                 'cancha': cancha,
@@ -128,6 +304,7 @@ class ReservaController(http.Controller):
                 'fecha': fecha,
                 'hora_inicio': hora_inicio,
                 'hora_fin': hora_fin,
+                'token_envio': uuid.uuid4().hex,
             })
         except Exception as e:
             _logger.error(f'Error en crear_reserva: {str(e)}')
@@ -140,35 +317,26 @@ class ReservaController(http.Controller):
         """Procesar confirmación de reserva"""
         try:
             Reserva = request.env['reserva.reserva']
-            Cliente = request.env['reserva.cliente']
             
             user = request.env.user
             partner = user.partner_id
             
-            # Obtener o crear cliente
-            cliente = Cliente.search([('partner_id', '=', partner.id)], limit=1)
-            if not cliente:
-                cliente = Cliente.create({
-                    'name': partner.name,
-                    'email': partner.email,
-                    'telefono': post.get('telefono', partner.phone or ''),
-                    'partner_id': partner.id
-                })
-            
-            # Crear reserva
-            reserva = Reserva.create({
-                'cliente_id': cliente.id,
+            # Crear reserva (o recuperar la ya creada con el mismo token)
+            reserva = Reserva._reservar_desde_portal(partner, {
                 'cancha_id': int(post.get('cancha_id')),
                 'fecha': post.get('fecha'),
                 'hora_inicio': float(post.get('hora_inicio', 0)),
                 'hora_fin': float(post.get('hora_fin', 0)),
                 'notas': post.get('notas', ''),
+                'telefono': post.get('telefono'),
                 'estado': 'confirmada',
-                'partner_id': partner.id
-            })
+            }, token=post.get('token_envio'))
             
             return request.redirect(f'/reservas/confirmacion/{reserva.id}')
         except Exception as e:
+            if isinstance(e, OperationalError) and e.pgcode in PG_CONCURRENCY_ERRORS_TO_RETRY:
+                # Odoo reintenta la petición completa; el token evita duplicar la reserva
+                raise
             _logger.error(f'Error en confirmar_reserva: {str(e)}')
             return request.render('reserva_canchas.website_error_template', {
                 'error': f'Error al confirmar la reserva: {str(e)}'
@@ -195,37 +363,49 @@ class ReservaController(http.Controller):
             })
 
     @http.route('/mis-reservas', auth='user', website=True)
-    def mis_reservas(self, **kw):
+    def mis_reservas(self, activas_despues=None, pasadas_antes=None, archivo=None, tab=None, **kw):
         """Lista de reservas del usuario"""
         try:
             user = request.env.user
             partner = user.partner_id
             
             Reserva = request.env['reserva.reserva']
-            Cliente = request.env['reserva.cliente']
+            cliente = request.env['reserva.cliente']._de_partner(partner.id)
             
-            cliente = Cliente.search([('partner_id', '=', partner.id)], limit=1)
+            hoy = datetime.now().date()
+            domain_activas = [
+                ('partner_id', '=', partner.id),
+                ('fecha', '>=', hoy),
+                ('estado', 'in', ['confirmada', 'en_curso', 'borrador'])
+            ]
+            domain_pasadas = [
+                ('partner_id', '=', partner.id),
+                ('estado', 'in', ['completada', 'cancelada', 'no_asistio'])
+            ]
             
-            if not cliente:
-                reservas_activas = []
-                reservas_pasadas = []
+            reservas_activas, siguiente_activas = self._pagina_reservas(
+                Reserva, domain_activas, activas_despues, ascendente=True)
+            if archivo:
+                # Reservas ya movidas al histórico, que el portal no lee directamente
+                Historico = request.env['reserva.reserva.historico'].sudo()
+                reservas_pasadas, siguiente_pasadas = self._pagina_reservas(
+                    Historico, [('cliente_id', 'in', cliente.ids)], pasadas_antes, ascendente=False)
             else:
-                hoy = datetime.now().date()
-                reservas_activas = Reserva.search([
-                    ('cliente_id', '=', cliente.id),
-                    ('fecha', '>=', hoy),
-                    ('estado', 'in', ['confirmada', 'en_curso', 'borrador'])
-                ], order='fecha ASC')
-                
-                reservas_pasadas = Reserva.search([
-                    ('cliente_id', '=', cliente.id),
-                    ('estado', 'in', ['completada', 'cancelada', 'no_asistio'])
-                ], order='fecha DESC')
+                reservas_pasadas, siguiente_pasadas = self._pagina_reservas(
+                    Reserva, domain_pasadas, pasadas_antes, ascendente=False)
             
             return request.render('reserva_canchas.website_mis_reservas_template', {
                 'cliente': cliente,
+                'url_calendario': cliente.sudo().url_calendario if cliente else False,
                 'reservas_activas': reservas_activas,
                 'reservas_pasadas': reservas_pasadas,
+                'total_activas': Reserva.search_count(domain_activas),
+                'total_pasadas': Reserva.search_count(domain_pasadas),
+                'siguiente_activas': siguiente_activas,
+                'siguiente_pasadas': siguiente_pasadas,
+                'archivo': bool(archivo),
+                'estados': dict(Reserva._fields['estado'].selection),
+                'tab': 'pasadas' if tab == 'pasadas' else 'activas',
             })
         except Exception as e:
             _logger.error(f'Error en mis_reservas: {str(e)}')
@@ -233,6 +413,34 @@ class ReservaController(http.Controller):
                 'error': 'Error al cargar tus reservas'
             })
 
+    def _pagina_reservas(self, Modelo, domain, cursor, ascendente):
+        """Una página de reservas ordenadas por (fecha, id) a partir del cursor
+        'AAAA-MM-DD_id' y el cursor de la página siguiente.
+
+        Cada página cuesta lo mismo sin importar cuántas reservas tenga el
+        cliente: una búsqueda por índice y una lectura en bloque de las canchas.
+        """
+        orden = 'fecha asc, id asc' if ascendente else 'fecha desc, id desc'
+        if cursor:
+            try:
+                fecha, reserva_id = cursor.split('_')
+                fecha, reserva_id = fields.Date.to_date(fecha), int(reserva_id)
+            except ValueError:
+                fecha = None
+            if fecha:
+                operador = '>' if ascendente else '<'
+                domain = domain + ['|', ('fecha', operador, fecha),
+                                   '&', ('fecha', '=', fecha), ('id', operador, reserva_id)]
+        
+        reservas = Modelo.search_fetch(domain, CAMPOS_MIS_RESERVAS, order=orden, limit=RESERVAS_POR_PAGINA + 1)
+        siguiente = False
+        if len(reservas) > RESERVAS_POR_PAGINA:
+            reservas = reservas[:RESERVAS_POR_PAGINA]
+            ultima = reservas[-1]
+            siguiente = '%s_%s' % (fields.Date.to_string(ultima.fecha), ultima.id)
+        reservas.cancha_id.fetch(['name'])
+        return reservas, siguiente
+
     @http.route('/reservas/cancelar/<int:reserva_id>', auth='user', type='http', website=True, methods=['POST'])
     def cancelar_reserva(self, reserva_id, **post):
         """Cancelar una reserva"""
@@ -1,6 +1,8 @@
 from odoo import http
 from odoo.http import request
+from odoo.addons.portal.controllers.portal import CustomerPortal
 import logging
+from urllib.parse import urlencode
 
 _logger = logging.getLogger(__name__)
 
@@ -8,21 +10,8 @@ class PortalController(http.Controller):
 
     @http.route('/portal/reservas', auth='user', website=True)
     def portal_reservas(self, **kw):
-        """Panel de control del cliente en portal"""
-        try:
-            user = request.env.user
-            Reserva = request.env['reserva.reserva']
-            
-            mis_reservas = Reserva.search([
-                ('partner_id', '=', user.partner_id.id)
-            ], order='fecha DESC', limit=10)
-            
-            return request.render('reserva_canchas.portal_reservas_template', {
-                'reservas': mis_reservas,
-            })
-        except Exception as e:
-            _logger.error(f'Error en portal_reservas: {str(e)}')
-            return request.not_found()
+        """Historial del cliente en portal: misma paginación que Mis Reservas"""
+        return request.redirect('/mis-reservas?%s' % urlencode(dict(kw, tab='pasadas')))
 
 class ReservaPortal(CustomerPortal):
     
@@ -32,15 +21,9 @@ class ReservaPortal(CustomerPortal):
         
         if 'reserva_count' in counters:
             partner = request.env.user.partner_id
-            cliente = request.env['reserva.cliente'].search([
-                '|', ('email', '=', partner.email),
-                ('user_id', '=', request.env.user.id)
-            ], limit=1)
-            
-            if cliente:
-                reserva_count = request.env['reserva.reserva'].search_count([
-                    ('cliente_id', '=', cliente.id)
-                ])
-                values['reserva_count'] = reserva_count
+            cliente = request.env['reserva.cliente']._de_partner(partner.id)
+            values['reserva_count'] = request.env['reserva.reserva'].search_count([
+                ('cliente_id', '=', cliente.id)
+            ]) if cliente else 0
         
         return values
@@ -1,3 +1,13 @@
+from . import reserva_auditoria
+from . import reserva_calendario
 from . import cancha
 from . import reserva
+from . import reserva_historico
+from . import reserva_stats
+from . import reserva_ocupacion
 from . import cliente
+from . import reserva_recurrencia
+from . import ir_sequence
+from . import reserva_tarifa
+from . import reserva_report_ocupacion
+from . import reserva_espera
@@ -1,10 +1,25 @@
+from collections import defaultdict
+
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
+
+from .disponibilidad_cache import invalidar_disponibilidad
+from .reserva import ESTADOS_INGRESO, FotoReserva
+from .reserva_ocupacion import MASCARA_APERTURA
+from .reserva_tarifa import SQL_PRECIO_RESERVA, compilar_tabla, precio_reserva
+
+# Campos que cambian la respuesta de /reservas/disponibilidad
+CAMPOS_DISPONIBILIDAD = {'estado', 'precio_hora'}
+
+# Reservas que todavía toman el precio vigente de la cancha
+ESTADOS_REPRECIABLES = ('borrador', 'confirmada')
 
 class Cancha(models.Model):
     _name = 'reserva.cancha'
     _description = 'Cancha Deportiva'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'reserva.auditoria', 'reserva.calendario']
+    _tipo_calendario = 'cancha'
 
     name = fields.Char(string='Nombre de la Cancha', required=True, tracking=True)
     codigo = fields.Char(string='Código', required=True, copy=False, readonly=True, default='Nuevo')
@@ -29,6 +44,9 @@ class Cancha(models.Model):
     
     capacidad = fields.Integer(string='Capacidad (jugadores)', default=10)
     precio_hora = fields.Float(string='Precio por Hora', required=True, tracking=True)
+    tarifa_ids = fields.One2many('reserva.tarifa', 'cancha_id', string='Tarifas por Franja')
+    # Precio por hora de cada franja de 30 minutos de la semana, compilado de las tarifas
+    tabla_precios = fields.Json(string='Tabla de Precios', compute='_compute_tabla_precios', store=True)
     estado = fields.Selection([
         ('disponible', 'Disponible'),
         ('mantenimiento', 'En Mantenimiento'),
@@ -41,50 +59,149 @@ class Cancha(models.Model):
     estacionamiento = fields.Boolean(string='Estacionamiento', default=False)
     
     descripcion = fields.Text(string='Descripción')
-    imagen = fields.Binary(string='Imagen de la Cancha')
+    imagen = fields.Image(string='Imagen de la Cancha', max_width=1920, max_height=1920)
+    # Tamaños pregenerados, servidos por /web/image con ETag y cache-busting
+    imagen_1024 = fields.Image(string='Imagen 1024', related='imagen', max_width=1024, max_height=1024, store=True)
+    imagen_512 = fields.Image(string='Imagen 512', related='imagen', max_width=512, max_height=512, store=True)
+    imagen_128 = fields.Image(string='Imagen 128', related='imagen', max_width=128, max_height=128, store=True)
     
     # Relaciones
     reserva_ids = fields.One2many('reserva.reserva', 'cancha_id', string='Reservas')
-    reservas_count = fields.Integer(string='Total Reservas', compute='_compute_reservas_count')
+    # El catálogo es público: los contadores y los ingresos solo los ve el personal
+    reservas_count = fields.Integer(string='Total Reservas', compute='_compute_contadores', store=True, readonly=True,
+                                    groups='reserva_canchas.group_reserva_admin,reserva_canchas.group_reserva_staff')
     
     # Campos calculados
     disponibilidad_hoy = fields.Boolean(string='Disponible Hoy', compute='_compute_disponibilidad_hoy')
-    ingresos_total = fields.Float(string='Ingresos Totales', compute='_compute_ingresos_total')
+    ingresos_total = fields.Float(string='Ingresos Totales', compute='_compute_contadores', store=True, readonly=True,
+                                  groups='reserva_canchas.group_reserva_admin,reserva_canchas.group_reserva_staff')
     
     _sql_constraints = [
         ('codigo_unique', 'UNIQUE(codigo)', 'El código de la cancha debe ser único!')
     ]
     
-    @api.model
-    def create(self, vals):
-        if vals.get('codigo', 'Nuevo') == 'Nuevo':
-            vals['codigo'] = self.env['ir.sequence'].next_by_code('reserva.cancha') or 'Nuevo'
-        return super(Cancha, self).create(vals)
+    def init(self):
+        super(Cancha, self).init()
+        # Catálogo público: canchas disponibles por deporte, paginadas por id
+        create_index(self.env.cr, 'reserva_cancha_catalogo_index', self._table,
+                     ['tipo_deporte', 'id'], where="estado = 'disponible'")
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        sin_codigo = [vals for vals in vals_list if vals.get('codigo', 'Nuevo') == 'Nuevo']
+        codigos = self.env['ir.sequence']._next_by_code_lote('reserva.cancha', len(sin_codigo))
+        for vals, codigo in zip(sin_codigo, codigos):
+            vals['codigo'] = codigo or 'Nuevo'
+        return super(Cancha, self).create(vals_list)
+    
+    def write(self, vals):
+        res = super(Cancha, self).write(vals)
+        if 'precio_hora' in vals:
+            self._repreciar()
+        elif CAMPOS_DISPONIBILIDAD.intersection(vals):
+            invalidar_disponibilidad(self.env, canchas=self.ids)
+        return res
+    
+    @api.depends('precio_hora', 'tarifa_ids.dia_semana', 'tarifa_ids.hora_inicio',
+                 'tarifa_ids.hora_fin', 'tarifa_ids.precio')
+    def _compute_tabla_precios(self):
+        for record in self:
+            record.tabla_precios = compilar_tabla(record.precio_hora, record.tarifa_ids)
+    
+    def _precio_reserva(self, fecha, hora_inicio, hora_fin):
+        self.ensure_one()
+        return precio_reserva(self.tabla_precios, fecha, hora_inicio, hora_fin)
+    
+    def _repreciar(self):
+        """Aplica la tabla de precios vigente a las reservas pendientes de hoy en
+        adelante, en un solo UPDATE, y propaga las diferencias a los agregados.
+
+        Las reservas pasadas, en curso o cerradas conservan su monto.
+        """
+        canchas = self.exists()
+        if not canchas:
+            return
+        canchas.flush_recordset(['tabla_precios'])
+        Reserva = self.env['reserva.reserva']
+        Reserva.flush_model()
+        self.env.cr.execute("""
+            UPDATE reserva_reserva AS r
+               SET monto_total = n.monto
+              FROM (SELECT r.id, r.monto_total AS anterior, %s AS monto
+                      FROM reserva_reserva AS r
+                      JOIN reserva_cancha AS c ON c.id = r.cancha_id
+                     WHERE r.cancha_id IN %%s
+                       AND r.fecha >= %%s
+                       AND r.estado IN %%s
+                       FOR UPDATE OF r) AS n
+             WHERE r.id = n.id
+               AND n.monto IS DISTINCT FROM n.anterior
+         RETURNING r.id, r.cancha_id, r.cliente_id, r.fecha, r.hora_inicio, r.hora_fin, r.estado,
+                   n.anterior, r.monto_total
+        """ % SQL_PRECIO_RESERVA, [tuple(canchas.ids), fields.Date.context_today(self), ESTADOS_REPRECIABLES])
+        filas = self.env.cr.fetchall()
+        Reserva.invalidate_model(['monto_total'])
+        Reserva._sincronizar_agregados(
+            [FotoReserva(*fila[:7], monto_total=fila[7]) for fila in filas],
+            [FotoReserva(*fila[:7], monto_total=fila[8]) for fila in filas])
+        invalidar_disponibilidad(self.env, canchas=canchas.ids)
     
-    @api.depends('reserva_ids')
-    def _compute_reservas_count(self):
+    def unlink(self):
+        canchas = self.ids
+        res = super(Cancha, self).unlink()
+        invalidar_disponibilidad(self.env, canchas=canchas)
+        return res
+    
+    # Sin dependencias a propósito: el cálculo completo solo corre al crear la
+    # cancha o la columna; luego reserva.reserva mantiene los contadores por deltas
+    def _compute_contadores(self):
+        contadores = defaultdict(lambda: [0, 0.0])
+        grupos = []
+        # Las reservas archivadas siguen contando
+        for modelo in ('reserva.reserva', 'reserva.reserva.historico'):
+            grupos += self.env[modelo].sudo()._read_group(
+                [('cancha_id', 'in', self.filtered('id').ids)],
+                ['cancha_id', 'estado'], ['__count', 'monto_total:sum'])
+        for cancha, estado, count, monto in grupos:
+            contadores[cancha.id][0] += count
+            if estado in ESTADOS_INGRESO:
+                contadores[cancha.id][1] += monto
         for record in self:
-            record.reservas_count = len(record.reserva_ids)
+            record.reservas_count, record.ingresos_total = contadores[record.id]
+    
+    @api.model
+    def _actualizar_contadores(self, antes, despues):
+        deltas = defaultdict(lambda: [0, 0.0])
+        for signo, fotos in ((-1, antes), (1, despues)):
+            for foto in fotos:
+                delta = deltas[foto.cancha_id]
+                delta[0] += signo
+                if foto.estado in ESTADOS_INGRESO:
+                    delta[1] += signo * foto.monto_total
+        
+        filas = [(cancha_id,) + tuple(delta) for cancha_id, delta in deltas.items() if any(delta)]
+        if not filas:
+            return
+        self.env.cr.execute("""
+            UPDATE reserva_cancha AS c
+               SET reservas_count = COALESCE(c.reservas_count, 0) + v.reservas,
+                   ingresos_total = COALESCE(c.ingresos_total, 0) + v.ingresos
+              FROM (VALUES %s) AS v(id, reservas, ingresos)
+             WHERE c.id = v.id
+        """ % ', '.join(['%s'] * len(filas)), filas)
+        self.browse([fila[0] for fila in filas]).invalidate_recordset(['reservas_count', 'ingresos_total'])
     
     @api.depends('reserva_ids', 'estado')
     def _compute_disponibilidad_hoy(self):
+        hoy = fields.Date.today()
+        mapas = self.env['reserva.ocupacion']._leer_mapas([(record.id, hoy) for record in self if record.id])
         for record in self:
             if record.estado != 'disponible':
                 record.disponibilidad_hoy = False
             else:
-                hoy = fields.Date.today()
-                reservas_hoy = self.env['reserva.reserva'].search([
-                    ('cancha_id', '=', record.id),
-                    ('fecha', '=', hoy),
-                    ('estado', 'in', ['confirmada', 'en_curso'])
-                ])
-                record.disponibilidad_hoy = len(reservas_hoy) < 12  # Asumiendo 12 horas disponibles
-    
-    @api.depends('reserva_ids', 'reserva_ids.monto_total', 'reserva_ids.estado')
-    def _compute_ingresos_total(self):
-        for record in self:
-            reservas_pagadas = record.reserva_ids.filtered(lambda r: r.estado in ['confirmada', 'completada'])
-            record.ingresos_total = sum(reservas_pagadas.mapped('monto_total'))
+                # Disponible mientras quede alguna franja libre en el horario de atención
+                ocupadas = mapas.get((record.id, hoy), 0) & MASCARA_APERTURA
+                record.disponibilidad_hoy = ocupadas != MASCARA_APERTURA
     
     @api.constrains('precio_hora')
     def _check_precio_hora(self):
@@ -1,9 +1,24 @@
-from odoo import models, fields, api
+from collections import defaultdict
+import logging
+
+from psycopg2.errors import UniqueViolation
+
+from odoo import models, fields, api, tools
+from odoo.tools.sql import table_exists
+
+from .reserva import ESTADOS_INGRESO, ConflictoConcurrente
+
+_logger = logging.getLogger(__name__)
+
+# Tablas cuyas filas pasan al cliente que se conserva al fusionar duplicados
+TABLAS_DE_CLIENTE = ('reserva_reserva', 'reserva_reserva_historico', 'reserva_espera', 'reserva_recurrencia')
+
 
 class Cliente(models.Model):
     _name = 'reserva.cliente'
     _description = 'Cliente'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'reserva.auditoria', 'reserva.calendario']
+    _tipo_calendario = 'cliente'
 
     name = fields.Char(string='Nombre Completo', required=True, tracking=True)
     partner_id = fields.Many2one('res.partner', string='Contacto', ondelete='cascade')
@@ -20,23 +35,175 @@ class Cliente(models.Model):
     ], string='Tipo de Cliente', default='nuevo', compute='_compute_tipo_cliente', store=True)
     
     reserva_ids = fields.One2many('reserva.reserva', 'cliente_id', string='Reservas')
-    total_reservas = fields.Integer(string='Total Reservas', compute='_compute_total_reservas')
-    total_gastado = fields.Float(string='Total Gastado', compute='_compute_total_gastado')
+    total_reservas = fields.Integer(string='Total Reservas', compute='_compute_contadores', store=True, readonly=True)
+    total_gastado = fields.Float(string='Total Gastado', compute='_compute_contadores', store=True, readonly=True,
+                                 index=True)
     
     _sql_constraints = [
-        ('dni_unique', 'UNIQUE(dni)', '¡El DNI ya está registrado!')
+        ('dni_unique', 'UNIQUE(dni)', '¡El DNI ya está registrado!'),
+        ('partner_unique', 'UNIQUE(partner_id)', '¡El contacto ya tiene un cliente!'),
     ]
     
-    @api.depends('reserva_ids')
-    def _compute_total_reservas(self):
-        for record in self:
-            record.total_reservas = len(record.reserva_ids.filtered(lambda r: r.estado == 'completada'))
+    def _auto_init(self):
+        # partner_unique no se crea si ya hay clientes que comparten contacto
+        # (Odoo solo lo avisa en el log): antes se fusionan en el más antiguo
+        conservados = self._fusionar_duplicados() if table_exists(self.env.cr, self._table) else []
+        res = super(Cliente, self)._auto_init()
+        if conservados:
+            clientes = self.browse(conservados)
+            self.env.add_to_compute(self._fields['total_reservas'], clientes)
+            self.env.add_to_compute(self._fields['tipo_cliente'], clientes)
+        return res
+    
+    def _fusionar_duplicados(self):
+        """Pasa a cada cliente más antiguo de un contacto las reservas, esperas,
+        series y mensajes de los demás clientes de ese contacto, y los borra.
+        Devuelve los ids conservados."""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT partner_id, array_agg(id ORDER BY id)
+              FROM reserva_cliente
+             WHERE partner_id IS NOT NULL
+          GROUP BY partner_id
+            HAVING COUNT(*) > 1
+        """)
+        duplicados = cr.fetchall()
+        if not duplicados:
+            return []
+        destino = {sobrante: ids[0] for _partner_id, ids in duplicados for sobrante in ids[1:]}
+        sobrantes, conservados = list(destino), list(destino.values())
+        valores = [sobrantes, conservados]
+        for tabla in TABLAS_DE_CLIENTE:
+            if table_exists(cr, tabla):
+                cr.execute("""
+                    UPDATE %s AS t SET cliente_id = v.destino
+                      FROM unnest(%%s::int[], %%s::int[]) AS v(origen, destino)
+                     WHERE t.cliente_id = v.origen
+                """ % tabla, valores)
+        cr.execute("""
+            UPDATE mail_message AS m SET res_id = v.destino
+              FROM unnest(%s::int[], %s::int[]) AS v(origen, destino)
+             WHERE m.model = 'reserva.cliente' AND m.res_id = v.origen
+        """, valores)
+        cr.execute("""
+            UPDATE mail_activity AS a SET res_id = v.destino
+              FROM unnest(%s::int[], %s::int[]) AS v(origen, destino)
+             WHERE a.res_model = 'reserva.cliente' AND a.res_id = v.origen
+        """, valores)
+        cr.execute("DELETE FROM mail_followers WHERE res_model = 'reserva.cliente' AND res_id = ANY(%s)", [sobrantes])
+        cr.execute("DELETE FROM reserva_cliente WHERE id = ANY(%s)", [sobrantes])
+        for partner_id, ids in duplicados:
+            _logger.warning('Clientes %s del contacto %s fusionados en el cliente %s', ids[1:], partner_id, ids[0])
+        return list(set(conservados))
     
-    @api.depends('reserva_ids.monto_total', 'reserva_ids.estado')
-    def _compute_total_gastado(self):
+    def write(self, vals):
+        # Solo si algún cliente cambia de verdad de contacto: vaciar la caché
+        # afecta a todas las cachés del registro
+        cambia_contacto = 'partner_id' in vals and any(
+            record.partner_id.id != vals['partner_id'] for record in self)
+        res = super(Cliente, self).write(vals)
+        if cambia_contacto:
+            self.env.registry.clear_cache()
+        return res
+    
+    def unlink(self):
+        con_contacto = any(self.mapped('partner_id'))
+        res = super(Cliente, self).unlink()
+        if con_contacto:
+            self.env.registry.clear_cache()
+        return res
+    
+    @api.model
+    def _de_partner(self, partner_id):
+        """Cliente asociado al contacto, o un conjunto vacío"""
+        try:
+            return self.browse(self._id_de_partner(partner_id))
+        except KeyError:
+            return self.browse()
+    
+    # Solo se guardan los contactos que tienen cliente: el KeyError no queda en
+    # la caché, así que crear un cliente no obliga a vaciarla
+    @tools.ormcache('partner_id')
+    def _id_de_partner(self, partner_id):
+        self.env.cr.execute("SELECT id FROM reserva_cliente WHERE partner_id = %s", [partner_id])
+        fila = self.env.cr.fetchone()
+        if not fila:
+            raise KeyError(partner_id)
+        return fila[0]
+    
+    @api.model
+    def _obtener_o_crear(self, partner, telefono=None):
+        """Cliente del contacto, creándolo en su primera reserva.
+
+        Si dos primeras reservas del mismo contacto llegan a la vez, la
+        restricción única sobre partner_id deja pasar solo una creación. La
+        otra lanza un ConflictoConcurrente y Odoo repite la petición, que ya
+        ve el cliente confirmado.
+        """
+        cliente = self._de_partner(partner.id)
+        if cliente:
+            return cliente
+        try:
+            with self.env.cr.savepoint():
+                # El portal no crea clientes directamente; el DNI real lo completa el personal
+                return self.sudo().create({
+                    'name': partner.name,
+                    # Un NIF del contacto podría coincidir con el DNI de otro cliente
+                    'dni': 'PORTAL-%s' % partner.id,
+                    'email': partner.email,
+                    'telefono': telefono or partner.phone or '',
+                    'partner_id': partner.id,
+                }).with_env(self.env)
+        except UniqueViolation as e:
+            if e.diag.constraint_name != 'reserva_cliente_partner_unique':
+                raise
+            # El cliente lo creó otra transacción que ya confirmó, pero no es
+            # visible en la instantánea de esta ni se puede usar en ella
+            raise ConflictoConcurrente('Cliente del contacto %s creado por otra transacción' % partner.id)
+    
+    # Sin dependencias a propósito: el cálculo completo solo corre al crear el
+    # cliente o la columna; luego reserva.reserva mantiene los contadores por deltas
+    def _compute_contadores(self):
+        contadores = defaultdict(lambda: [0, 0.0])
+        grupos = []
+        # Las reservas archivadas siguen contando
+        for modelo in ('reserva.reserva', 'reserva.reserva.historico'):
+            grupos += self.env[modelo].sudo()._read_group(
+                [('cliente_id', 'in', self.filtered('id').ids)],
+                ['cliente_id', 'estado'], ['__count', 'monto_total:sum'])
+        for cliente, estado, count, monto in grupos:
+            if estado == 'completada':
+                contadores[cliente.id][0] += count
+            if estado in ESTADOS_INGRESO:
+                contadores[cliente.id][1] += monto
         for record in self:
-            reservas_pagadas = record.reserva_ids.filtered(lambda r: r.estado in ['completada', 'confirmada'])
-            record.total_gastado = sum(reservas_pagadas.mapped('monto_total'))
+            record.total_reservas, record.total_gastado = contadores[record.id]
+    
+    @api.model
+    def _actualizar_contadores(self, antes, despues):
+        deltas = defaultdict(lambda: [0, 0.0])
+        for signo, fotos in ((-1, antes), (1, despues)):
+            for foto in fotos:
+                delta = deltas[foto.cliente_id]
+                if foto.estado == 'completada':
+                    delta[0] += signo
+                if foto.estado in ESTADOS_INGRESO:
+                    delta[1] += signo * foto.monto_total
+        
+        filas = [(cliente_id,) + tuple(delta) for cliente_id, delta in deltas.items() if any(delta)]
+        if not filas:
+            return
+        self.env.cr.execute("""
+            UPDATE reserva_cliente AS c
+               SET total_reservas = COALESCE(c.total_reservas, 0) + v.reservas,
+                   total_gastado = COALESCE(c.total_gastado, 0) + v.gastado
+              FROM (VALUES %s) AS v(id, reservas, gastado)
+             WHERE c.id = v.id
+        """ % ', '.join(['%s'] * len(filas)), filas)
+        clientes = self.browse([fila[0] for fila in filas])
+        clientes.invalidate_recordset(['total_reservas', 'total_gastado'])
+        # tipo_cliente depende de total_reservas
+        clientes.modified(['total_reservas'])
     
     @api.depends('total_reservas')
     def _compute_tipo_cliente(self):
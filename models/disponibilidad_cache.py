@@ -0,0 +1,178 @@
+"""Caché en memoria de la disponibilidad diaria de cada cancha.
+
+Cada proceso de Odoo guarda sus propias entradas (cancha, fecha) con un
+límite de tamaño (LRU) y de antigüedad (TTL). Las invalidaciones viajan entre
+procesos por LISTEN/NOTIFY de PostgreSQL, igual que el bus de Odoo: la base
+'postgres' hace de canal común y el mensaje lleva el nombre de la base.
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import odoo
+from odoo import fields
+
+_logger = logging.getLogger(__name__)
+
+CANAL = 'reserva_canchas_disponibilidad'
+
+# Entradas máximas por proceso y segundos que vive cada una
+TAMANO_CACHE = 5000
+TTL_CACHE = 60
+
+# Segundos de espera del escucha entre comprobaciones de la conexión
+ESPERA_ESCUCHA = 50
+
+# Segundos que la primera consulta de un proceso espera a que arranque el escucha
+ESPERA_ARRANQUE = 2
+
+# Más claves que esto en un aviso se resumen por cancha (NOTIFY admite 8000 bytes)
+MAX_CLAVES_AVISO = 200
+MAX_CANCHAS_AVISO = 500
+
+
+class CacheDisponibilidad:
+    """LRU con TTL, segura entre hilos, con contadores de aciertos y fallos"""
+
+    def __init__(self, tamano=TAMANO_CACHE, ttl=TTL_CACHE):
+        self.tamano = tamano
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._arrancado = threading.Event()
+        self.escuchando = False
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    def obtener(self, dbname, cancha_id, fecha, calcular):
+        """Valor de (cancha, fecha), calculándolo con `calcular()` si falta"""
+        self._asegurar_escucha()
+        if not self.escuchando:
+            # Sin escucha se perderían invalidaciones de otros procesos
+            return calcular()
+        clave = (dbname, cancha_id, fecha)
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] > ahora:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            invalidaciones = self.invalidaciones
+        valor = calcular()
+        with self._lock:
+            # Si algo se invalidó mientras se calculaba, el valor puede venir de
+            # una instantánea anterior al cambio: no se guarda
+            if invalidaciones != self.invalidaciones:
+                return valor
+            self._entradas[clave] = (ahora + self.ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano:
+                self._entradas.popitem(last=False)
+        return valor
+
+    def invalidar(self, dbname, claves=(), canchas=(), todo=False):
+        """Quita las entradas de esas (cancha, fecha), de esas canchas o de toda la base"""
+        canchas = set(canchas)
+        with self._lock:
+            if todo or canchas:
+                quitar = [clave for clave in self._entradas
+                          if clave[0] == dbname and (todo or clave[1] in canchas)]
+            else:
+                quitar = [(dbname, cancha_id, fecha) for cancha_id, fecha in claves]
+            for clave in quitar:
+                self._entradas.pop(clave, None)
+            self.invalidaciones += 1
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'pid': os.getpid(),
+                'escuchando': self.escuchando,
+                'entradas': len(self._entradas),
+                'tamano': self.tamano,
+                'ttl': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'invalidaciones': self.invalidaciones,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            }
+
+    def _asegurar_escucha(self):
+        # Cada worker prefork hereda el objeto del padre, pero no su hilo
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._entradas.clear()
+            self._arrancado = threading.Event()
+            self.escuchando = False
+            hilo = threading.Thread(target=self._escuchar, name='%s.escucha' % __name__, daemon=True)
+            hilo.start()
+        self._arrancado.wait(ESPERA_ARRANQUE)
+
+    def _escuchar(self):
+        while True:
+            try:
+                with odoo.sql_db.db_connect('postgres').cursor() as cr:
+                    conexion = cr._cnx
+                    cr.execute("LISTEN %s" % CANAL)
+                    cr.commit()
+                    self.escuchando = True
+                    self._arrancado.set()
+                    while True:
+                        if select.select([conexion], [], [], ESPERA_ESCUCHA) == ([], [], []):
+                            continue
+                        conexion.poll()
+                        while conexion.notifies:
+                            aviso = json.loads(conexion.notifies.pop().payload)
+                            self.invalidar(aviso['db'], claves=[tuple(clave) for clave in aviso.get('claves', [])],
+                                           canchas=aviso.get('canchas', []), todo=aviso.get('todo', False))
+            except Exception:
+                _logger.exception('Error escuchando invalidaciones de disponibilidad')
+                self._arrancado.set()
+            # Lo que llegó mientras no se escuchaba se ha perdido
+            self.escuchando = False
+            self.vaciar()
+            time.sleep(ESPERA_ESCUCHA)
+
+
+cache_disponibilidad = CacheDisponibilidad()
+
+
+def invalidar_disponibilidad(env, claves=(), canchas=(), todo=False):
+    """Invalida la disponibilidad de esas (cancha, fecha), de canchas completas o de todo.
+
+    El proceso actual la invalida ya; los demás (y este de nuevo, por si se
+    volvió a llenar con datos sin confirmar) al confirmarse la transacción.
+    """
+    dbname = env.cr.dbname
+    claves = [(cancha_id, fields.Date.to_string(fecha)) for cancha_id, fecha in claves]
+    canchas = list(canchas)
+    if len(claves) > MAX_CLAVES_AVISO:
+        canchas += list({cancha_id for cancha_id, _fecha in claves})
+        claves = []
+    aviso = {'db': dbname, 'claves': claves, 'canchas': canchas}
+    if todo or len(canchas) > MAX_CANCHAS_AVISO:
+        aviso = {'db': dbname, 'todo': True}
+    cache_disponibilidad.invalidar(dbname, claves=claves, canchas=canchas, todo=aviso.get('todo', False))
+
+    def notificar():
+        with odoo.sql_db.db_connect('postgres').cursor() as cr:
+            cr.execute("SELECT pg_notify(%s, %s)", [CANAL, json.dumps(aviso)])
+
+    env.cr.postcommit.add(notificar)
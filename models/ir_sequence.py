@@ -0,0 +1,43 @@
+from odoo import models, api
+
+
+class IrSequence(models.Model):
+    _inherit = 'ir.sequence'
+
+    @api.model
+    def _next_by_code_lote(self, sequence_code, cantidad):
+        """Como next_by_code, pero reserva `cantidad` números en una sola consulta"""
+        if cantidad <= 0:
+            return []
+        self.check_access_rights('read')
+        secuencia = self.search([
+            ('code', '=', sequence_code),
+            ('company_id', 'in', [self.env.company.id, False]),
+        ], order='company_id', limit=1)
+        if not secuencia:
+            return [False] * cantidad
+        return secuencia._siguientes(cantidad)
+
+    def _siguientes(self, cantidad):
+        self.ensure_one()
+        if self.use_date_range:
+            # Cada tramo de fechas lleva su propio contador: se piden de a uno
+            return [self._next() for _i in range(cantidad)]
+        if self.implementation == 'standard':
+            self.env.cr.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                ['ir_sequence_%03d' % self.id, cantidad])
+            numeros = sorted(fila[0] for fila in self.env.cr.fetchall())
+        else:
+            # Sin huecos: un solo UPDATE bloquea la fila y avanza el bloque completo
+            self.flush_recordset(['number_next'])
+            self.env.cr.execute("""
+                UPDATE ir_sequence
+                   SET number_next = number_next + number_increment * %s
+                 WHERE id = %s
+             RETURNING number_next - number_increment * %s, number_increment
+            """, [cantidad, self.id, cantidad])
+            primero, incremento = self.env.cr.fetchone()
+            self.invalidate_recordset(['number_next'])
+            numeros = [primero + incremento * i for i in range(cantidad)]
+        return [self.get_next_char(numero) for numero in numeros]
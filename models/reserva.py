@@ -1,15 +1,58 @@
 from odoo import models, fields, api
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
+from psycopg2 import OperationalError, errorcodes
+from psycopg2.errors import ExclusionViolation, UniqueViolation
+import pytz
+import threading
+
+# Estados en los que una reserva ocupa la cancha
+ESTADOS_ACTIVOS = ('confirmada', 'en_curso')
+
+# Estados cuyo monto cuenta como ingreso de la cancha y gasto del cliente
+ESTADOS_INGRESO = ('confirmada', 'completada')
+
+MENSAJE_SOLAPAMIENTO = '¡La cancha ya tiene una reserva en ese horario!'
+
+# Campos de una reserva que alimentan las tablas agregadas
+CAMPOS_AGREGADOS = {'cancha_id', 'cliente_id', 'fecha', 'hora_inicio', 'hora_fin', 'estado'}
+
+# Reservas que reclama cada vuelta del cron de estados
+LOTE_ESTADOS = 500
+
+def ahora_sede(env):
+    """Fecha y hora actuales (sin zona) en la hora local de las canchas: la
+    del parámetro reserva_canchas.zona_horaria o, si no está, la de la compañía.
+    hora_inicio y hora_fin se guardan en esa hora local."""
+    nombre = (env['ir.config_parameter'].sudo().get_param('reserva_canchas.zona_horaria')
+              or env.company.partner_id.tz or 'UTC')
+    try:
+        zona = pytz.timezone(nombre)
+    except pytz.UnknownTimeZoneError:
+        zona = pytz.utc
+    return datetime.now(zona).replace(tzinfo=None)
+
+class ConflictoConcurrente(OperationalError):
+    """Conflicto de serialización (40001) lanzado desde Python: la fila que
+    falta la confirmó otra transacción que esta instantánea no ve. Odoo
+    repite la petición completa, ya con una instantánea nueva."""
+    pgcode = errorcodes.SERIALIZATION_FAILURE
+
+FotoReserva = namedtuple('FotoReserva', [
+    'id', 'cancha_id', 'cliente_id', 'fecha', 'hora_inicio', 'hora_fin', 'estado', 'monto_total',
+])
 
 class Reserva(models.Model):
     _name = 'reserva.reserva'
     _description = 'Reserva de Cancha'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'reserva.auditoria']
 
     name = fields.Char(string='Número de Reserva', readonly=True, copy=False, default='Nuevo')
     cliente_id = fields.Many2one('reserva.cliente', string='Cliente', required=True, tracking=True)
-    partner_id = fields.Many2one('res.partner', string='Contacto', related='cliente_id.partner_id')
+    partner_id = fields.Many2one('res.partner', string='Contacto', related='cliente_id.partner_id', store=True)
     cancha_id = fields.Many2one('reserva.cancha', string='Cancha', required=True, tracking=True)
     
     fecha = fields.Date(string='Fecha', required=True, tracking=True)
@@ -37,27 +80,155 @@ class Reserva(models.Model):
     pagado = fields.Boolean(string='Pagado', default=False, tracking=True)
     
     notas = fields.Text(string='Notas Adicionales')
+    token_envio = fields.Char(string='Token de Envío', copy=False, readonly=True)
+    recurrencia_id = fields.Many2one('reserva.recurrencia', string='Serie', ondelete='set null', index=True,
+                                     copy=False)
     
+    # Dos reservas activas de la misma cancha y día no pueden solaparse.
+    # GREATEST evita que un rango invertido falle en el INSERT antes de que
+    # _check_horarios pueda dar su mensaje.
     _sql_constraints = [
-        ('fecha_hora_cancha_unique', 'UNIQUE(cancha_id, fecha, hora_inicio)', 
-         '¡La cancha ya tiene una reserva en ese horario!')
+        ('sin_solapamiento',
+         "EXCLUDE USING gist (cancha_id WITH =, fecha WITH =, "
+         "numrange(hora_inicio::numeric, GREATEST(hora_inicio, hora_fin)::numeric) WITH &&) "
+         "WHERE (estado IN ('confirmada', 'en_curso'))",
+         MENSAJE_SOLAPAMIENTO),
+        ('token_envio_unique', 'UNIQUE(token_envio)', '¡Este envío ya fue procesado!'),
     ]
     
+    def _auto_init(self):
+        # btree_gist permite combinar igualdad y solapamiento de rangos en la restricción EXCLUDE
+        self.env.cr.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        # Reemplazada por sin_solapamiento
+        self.env.cr.execute("""
+            ALTER TABLE IF EXISTS reserva_reserva
+            DROP CONSTRAINT IF EXISTS reserva_reserva_fecha_hora_cancha_unique
+        """)
+        return super(Reserva, self)._auto_init()
+    
+    def init(self):
+        # Cron de estados y consultas de disponibilidad: solo miran reservas activas
+        create_index(self.env.cr, 'reserva_reserva_activas_fecha_index', self._table,
+                     ['fecha'], where="estado IN ('confirmada', 'en_curso')")
+        # Mis Reservas y el portal: reservas de un contacto paginadas por (fecha, id)
+        create_index(self.env.cr, 'reserva_reserva_partner_fecha_index', self._table,
+                     ['partner_id', 'fecha', 'id'])
+        # Calendarios .ics: reservas de una cancha o de un cliente en una ventana de fechas
+        create_index(self.env.cr, 'reserva_reserva_cancha_fecha_index', self._table,
+                     ['cancha_id', 'fecha'])
+        create_index(self.env.cr, 'reserva_reserva_cliente_fecha_index', self._table,
+                     ['cliente_id', 'fecha'])
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        sin_nombre = [vals for vals in vals_list if vals.get('name', 'Nuevo') == 'Nuevo']
+        nombres = self.env['ir.sequence']._next_by_code_lote('reserva.reserva', len(sin_nombre))
+        for vals, nombre in zip(sin_nombre, nombres):
+            vals['name'] = nombre or 'Nuevo'
+        with self._control_solapamiento():
+            reservas = super(Reserva, self).create(vals_list)
+        reservas._sincronizar_agregados([], reservas._fotos())
+        return reservas
+
+    def write(self, vals):
+        if not CAMPOS_AGREGADOS & set(vals):
+            return super(Reserva, self).write(vals)
+        antes = self._fotos()
+        with self._control_solapamiento():
+            res = super(Reserva, self).write(vals)
+        self._sincronizar_agregados(antes, self._fotos())
+        return res
+
+    def unlink(self):
+        antes = self._fotos()
+        res = super(Reserva, self).unlink()
+        self._sincronizar_agregados(antes, [])
+        return res
+
     @api.model
-    def create(self, vals):
-        if vals.get('name', 'Nuevo') == 'Nuevo':
-            vals['name'] = self.env['ir.sequence'].next_by_code('reserva.reserva') or 'Nuevo'
-        return super(Reserva, self).create(vals)
+    def _reservar_desde_portal(self, partner, vals, token=None):
+        """Crea la reserva de un envío del portal, o devuelve la existente si el
+        token ya se procesó (doble clic o reintento).
+
+        Los envíos que compiten por la misma cancha y fecha se serializan con un
+        bloqueo consultivo que se libera al terminar la transacción. Quien tuvo
+        que esperarlo no ve en su instantánea lo que confirmó el otro envío: si
+        su INSERT choca (con sin_solapamiento o con el token), puede ser el
+        mismo envío repetido, así que se lanza un ConflictoConcurrente y Odoo
+        repite la petición, que ya encuentra la reserva del token con `search`
+        o da el horario por ocupado.
+        """
+        if token:
+            reserva = self.search([('token_envio', '=', token)], limit=1)
+            if reserva:
+                return reserva
+
+        vals = dict(vals)
+        telefono = vals.pop('telefono', None)
+        fecha = fields.Date.to_date(vals['fecha'])
+        clave = [vals['cancha_id'], fecha.toordinal()]
+        self.env.cr.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", clave)
+        espero = not self.env.cr.fetchone()[0]
+        if espero:
+            self.env.cr.execute("SELECT pg_advisory_xact_lock(%s, %s)", clave)
+
+        cliente = self.env['reserva.cliente']._obtener_o_crear(partner, telefono=telefono)
+
+        try:
+            with self.env.cr.savepoint():
+                return self.create(dict(vals, cliente_id=cliente.id, token_envio=token or False))
+        except UniqueViolation as e:
+            if not token or e.diag.constraint_name != 'reserva_reserva_token_envio_unique':
+                raise
+            raise ConflictoConcurrente('Envío %s confirmado por otra transacción' % token)
+        except ValidationError:
+            if not (token and espero):
+                raise
+            raise ConflictoConcurrente('Horario confirmado por otra transacción mientras se esperaba')
+
+    @contextmanager
+    def _control_solapamiento(self):
+        """Devuelve la violación de sin_solapamiento como un ValidationError.
+
+        El savepoint vacía las escrituras pendientes antes de cerrarse, así que
+        la restricción se evalúa dentro del bloque.
+        """
+        try:
+            with self.env.cr.savepoint():
+                yield
+        except ExclusionViolation:
+            raise ValidationError(MENSAJE_SOLAPAMIENTO)
+
+    def _fotos(self):
+        return [
+            FotoReserva(r.id, r.cancha_id.id, r.cliente_id.id, r.fecha,
+                        r.hora_inicio, r.hora_fin, r.estado, r.monto_total)
+            for r in self
+        ]
+
+    @api.model
+    def _sincronizar_agregados(self, antes, despues):
+        """Propaga a las tablas agregadas la diferencia entre dos fotos"""
+        self.env['reserva.ocupacion']._actualizar(antes, despues)
+        self.env['reserva.stats.daily']._actualizar(antes, despues)
+        self.env['reserva.cancha']._actualizar_contadores(antes, despues)
+        self.env['reserva.cliente']._actualizar_contadores(antes, despues)
+        self.env['reserva.espera.trabajo']._encolar(antes, despues)
     
     @api.depends('hora_inicio', 'hora_fin')
     def _compute_duracion(self):
         for record in self:
             record.duracion = record.hora_fin - record.hora_inicio
     
-    @api.depends('duracion', 'cancha_id')
+    # Sin depender de la tabla de precios a propósito: al cambiar las tarifas,
+    # reserva.cancha reprecia en bloque solo las reservas pendientes
+    @api.depends('fecha', 'hora_inicio', 'hora_fin', 'cancha_id')
     def _compute_monto_total(self):
         for record in self:
-            record.monto_total = record.duracion * record.cancha_id.precio_hora
+            if record.cancha_id:
+                record.monto_total = record.cancha_id._precio_reserva(record.fecha, record.hora_inicio, record.hora_fin)
+            else:
+                record.monto_total = 0.0
     
     @api.constrains('hora_inicio', 'hora_fin')
     def _check_horarios(self):
@@ -66,21 +237,82 @@ class Reserva(models.Model):
                 raise ValidationError('Los horarios disponibles son de 6:00 a 23:00')
             if record.hora_inicio >= record.hora_fin:
                 raise ValidationError('La hora de inicio debe ser menor a la hora de fin')
+            # reserva.ocupacion marca franjas de 30 minutos enteras: dos reservas
+            # dentro de la misma franja se pisarían al quitar una de ellas
+            if (record.hora_inicio * 2) % 1 or (record.hora_fin * 2) % 1:
+                raise ValidationError('Las reservas van en horas o medias horas')
     
     @api.constrains('fecha')
     def _check_fecha(self):
+        # La importación de histórico carga reservas pasadas a propósito
+        if self.env.context.get('reserva_historico'):
+            return
         for record in self:
             if record.fecha < fields.Date.today():
                 raise ValidationError('No se pueden hacer reservas en fechas pasadas')
     
+    @api.model
+    def _cron_avanzar_estados(self, limite=LOTE_ESTADOS):
+        """Avanza por fecha y hora las reservas activas:
+        confirmada -> en_curso al empezar; al terminar, en_curso -> completada
+        y confirmada -> completada si está pagada o no_asistio si no.
+
+        Cada vuelta reclama un lote con FOR UPDATE SKIP LOCKED, así varias
+        ejecuciones a la vez se reparten las filas sin esperarse, y confirma la
+        transacción antes de pedir el siguiente.
+        """
+        # El usuario del cron no suele tener zona horaria: se usa la de la sede
+        ahora = ahora_sede(self.env)
+        params = {'hoy': ahora.date(), 'hora': ahora.hour + ahora.minute / 60.0, 'limite': limite}
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        Reserva = self._auditoria_lote('Estado actualizado automáticamente')
+        while True:
+            self.env.cr.execute("""
+                SELECT id, estado, pagado, (fecha < %(hoy)s OR hora_fin <= %(hora)s) AS terminada
+                  FROM reserva_reserva
+                 WHERE estado IN ('confirmada', 'en_curso')
+                   AND fecha <= %(hoy)s
+                   AND (fecha < %(hoy)s OR hora_fin <= %(hora)s
+                        OR (estado = 'confirmada' AND hora_inicio <= %(hora)s))
+              ORDER BY fecha, id
+                 LIMIT %(limite)s
+                   FOR UPDATE SKIP LOCKED
+            """, params)
+            filas = self.env.cr.fetchall()
+            if not filas:
+                break
+
+            grupos = defaultdict(list)
+            for reserva_id, estado, pagado, terminada in filas:
+                if not terminada:
+                    nuevo = 'en_curso'
+                elif estado == 'en_curso' or pagado:
+                    nuevo = 'completada'
+                else:
+                    nuevo = 'no_asistio'
+                grupos[(estado, nuevo)].append(reserva_id)
+
+            # Un write, con su create de notas de auditoría, por cada transición del lote
+            for (anterior, nuevo), ids in grupos.items():
+                Reserva.browse(ids).write({'estado': nuevo})
+
+            if auto_commit:
+                self.env.cr.commit()
+            if len(filas) < limite:
+                break
+
+    def _para_cambio_estado(self):
+        # Una sola reserva lleva el seguimiento completo; varias a la vez, auditoría por lote
+        return self if len(self) <= 1 else self._auditoria_lote('Cambio de estado masivo')
+    
     def action_confirmar(self):
-        self.write({'estado': 'confirmada'})
+        self._para_cambio_estado().write({'estado': 'confirmada'})
     
     def action_completar(self):
-        self.write({'estado': 'completada'})
+        self._para_cambio_estado().write({'estado': 'completada'})
     
     def action_cancelar(self):
-        self.write({'estado': 'cancelada'})
+        self._para_cambio_estado().write({'estado': 'cancelada'})
     
     def action_no_asistio(self):
-        self.write({'estado': 'no_asistio'})
+        self._para_cambio_estado().write({'estado': 'no_asistio'})
@@ -0,0 +1,77 @@
+from markupsafe import Markup
+
+from odoo import models, api
+
+
+class ReservaAuditoria(models.AbstractModel):
+    """Modo de auditoría por lote para escrituras masivas y automáticas.
+
+    En un entorno de `_auditoria_lote(descripcion)` el seguimiento estándar
+    de mail.thread (un mensaje y valores de seguimiento por registro y campo,
+    con búsqueda de seguidores) queda desactivado. En su lugar, cada create o
+    write deja en el chatter de cada registro una nota con la descripción del
+    lote y los campos seguidos que cambiaron, todas en un solo create de
+    mail.message. Las ediciones interactivas conservan el seguimiento completo.
+    """
+    _name = 'reserva.auditoria'
+    _description = 'Auditoría por Lote'
+
+    def _auditoria_lote(self, descripcion):
+        return self.with_context(
+            auditoria_lote=descripcion,
+            tracking_disable=True,
+            mail_create_nolog=True,
+            mail_notrack=True,
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        registros = super(ReservaAuditoria, self).create(vals_list)
+        lote = self.env.context.get('auditoria_lote')
+        if lote:
+            registros._registrar_auditoria(lote, {registro.id: ['Creado'] for registro in registros})
+        return registros
+
+    def write(self, vals):
+        lote = self.env.context.get('auditoria_lote')
+        campos = [campo for campo in vals if lote and getattr(self._fields.get(campo), 'tracking', False)]
+        if not campos:
+            return super(ReservaAuditoria, self).write(vals)
+        antes = {registro.id: {campo: self._valor_auditoria(registro, campo) for campo in campos}
+                 for registro in self}
+        res = super(ReservaAuditoria, self).write(vals)
+        lineas = {}
+        for registro in self:
+            for campo in campos:
+                anterior, nuevo = antes[registro.id][campo], self._valor_auditoria(registro, campo)
+                if anterior != nuevo:
+                    lineas.setdefault(registro.id, []).append(
+                        '%s: %s → %s' % (self._fields[campo].string, anterior, nuevo))
+        self._registrar_auditoria(lote, lineas)
+        return res
+
+    @api.model
+    def _valor_auditoria(self, registro, campo):
+        campo_def = self._fields[campo]
+        valor = registro[campo]
+        if campo_def.type == 'selection':
+            return dict(campo_def._description_selection(self.env)).get(valor, valor or '')
+        if campo_def.type == 'many2one':
+            return valor.display_name or ''
+        return valor if valor or valor == 0 else ''
+
+    def _registrar_auditoria(self, lote, lineas):
+        """Una nota por registro con cambios, todas en un solo create"""
+        if not lineas:
+            return
+        subtipo_id = self.env['ir.model.data']._xmlid_to_res_id('mail.mt_note')
+        autor_id = self.env.user.partner_id.id
+        self.env['mail.message'].sudo().create([{
+            'model': self._name,
+            'res_id': res_id,
+            'message_type': 'notification',
+            'subtype_id': subtipo_id,
+            'author_id': autor_id,
+            'body': Markup('<p>%s</p><ul>%s</ul>') % (
+                lote, Markup('').join(Markup('<li>%s</li>') % linea for linea in cambios)),
+        } for res_id, cambios in lineas.items()])
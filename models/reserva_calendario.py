@@ -0,0 +1,60 @@
+import secrets
+
+from odoo import models, fields, api
+
+
+def nuevo_token():
+    return secrets.token_urlsafe(24)
+
+
+class ReservaCalendario(models.AbstractModel):
+    """Calendario .ics suscribible con las reservas del registro.
+
+    Cada registro tiene un token secreto que forma la URL del calendario en
+    /reservas/calendario/<tipo>/<token>.ics; regenerarlo revoca la URL anterior.
+    """
+    _name = 'reserva.calendario'
+    _description = 'Calendario Suscribible'
+
+    # Tipo en la URL; el controlador lo traduce al modelo y al campo de la reserva
+    _tipo_calendario = None
+
+    token_calendario = fields.Char(string='Token de Calendario', copy=False, readonly=True,
+                                   groups='reserva_canchas.group_reserva_admin,reserva_canchas.group_reserva_staff')
+    url_calendario = fields.Char(string='Calendario (iCal)', compute='_compute_url_calendario',
+                                 groups='reserva_canchas.group_reserva_admin,reserva_canchas.group_reserva_staff')
+
+    _sql_constraints = [
+        ('token_calendario_unique', 'UNIQUE(token_calendario)', '¡El token de calendario ya existe!'),
+    ]
+
+    def init(self):
+        if self._abstract:
+            return
+        # Un token distinto para cada registro anterior al campo: el valor por
+        # defecto de una columna nueva sería el mismo para todas las filas
+        self.env.cr.execute("SELECT id FROM %s WHERE token_calendario IS NULL" % self._table)
+        ids = [fila[0] for fila in self.env.cr.fetchall()]
+        if ids:
+            self.env.cr.execute("""
+                UPDATE %s AS t
+                   SET token_calendario = v.token
+                  FROM unnest(%%s, %%s) AS v(id, token)
+                 WHERE t.id = v.id
+            """ % self._table, [ids, [nuevo_token() for _id in ids]])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            vals.setdefault('token_calendario', nuevo_token())
+        return super(ReservaCalendario, self).create(vals_list)
+
+    @api.depends('token_calendario')
+    def _compute_url_calendario(self):
+        for record in self:
+            record.url_calendario = record.token_calendario and '%s/reservas/calendario/%s/%s.ics' % (
+                record.get_base_url(), self._tipo_calendario, record.token_calendario)
+
+    def action_regenerar_token(self):
+        for record in self:
+            record.token_calendario = nuevo_token()
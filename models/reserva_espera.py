@@ -0,0 +1,268 @@
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
+
+from .reserva import ESTADOS_ACTIVOS, ahora_sede
+from .reserva_ocupacion import HORA_APERTURA, HORA_CIERRE
+
+# Trabajos de promoción que el cron toma por vuelta
+LOTE_PROMOCION = 200
+
+# Minutos que tiene el cliente avisado antes de que se avise al siguiente de la
+# lista. El horario no se aparta: cualquiera puede reservarlo mientras tanto
+MINUTOS_OFERTA = 30
+
+
+class ReservaEspera(models.Model):
+    _name = 'reserva.espera'
+    _description = 'Lista de Espera'
+    _inherit = ['mail.thread']
+    _order = 'fecha, cancha_id, id'
+
+    cliente_id = fields.Many2one('reserva.cliente', string='Cliente', required=True, tracking=True)
+    cancha_id = fields.Many2one('reserva.cancha', string='Cancha', required=True, tracking=True)
+    fecha = fields.Date(string='Fecha', required=True, tracking=True)
+    hora_inicio = fields.Float(string='Hora Inicio', required=True, tracking=True)
+    hora_fin = fields.Float(string='Hora Fin', required=True, tracking=True)
+
+    modo = fields.Selection([
+        ('avisar', 'Avisar al Cliente'),
+        ('reservar', 'Reservar Automáticamente')
+    ], string='Al Liberarse', default='avisar', required=True,
+        help='Avisar: el cliente recibe un mensaje y tiene unos minutos antes de que se avise al siguiente; '
+             'el horario sigue abierto para todos. Reservar: se crea una reserva confirmada a su nombre.')
+    estado = fields.Selection([
+        ('esperando', 'Esperando'),
+        ('ofrecida', 'Avisado'),
+        ('reservada', 'Reservada'),
+        ('vencida', 'Vencida'),
+        ('cancelada', 'Cancelada')
+    ], string='Estado', default='esperando', required=True, tracking=True)
+    fecha_oferta = fields.Datetime(string='Avisado el', readonly=True, copy=False)
+    reserva_id = fields.Many2one('reserva.reserva', string='Reserva', readonly=True, copy=False, ondelete='set null')
+
+    def init(self):
+        # El cron busca, por cancha y fecha, a los que siguen esperando en orden de llegada
+        create_index(self.env.cr, 'reserva_espera_esperando_index', self._table,
+                     ['cancha_id', 'fecha', 'id'], where="estado IN ('esperando', 'ofrecida')")
+
+    @api.constrains('fecha', 'hora_inicio', 'hora_fin')
+    def _check_horario(self):
+        for record in self:
+            if record.hora_inicio < HORA_APERTURA or record.hora_fin > HORA_CIERRE:
+                raise ValidationError('El horario debe estar entre las %s:00 y las %s:00' % (HORA_APERTURA, HORA_CIERRE))
+            if record.hora_inicio >= record.hora_fin:
+                raise ValidationError('La hora de inicio debe ser menor a la hora de fin')
+            if (record.hora_inicio * 2) % 1 or (record.hora_fin * 2) % 1:
+                raise ValidationError('Las esperas van en horas o medias horas')
+            if record.estado == 'esperando' and record.fecha < fields.Date.context_today(record):
+                raise ValidationError('No se puede esperar por una fecha pasada')
+
+    @api.depends('cliente_id', 'cancha_id', 'fecha')
+    def _compute_display_name(self):
+        for record in self:
+            record.display_name = '%s - %s (%s)' % (record.cliente_id.name or '', record.cancha_id.name or '',
+                                                    record.fecha or '')
+
+    def action_cancelar(self):
+        self.filtered(lambda e: e.estado in ('esperando', 'ofrecida')).write({'estado': 'cancelada'})
+
+    @api.model
+    def _promover(self, trabajos):
+        """Da cada horario liberado al primero de la lista que quepa en él.
+
+        `trabajos` son tuplas (cancha_id, fecha, hora_inicio, hora_fin). Una sola
+        consulta trae, en orden de llegada, a los que esperan un horario que se
+        solapa con alguno liberado y que ya no choca con reservas activas ni con
+        avisos pendientes; se bloquean con SKIP LOCKED por si otro proceso los
+        está atendiendo.
+        """
+        # Un horario de hoy que ya terminó no se le da a nadie
+        ahora = ahora_sede(self.env)
+        hoy, hora = ahora.date(), ahora.hour + ahora.minute / 60.0
+        trabajos = [trabajo for trabajo in trabajos
+                    if trabajo[1] > hoy or (trabajo[1] == hoy and trabajo[3] > hora)]
+        if not trabajos:
+            return self.browse()
+        self.env['reserva.reserva'].flush_model(['cancha_id', 'fecha', 'hora_inicio', 'hora_fin', 'estado'])
+        self.flush_model()
+        canchas, fechas, inicios, fines = zip(*trabajos)
+        self.env.cr.execute("""
+            SELECT e.id
+              FROM reserva_espera AS e
+              JOIN unnest(%s::int[], %s::date[], %s::float8[], %s::float8[]) AS t(cancha_id, fecha, hora_inicio, hora_fin)
+                ON e.cancha_id = t.cancha_id AND e.fecha = t.fecha
+               AND e.hora_inicio < t.hora_fin AND e.hora_fin > t.hora_inicio
+             WHERE e.estado = 'esperando'
+               AND NOT EXISTS (SELECT 1
+                                 FROM reserva_reserva AS r
+                                WHERE r.cancha_id = e.cancha_id AND r.fecha = e.fecha AND r.estado IN %s
+                                  AND r.hora_inicio < e.hora_fin AND r.hora_fin > e.hora_inicio)
+               AND NOT EXISTS (SELECT 1
+                                 FROM reserva_espera AS o
+                                WHERE o.cancha_id = e.cancha_id AND o.fecha = e.fecha AND o.estado = 'ofrecida'
+                                  AND o.hora_inicio < e.hora_fin AND o.hora_fin > e.hora_inicio)
+          ORDER BY e.id
+               FOR UPDATE OF e SKIP LOCKED
+        """, [list(canchas), list(fechas), list(inicios), list(fines), ESTADOS_ACTIVOS])
+        # Un mismo cliente puede solaparse con varios horarios liberados
+        candidatas = self.browse(dict.fromkeys(fila[0] for fila in self.env.cr.fetchall()))
+
+        tomados = defaultdict(list)
+        promovidas = self.browse()
+        for espera in candidatas:
+            ocupados = tomados[(espera.cancha_id.id, espera.fecha)]
+            if any(inicio < espera.hora_fin and fin > espera.hora_inicio for inicio, fin in ocupados):
+                continue
+            if espera._promover_una():
+                ocupados.append((espera.hora_inicio, espera.hora_fin))
+                promovidas |= espera
+        return promovidas
+
+    def _promover_una(self):
+        self.ensure_one()
+        horario = '%s, %s de %02d:%02d a %02d:%02d' % (
+            self.cancha_id.name, self.fecha,
+            int(self.hora_inicio), round(self.hora_inicio % 1 * 60),
+            int(self.hora_fin), round(self.hora_fin % 1 * 60))
+        partners = self.cliente_id.partner_id
+        if self.modo == 'avisar':
+            self.write({'estado': 'ofrecida', 'fecha_oferta': fields.Datetime.now()})
+            self.message_post(
+                body='Se liberó el horario que esperabas (%s). Resérvalo cuanto antes: sigue abierto para '
+                     'todos y, si no lo reservas en %s minutos, avisaremos al siguiente de la lista.'
+                     % (horario, MINUTOS_OFERTA),
+                partner_ids=partners.ids, subtype_xmlid='mail.mt_comment')
+            return True
+        Reserva = self.env['reserva.reserva']._auditoria_lote('Promovida desde la lista de espera')
+        try:
+            with self.env.cr.savepoint():
+                reserva = Reserva.create({
+                    'cliente_id': self.cliente_id.id,
+                    'cancha_id': self.cancha_id.id,
+                    'fecha': self.fecha,
+                    'hora_inicio': self.hora_inicio,
+                    'hora_fin': self.hora_fin,
+                    'estado': 'confirmada',
+                })
+        except ValidationError:
+            # Alguien reservó el horario entre la búsqueda y la creación
+            return False
+        self.write({'estado': 'reservada', 'reserva_id': reserva.id})
+        self.message_post(
+            body='Se liberó el horario que esperabas y quedó reservado a tu nombre: %s (%s).' % (horario, reserva.name),
+            partner_ids=partners.ids, subtype_xmlid='mail.mt_comment')
+        return True
+
+    @api.model
+    def _vencer(self):
+        """Cierra las esperas de fechas pasadas y los avisos sin respuesta.
+
+        Un aviso vencido se da por reservado si el cliente reservó ese horario;
+        si no, el horario vuelve a la cola para el siguiente de la lista.
+        """
+        hoy = fields.Date.context_today(self)
+        self.search([('estado', 'in', ('esperando', 'ofrecida')), ('fecha', '<', hoy)]).write({'estado': 'vencida'})
+
+        limite = fields.Datetime.now() - timedelta(minutes=MINUTOS_OFERTA)
+        avisos = self.search([('estado', '=', 'ofrecida'), ('fecha_oferta', '<', limite)])
+        if not avisos:
+            return
+        reservas = self.env['reserva.reserva'].search([
+            ('cliente_id', 'in', avisos.cliente_id.ids),
+            ('fecha', 'in', list(set(avisos.mapped('fecha')))),
+            ('estado', 'in', ESTADOS_ACTIVOS),
+        ])
+        vencidos = self.browse()
+        for aviso in avisos:
+            reserva = reservas.filtered(lambda r: r.cliente_id == aviso.cliente_id and r.cancha_id == aviso.cancha_id
+                                        and r.fecha == aviso.fecha and r.hora_inicio < aviso.hora_fin
+                                        and r.hora_fin > aviso.hora_inicio)[:1]
+            if reserva:
+                aviso.write({'estado': 'reservada', 'reserva_id': reserva.id})
+            else:
+                vencidos |= aviso
+        vencidos.write({'estado': 'vencida'})
+        self.env['reserva.espera.trabajo'].sudo().create([{
+            'cancha_id': aviso.cancha_id.id,
+            'fecha': aviso.fecha,
+            'hora_inicio': aviso.hora_inicio,
+            'hora_fin': aviso.hora_fin,
+        } for aviso in vencidos])
+
+
+class ReservaEsperaTrabajo(models.Model):
+    _name = 'reserva.espera.trabajo'
+    _description = 'Horario Liberado por Promover'
+    _log_access = False
+    _order = 'id'
+
+    # Cola de horarios liberados. Encolar es un INSERT en la transacción de la
+    # cancelación; buscar a quién dárselos lo hace después el cron.
+    cancha_id = fields.Many2one('reserva.cancha', string='Cancha', required=True, ondelete='cascade')
+    fecha = fields.Date(string='Fecha', required=True)
+    hora_inicio = fields.Float(string='Hora Inicio', required=True)
+    hora_fin = fields.Float(string='Hora Fin', required=True)
+
+    @api.model
+    def _encolar(self, antes, despues):
+        """Encola los horarios que dejaron de estar ocupados entre dos fotos
+        de reservas: cancelada, borrada o movida de cancha, fecha u horario.
+
+        Una reserva que el cron pasa a completada o no_asistio ya se jugó (o
+        ya pasó su hora): su horario no se anuncia como liberado.
+        """
+        hoy = ahora_sede(self.env).date()
+        despues = {foto.id: foto for foto in despues}
+        liberadas = []
+        for foto in antes:
+            if foto.estado not in ESTADOS_ACTIVOS or foto.fecha < hoy:
+                continue
+            nueva = despues.get(foto.id)
+            if nueva and nueva.estado != 'cancelada' and (
+                    nueva.cancha_id == foto.cancha_id and nueva.fecha == foto.fecha
+                    and nueva.hora_inicio == foto.hora_inicio and nueva.hora_fin == foto.hora_fin):
+                continue
+            liberadas.append(foto)
+        if not liberadas:
+            return
+        self.sudo().create([{
+            'cancha_id': foto.cancha_id,
+            'fecha': foto.fecha,
+            'hora_inicio': foto.hora_inicio,
+            'hora_fin': foto.hora_fin,
+        } for foto in liberadas])
+        # Despierta al cron en cuanto se confirme la transacción
+        cron = self.env.ref('reserva_canchas.ir_cron_promover_espera', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _cron_promover(self, limite=LOTE_PROMOCION):
+        """Toma trabajos de la cola con SKIP LOCKED, de modo que varios
+        procesos pueden atenderla a la vez sin repetir ni esperarse"""
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        Espera = self.env['reserva.espera']
+        Espera._vencer()
+        self.flush_model()
+        while True:
+            self.env.cr.execute("""
+                DELETE FROM reserva_espera_trabajo
+                 WHERE id IN (SELECT id
+                                FROM reserva_espera_trabajo
+                            ORDER BY id
+                               LIMIT %s
+                                 FOR UPDATE SKIP LOCKED)
+             RETURNING cancha_id, fecha, hora_inicio, hora_fin
+            """, [limite])
+            trabajos = self.env.cr.fetchall()
+            self.invalidate_model()
+            Espera._promover(trabajos)
+            if auto_commit:
+                self.env.cr.commit()
+            if len(trabajos) < limite:
+                break
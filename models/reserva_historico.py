@@ -0,0 +1,109 @@
+import threading
+
+from odoo import models, fields, api
+from odoo.tools.sql import table_exists
+
+# Estados que ya no cambian y pueden pasar al histórico
+ESTADOS_ARCHIVABLES = ('completada', 'cancelada', 'no_asistio')
+
+# Días de antigüedad a partir de los que se archiva, si no hay parámetro
+DIAS_ARCHIVO = 90
+
+# Reservas que mueve cada vuelta del cron de archivo
+LOTE_ARCHIVO = 5000
+
+# Columnas comunes a reserva.reserva y al histórico
+COLUMNAS = (
+    'name', 'cliente_id', 'cancha_id', 'fecha', 'hora_inicio', 'hora_fin', 'duracion',
+    'estado', 'monto_total', 'metodo_pago', 'pagado', 'notas', 'recurrencia_id',
+)
+
+class ReservaHistorico(models.Model):
+    _name = 'reserva.reserva.historico'
+    _description = 'Histórico de Reservas'
+    _log_access = False
+    _order = 'fecha desc, id desc'
+
+    # Copia de solo lectura de las reservas archivadas. Las tablas agregadas
+    # (estadísticas y contadores) ya las incluyen: moverlas no las cambia.
+    reserva_id = fields.Integer(string='ID Original', readonly=True)
+    name = fields.Char(string='Número de Reserva', readonly=True)
+    cliente_id = fields.Many2one('reserva.cliente', string='Cliente', readonly=True, ondelete='restrict', index=True)
+    cancha_id = fields.Many2one('reserva.cancha', string='Cancha', readonly=True, ondelete='restrict', index=True)
+    fecha = fields.Date(string='Fecha', readonly=True, index=True)
+    hora_inicio = fields.Float(string='Hora Inicio', readonly=True)
+    hora_fin = fields.Float(string='Hora Fin', readonly=True)
+    duracion = fields.Float(string='Duración (horas)', readonly=True)
+    estado = fields.Selection(selection='_selection_estado', string='Estado', readonly=True)
+    monto_total = fields.Float(string='Monto Total', readonly=True)
+    metodo_pago = fields.Selection(selection='_selection_metodo_pago', string='Método de Pago', readonly=True)
+    pagado = fields.Boolean(string='Pagado', readonly=True)
+    notas = fields.Text(string='Notas Adicionales', readonly=True)
+    recurrencia_id = fields.Many2one('reserva.recurrencia', string='Serie', readonly=True, ondelete='set null')
+
+    @api.model
+    def _selection_estado(self):
+        return self.env['reserva.reserva']._fields['estado'].selection
+
+    @api.model
+    def _selection_metodo_pago(self):
+        return self.env['reserva.reserva']._fields['metodo_pago'].selection
+
+    @api.model
+    def _origen_sql(self, columnas):
+        """Subconsulta con las columnas pedidas de las reservas vivas y las
+        archivadas, para los recálculos completos de las tablas agregadas"""
+        seleccion = ', '.join(columnas)
+        if not table_exists(self.env.cr, self._table):
+            return '(SELECT %s FROM reserva_reserva)' % seleccion
+        return '(SELECT %s FROM reserva_reserva UNION ALL SELECT %s FROM %s)' % (
+            seleccion, seleccion, self._table)
+
+    @api.model
+    def _cron_archivar(self, limite=LOTE_ARCHIVO):
+        """Mueve al histórico las reservas terminadas más antiguas que el
+        horizonte configurado (parámetro reserva_canchas.dias_archivo).
+
+        El movimiento es un DELETE ... RETURNING encadenado con el INSERT, sin
+        pasar por el ORM: así no se tocan los agregados, que deben seguir
+        contando estas reservas.
+        """
+        dias = int(self.env['ir.config_parameter'].sudo().get_param(
+            'reserva_canchas.dias_archivo', DIAS_ARCHIVO))
+        if dias <= 0:
+            return
+        limite_fecha = fields.Date.subtract(fields.Date.today(), days=dias)
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        columnas = ', '.join(COLUMNAS)
+
+        self.env['reserva.reserva'].flush_model()
+        while True:
+            self.env.cr.execute("""
+                WITH movidas AS (
+                    DELETE FROM reserva_reserva
+                     WHERE id IN (SELECT id
+                                    FROM reserva_reserva
+                                   WHERE estado IN %%s AND fecha < %%s
+                                   LIMIT %%s
+                                     FOR UPDATE SKIP LOCKED)
+                 RETURNING id, %(columnas)s
+                )
+                INSERT INTO reserva_reserva_historico (reserva_id, %(columnas)s)
+                     SELECT id, %(columnas)s FROM movidas
+                  RETURNING reserva_id
+            """ % {'columnas': columnas}, [ESTADOS_ARCHIVABLES, limite_fecha, limite])
+            ids = [fila[0] for fila in self.env.cr.fetchall()]
+            if ids:
+                # Seguidores, actividades y mensajes de registros que ya no
+                # existen; el histórico no tiene chatter. Los valores de
+                # seguimiento y las notificaciones se borran en cascada.
+                self.env.cr.execute("""
+                    DELETE FROM mail_followers WHERE res_model = 'reserva.reserva' AND res_id IN %s;
+                    DELETE FROM mail_activity WHERE res_model = 'reserva.reserva' AND res_id IN %s;
+                    DELETE FROM mail_message WHERE model = 'reserva.reserva' AND res_id IN %s;
+                """, [tuple(ids)] * 3)
+                self.env['reserva.reserva'].invalidate_model()
+            if auto_commit:
+                self.env.cr.commit()
+            if len(ids) < limite:
+                break
@@ -0,0 +1,163 @@
+import math
+from collections import defaultdict
+
+from odoo import models, fields, api
+
+from .disponibilidad_cache import invalidar_disponibilidad
+from .reserva import ESTADOS_ACTIVOS
+
+HORA_APERTURA = 6
+HORA_CIERRE = 23
+
+
+def mascara_franjas(hora_inicio, hora_fin):
+    """Máscara de franjas de 30 minutos: el bit i cubre de i/2 a (i+1)/2 horas"""
+    inicio = int(math.floor(hora_inicio * 2))
+    fin = int(math.ceil(hora_fin * 2))
+    return (1 << fin) - (1 << inicio) if fin > inicio else 0
+
+
+MASCARA_APERTURA = mascara_franjas(HORA_APERTURA, HORA_CIERRE)
+
+# Tipo de las notificaciones de ocupación en el bus
+NOTIFICACION_OCUPACION = 'reserva_canchas/ocupacion'
+
+
+def canal_cancha(cancha_id):
+    """Canal del bus al que se suscribe el detalle de una cancha"""
+    return 'reserva_canchas.cancha_%s' % cancha_id
+
+
+def horas_ocupadas(mapa):
+    """Reduce un mapa de franjas a horas: el bit i es la hora HORA_APERTURA + i"""
+    horas = 0
+    for i, hora in enumerate(range(HORA_APERTURA, HORA_CIERRE)):
+        if mapa & mascara_franjas(hora, hora + 1):
+            horas |= 1 << i
+    return horas
+
+
+class Mapa(fields.Integer):
+    """Entero de 64 bits: las 48 franjas de un día no caben en un int4"""
+    column_type = ('int8', 'int8')
+
+
+class ReservaOcupacion(models.Model):
+    _name = 'reserva.ocupacion'
+    _description = 'Ocupación Diaria de Canchas'
+    _log_access = False
+
+    cancha_id = fields.Many2one('reserva.cancha', string='Cancha', required=True, ondelete='cascade')
+    fecha = fields.Date(string='Fecha', required=True)
+    mapa = Mapa(string='Franjas Ocupadas', default=0)
+
+    _sql_constraints = [
+        ('cancha_fecha_unique', 'UNIQUE(cancha_id, fecha)',
+         '¡Ya existe un mapa de ocupación para esa cancha y fecha!')
+    ]
+
+    def init(self):
+        self.env.cr.execute("SELECT 1 FROM reserva_ocupacion LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._reconstruir()
+
+    @api.model
+    def _reconstruir(self):
+        """Recalcula todos los mapas a partir de las reservas activas"""
+        self.env['reserva.reserva'].flush_model()
+        self.env.cr.execute("""
+            DELETE FROM reserva_ocupacion;
+            INSERT INTO reserva_ocupacion (cancha_id, fecha, mapa)
+                 SELECT cancha_id, fecha,
+                        BIT_OR((1::int8 << CEIL(hora_fin * 2)::int) - (1::int8 << FLOOR(hora_inicio * 2)::int))
+                   FROM reserva_reserva
+                  WHERE estado IN %s AND hora_fin > hora_inicio
+               GROUP BY cancha_id, fecha
+        """, [ESTADOS_ACTIVOS])
+        self.invalidate_model()
+        invalidar_disponibilidad(self.env, todo=True)
+
+    @api.model
+    def _leer_mapas(self, claves):
+        """Devuelve {(cancha_id, fecha): mapa} para las claves pedidas"""
+        claves = tuple(set(claves))
+        if not claves:
+            return {}
+        self.env.cr.execute("""
+            SELECT cancha_id, fecha, mapa
+              FROM reserva_ocupacion
+             WHERE (cancha_id, fecha) IN %s
+        """, [claves])
+        return {(cancha_id, fecha): mapa for cancha_id, fecha, mapa in self.env.cr.fetchall()}
+
+    @api.model
+    def _leer_rango(self, cancha_ids, fecha_desde, fecha_hasta):
+        """Devuelve {(cancha_id, fecha): mapa} de varias canchas en un rango de fechas"""
+        if not cancha_ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT cancha_id, fecha, mapa
+              FROM reserva_ocupacion
+             WHERE cancha_id IN %s
+               AND fecha BETWEEN %s AND %s
+        """, [tuple(cancha_ids), fecha_desde, fecha_hasta])
+        return {(cancha_id, fecha): mapa for cancha_id, fecha, mapa in self.env.cr.fetchall()}
+
+    @api.model
+    def _actualizar(self, antes, despues):
+        """Quita las franjas de las fotos previas y marca las nuevas.
+
+        No comprueba solapamientos: de eso se encarga la restricción
+        sin_solapamiento de reserva.reserva, así que las franjas activas de un
+        día son disjuntas y basta con una actualización atómica.
+        """
+        quitar = defaultdict(int)
+        poner = defaultdict(int)
+        for foto in antes:
+            if foto.estado in ESTADOS_ACTIVOS:
+                quitar[(foto.cancha_id, foto.fecha)] |= mascara_franjas(foto.hora_inicio, foto.hora_fin)
+        for foto in despues:
+            if foto.estado in ESTADOS_ACTIVOS:
+                poner[(foto.cancha_id, foto.fecha)] |= mascara_franjas(foto.hora_inicio, foto.hora_fin)
+
+        filas = [
+            clave + (quitar[clave], poner[clave])
+            for clave in set(quitar) | set(poner)
+            if quitar[clave] != poner[clave]
+        ]
+        if not filas:
+            return
+
+        valores = ', '.join(['%s'] * len(filas))
+        self.env.cr.execute("""
+            INSERT INTO reserva_ocupacion (cancha_id, fecha, mapa)
+                 VALUES %s
+            ON CONFLICT (cancha_id, fecha) DO NOTHING
+        """ % valores, [(cancha_id, fecha, 0) for cancha_id, fecha, _q, _p in filas])
+        self.env.cr.execute("""
+            UPDATE reserva_ocupacion AS o
+               SET mapa = (o.mapa & ~v.quitar::int8) | v.poner::int8
+              FROM (VALUES %s) AS v(cancha_id, fecha, quitar, poner)
+             WHERE o.cancha_id = v.cancha_id
+               AND o.fecha = v.fecha
+         RETURNING o.cancha_id, o.fecha, o.mapa
+        """ % valores, filas)
+        self._publicar(self.env.cr.fetchall())
+        self.invalidate_model()
+        invalidar_disponibilidad(self.env, claves=[(cancha_id, fecha) for cancha_id, fecha, _q, _p in filas])
+
+    @api.model
+    def _publicar(self, mapas):
+        """Envía por el bus las horas ocupadas de cada (cancha, fecha) modificada,
+        un mensaje por cancha. El bus los entrega al confirmar la transacción."""
+        hoy = fields.Date.context_today(self)
+        dias = defaultdict(dict)
+        for cancha_id, fecha, mapa in mapas:
+            # Nadie mira la grilla de días pasados (cron de estados, importaciones)
+            if fecha >= hoy:
+                dias[cancha_id][fields.Date.to_string(fecha)] = horas_ocupadas(mapa)
+        if dias:
+            self.env['bus.bus']._sendmany([
+                (canal_cancha(cancha_id), NOTIFICACION_OCUPACION, {'cancha_id': cancha_id, 'ocupadas': ocupadas})
+                for cancha_id, ocupadas in dias.items()
+            ])
@@ -0,0 +1,225 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+
+from .reserva import ESTADOS_ACTIVOS
+from .reserva_ocupacion import mascara_franjas
+
+# Tope de ocurrencias de una serie: un año de reservas semanales
+MAX_OCURRENCIAS = 53
+
+# Campos de la serie que se copian a sus ocurrencias futuras
+CAMPOS_OCURRENCIA = ('cliente_id', 'cancha_id', 'hora_inicio', 'hora_fin')
+
+class ReservaRecurrencia(models.Model):
+    _name = 'reserva.recurrencia'
+    _description = 'Serie de Reservas Recurrentes'
+    _inherit = ['mail.thread']
+    _order = 'fecha_inicio desc, id desc'
+
+    name = fields.Char(string='Serie', readonly=True, copy=False, default='Nuevo')
+    cliente_id = fields.Many2one('reserva.cliente', string='Cliente', required=True, tracking=True)
+    cancha_id = fields.Many2one('reserva.cancha', string='Cancha', required=True, tracking=True)
+    hora_inicio = fields.Float(string='Hora Inicio', required=True, tracking=True)
+    hora_fin = fields.Float(string='Hora Fin', required=True, tracking=True)
+
+    frecuencia = fields.Selection([
+        ('semanal', 'Semanal'),
+        ('quincenal', 'Cada 2 Semanas')
+    ], string='Frecuencia', default='semanal', required=True)
+    fecha_inicio = fields.Date(string='Primera Fecha', required=True)
+    tipo_fin = fields.Selection([
+        ('fecha', 'Hasta una Fecha'),
+        ('cantidad', 'Número de Reservas')
+    ], string='Termina', default='cantidad', required=True)
+    fecha_fin = fields.Date(string='Última Fecha')
+    cantidad = fields.Integer(string='Número de Reservas', default=10)
+
+    estado = fields.Selection([
+        ('borrador', 'Borrador'),
+        ('activa', 'Activa'),
+        ('cancelada', 'Cancelada')
+    ], string='Estado', default='borrador', required=True, tracking=True)
+
+    excepcion_ids = fields.One2many('reserva.recurrencia.excepcion', 'recurrencia_id', string='Excepciones')
+    reserva_ids = fields.One2many('reserva.reserva', 'recurrencia_id', string='Reservas')
+    reservas_count = fields.Integer(string='Reservas', compute='_compute_reservas_count')
+    conflictos = fields.Text(string='Conflictos', readonly=True, copy=False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        sin_nombre = [vals for vals in vals_list if vals.get('name', 'Nuevo') == 'Nuevo']
+        nombres = self.env['ir.sequence']._next_by_code_lote('reserva.recurrencia', len(sin_nombre))
+        for vals, nombre in zip(sin_nombre, nombres):
+            vals['name'] = nombre or 'Nuevo'
+        return super(ReservaRecurrencia, self).create(vals_list)
+
+    def write(self, vals):
+        cambios = {campo: vals[campo] for campo in CAMPOS_OCURRENCIA if campo in vals}
+        activas = self.filtered(lambda r: r.estado == 'activa')
+        if cambios and activas:
+            # Se comprueba antes de escribir para no dejar la serie a medias
+            activas._comprobar_cambio(activas._ocurrencias_futuras(), cambios)
+        res = super(ReservaRecurrencia, self).write(vals)
+        if cambios:
+            # Un solo write sobre todas las ocurrencias futuras de todas las series
+            activas._ocurrencias_futuras()._auditoria_lote('Cambio propagado desde la serie').write(cambios)
+        return res
+
+    def _compute_reservas_count(self):
+        counts = dict(self.env['reserva.reserva']._read_group(
+            [('recurrencia_id', 'in', self.ids)], ['recurrencia_id'], ['__count']))
+        for record in self:
+            record.reservas_count = counts.get(record, 0)
+
+    @api.constrains('hora_inicio', 'hora_fin')
+    def _check_horarios(self):
+        for record in self:
+            if record.hora_inicio < 6 or record.hora_fin > 23:
+                raise ValidationError('Los horarios disponibles son de 6:00 a 23:00')
+            if record.hora_inicio >= record.hora_fin:
+                raise ValidationError('La hora de inicio debe ser menor a la hora de fin')
+            # Si no, action_generar fallaría a medias con la restricción de la reserva
+            if (record.hora_inicio * 2) % 1 or (record.hora_fin * 2) % 1:
+                raise ValidationError('Las reservas van en horas o medias horas')
+
+    @api.constrains('tipo_fin', 'fecha_fin', 'cantidad', 'fecha_inicio', 'frecuencia')
+    def _check_fin(self):
+        for record in self:
+            if record.tipo_fin == 'fecha':
+                if not record.fecha_fin or record.fecha_fin < record.fecha_inicio:
+                    raise ValidationError('La última fecha debe ser posterior a la primera')
+                # Si no, _fechas cortaría la serie en silencio antes de la última fecha
+                ocurrencias = (record.fecha_fin - record.fecha_inicio).days // record._paso().days + 1
+                if ocurrencias > MAX_OCURRENCIAS:
+                    raise ValidationError('Una serie puede tener hasta %s reservas: hasta esa fecha serían %s'
+                                          % (MAX_OCURRENCIAS, ocurrencias))
+            if record.tipo_fin == 'cantidad' and not 0 < record.cantidad <= MAX_OCURRENCIAS:
+                raise ValidationError('Una serie puede tener entre 1 y %s reservas' % MAX_OCURRENCIAS)
+
+    def _paso(self):
+        self.ensure_one()
+        return timedelta(weeks=1 if self.frecuencia == 'semanal' else 2)
+
+    def _fechas(self):
+        """Fechas de la serie, sin las excepciones"""
+        self.ensure_one()
+        paso = self._paso()
+        excepciones = set(self.excepcion_ids.mapped('fecha'))
+        fechas = []
+        fecha = self.fecha_inicio
+        for _i in range(MAX_OCURRENCIAS):
+            if self.tipo_fin == 'fecha' and fecha > self.fecha_fin:
+                break
+            if self.tipo_fin == 'cantidad' and _i >= self.cantidad:
+                break
+            if fecha not in excepciones:
+                fechas.append(fecha)
+            fecha += paso
+        return fechas
+
+    def _ocurrencias_futuras(self):
+        return self.env['reserva.reserva'].search([
+            ('recurrencia_id', 'in', self.ids),
+            ('fecha', '>=', fields.Date.today()),
+            ('estado', 'in', ('borrador',) + ESTADOS_ACTIVOS),
+        ])
+
+    @api.model
+    def _comprobar_cambio(self, reservas, cambios):
+        """Comprueba con una sola lectura de los mapas de ocupación que aplicar
+        `cambios` a las reservas no las solape con otras"""
+        propias = defaultdict(int)
+        nuevas = []
+        for reserva in reservas.filtered(lambda r: r.estado in ESTADOS_ACTIVOS):
+            propias[(reserva.cancha_id.id, reserva.fecha)] |= mascara_franjas(reserva.hora_inicio, reserva.hora_fin)
+            clave = (cambios.get('cancha_id', reserva.cancha_id.id), reserva.fecha)
+            mascara = mascara_franjas(cambios.get('hora_inicio', reserva.hora_inicio),
+                                      cambios.get('hora_fin', reserva.hora_fin))
+            nuevas.append((clave, mascara))
+
+        # Las franjas de las propias reservas quedan libres al moverlas
+        mapas = self.env['reserva.ocupacion']._leer_mapas([clave for clave, _mascara in nuevas])
+        conflictos = sorted(
+            clave[1] for clave, mascara in nuevas
+            if mapas.get(clave, 0) & ~propias[clave] & mascara
+        )
+        if conflictos:
+            raise ValidationError('La cancha ya tiene reservas en ese horario el %s' % ', '.join(
+                fields.Date.to_string(fecha) for fecha in conflictos))
+
+    def action_generar(self):
+        """Crea las ocurrencias que faltan.
+
+        Las franjas de todas las fechas candidatas se comprueban con una sola
+        lectura de los mapas de ocupación; las libres se crean en un único
+        create y las demás quedan en el informe de conflictos.
+        """
+        self.ensure_one()
+        Reserva = self.env['reserva.reserva']
+        hoy = fields.Date.today()
+
+        existentes = Reserva.search([('recurrencia_id', '=', self.id)])
+        # Las fechas ya generadas no se repiten, aunque se hayan cancelado a mano
+        ya_generadas = set(existentes.mapped('fecha'))
+        candidatas = [fecha for fecha in self._fechas() if fecha >= hoy and fecha not in ya_generadas]
+
+        mascara = mascara_franjas(self.hora_inicio, self.hora_fin)
+        mapas = self.env['reserva.ocupacion']._leer_mapas([(self.cancha_id.id, fecha) for fecha in candidatas])
+        libres = [fecha for fecha in candidatas if not mapas.get((self.cancha_id.id, fecha), 0) & mascara]
+        ocupadas = [fecha for fecha in candidatas if fecha not in libres]
+
+        Reserva._auditoria_lote('Generada por la serie %s' % self.name).create([{
+            'recurrencia_id': self.id,
+            'cliente_id': self.cliente_id.id,
+            'cancha_id': self.cancha_id.id,
+            'fecha': fecha,
+            'hora_inicio': self.hora_inicio,
+            'hora_fin': self.hora_fin,
+            'estado': 'confirmada',
+        } for fecha in libres])
+
+        # Ocurrencias que caen en una excepción añadida después de generarlas
+        excepciones = set(self.excepcion_ids.mapped('fecha'))
+        existentes.filtered(
+            lambda r: r.fecha in excepciones and r.fecha >= hoy and r.estado in ('borrador',) + ESTADOS_ACTIVOS
+        )._auditoria_lote('Fecha exceptuada en la serie %s' % self.name).write({'estado': 'cancelada'})
+
+        self.write({
+            'estado': 'activa',
+            'conflictos': '\n'.join(
+                '%s: la cancha ya está ocupada' % fields.Date.to_string(fecha) for fecha in ocupadas
+            ) or False,
+        })
+        self.message_post(body='Reservas generadas: %s. Fechas con conflicto: %s.' % (len(libres), len(ocupadas)))
+
+    def action_cancelar(self):
+        """Cancela en bloque las ocurrencias futuras de las series"""
+        self._ocurrencias_futuras()._auditoria_lote('Serie cancelada').write({'estado': 'cancelada'})
+        self.write({'estado': 'cancelada'})
+
+    def action_ver_reservas(self):
+        return {
+            'name': 'Reservas de ' + self.name,
+            'type': 'ir.actions.act_window',
+            'res_model': 'reserva.reserva',
+            'view_mode': 'tree,form',
+            'domain': [('recurrencia_id', '=', self.id)],
+            'context': {'default_recurrencia_id': self.id},
+        }
+
+
+class ReservaRecurrenciaExcepcion(models.Model):
+    _name = 'reserva.recurrencia.excepcion'
+    _description = 'Excepción de Serie de Reservas'
+    _order = 'fecha'
+
+    recurrencia_id = fields.Many2one('reserva.recurrencia', string='Serie', required=True, ondelete='cascade')
+    fecha = fields.Date(string='Fecha', required=True)
+    motivo = fields.Char(string='Motivo')
+
+    _sql_constraints = [
+        ('recurrencia_fecha_unique', 'UNIQUE(recurrencia_id, fecha)', '¡Esa fecha ya está exceptuada!')
+    ]
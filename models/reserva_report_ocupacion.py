@@ -0,0 +1,120 @@
+from odoo import models, fields, api
+
+from .reserva import ESTADOS_INGRESO
+from .reserva_ocupacion import HORA_APERTURA, HORA_CIERRE
+from .reserva_tarifa import DIAS_SEMANA
+
+# Estados en los que la cancha estuvo (o está) ocupada; los ingresos solo
+# cuentan ESTADOS_INGRESO, como las estadísticas y el tablero
+ESTADOS_OCUPACION = ('confirmada', 'en_curso', 'completada', 'no_asistio')
+
+FRANJAS = [
+    ('manana', 'Mañana (6:00 - 12:00)'),
+    ('tarde', 'Tarde (12:00 - 18:00)'),
+    ('noche', 'Noche (18:00 - 23:00)'),
+]
+
+
+class ReservaReportOcupacion(models.Model):
+    _name = 'reserva.report.ocupacion'
+    _description = 'Análisis de Ocupación e Ingresos'
+    _auto = False
+    _order = 'fecha desc, cancha_id, hora'
+
+    # Una fila por cancha, día y hora de apertura, en una vista materializada
+    # que la acción planificada refresca sin bloquear las lecturas
+    cancha_id = fields.Many2one('reserva.cancha', string='Cancha', readonly=True)
+    tipo_deporte = fields.Selection(selection='_selection_tipo_deporte', string='Tipo de Deporte', readonly=True)
+    fecha = fields.Date(string='Fecha', readonly=True)
+    dia_semana = fields.Selection([dia for dia in DIAS_SEMANA if dia[0] != 'todos'],
+                                  string='Día de la Semana', readonly=True)
+    hora = fields.Integer(string='Hora', readonly=True, group_operator='min')
+    franja = fields.Selection(FRANJAS, string='Franja Horaria', readonly=True)
+    horas_disponibles = fields.Float(string='Horas Disponibles', readonly=True)
+    horas_reservadas = fields.Float(string='Horas Reservadas', readonly=True)
+    # Cada fila es una hora disponible: el promedio es la tasa de ocupación del grupo
+    ocupacion = fields.Float(string='Ocupación (%)', readonly=True, group_operator='avg')
+    ingresos = fields.Float(string='Ingresos', readonly=True)
+
+    @api.model
+    def _selection_tipo_deporte(self):
+        return self.env['reserva.cancha']._fields['tipo_deporte'].selection
+
+    def init(self):
+        self.env.cr.execute("DROP MATERIALIZED VIEW IF EXISTS %s CASCADE" % self._table)
+        origen = self.env['reserva.reserva.historico']._origen_sql(
+            ['cancha_id', 'fecha', 'hora_inicio', 'hora_fin', 'estado', 'monto_total'])
+        self.env.cr.execute("""
+            CREATE MATERIALIZED VIEW %(tabla)s AS
+              WITH reservas AS (
+                       SELECT cancha_id, fecha, hora_inicio, hora_fin, estado, monto_total
+                         FROM %(origen)s AS r
+                        WHERE estado IN %(estados)s AND hora_fin > hora_inicio
+                   ),
+                   dias AS (
+                       SELECT generate_series(MIN(fecha), MAX(fecha), INTERVAL '1 day')::date AS fecha
+                         FROM reservas
+                   ),
+                   canchas AS (
+                       -- Desde que existe la cancha (o su primera reserva, si se importó historia)
+                       SELECT c.id AS cancha_id, c.tipo_deporte, c.estado,
+                              LEAST(c.create_date::date, MIN(r.fecha)) AS desde
+                         FROM reserva_cancha AS c
+                    LEFT JOIN reservas AS r ON r.cancha_id = c.id
+                     GROUP BY c.id
+                   ),
+                   celdas AS (
+                       -- Una cancha fuera de servicio no ofrece horas desde hoy,
+                       -- salvo los días en que aún tiene reservas
+                       SELECT ca.cancha_id, ca.tipo_deporte, d.fecha, h AS hora
+                         FROM canchas AS ca
+                         JOIN dias AS d
+                           ON d.fecha >= ca.desde
+                          AND (ca.estado = 'disponible' OR d.fecha < CURRENT_DATE
+                               OR EXISTS (SELECT 1 FROM reservas AS r
+                                           WHERE r.cancha_id = ca.cancha_id AND r.fecha = d.fecha))
+                   CROSS JOIN generate_series(%(apertura)s, %(cierre)s - 1) AS h
+                   )
+            -- id estable por (cancha, fecha, hora): el refresco concurrente solo
+            -- reescribe las filas que cambian
+            SELECT ce.cancha_id::bigint * 100000000 + (ce.fecha - DATE '2000-01-01') * 100 + ce.hora AS id,
+                   ce.cancha_id,
+                   ce.tipo_deporte,
+                   ce.fecha,
+                   (EXTRACT(ISODOW FROM ce.fecha)::int - 1)::varchar AS dia_semana,
+                   ce.hora,
+                   CASE WHEN ce.hora < 12 THEN 'manana' WHEN ce.hora < 18 THEN 'tarde' ELSE 'noche' END AS franja,
+                   1.0::float8 AS horas_disponibles,
+                   COALESCE(SUM(LEAST(r.hora_fin, ce.hora + 1) - GREATEST(r.hora_inicio, ce.hora)), 0)::float8
+                       AS horas_reservadas,
+                   100 * COALESCE(SUM(LEAST(r.hora_fin, ce.hora + 1) - GREATEST(r.hora_inicio, ce.hora)), 0)::float8
+                       AS ocupacion,
+                   COALESCE(SUM(r.monto_total * (LEAST(r.hora_fin, ce.hora + 1) - GREATEST(r.hora_inicio, ce.hora))
+                                / (r.hora_fin - r.hora_inicio)) FILTER (WHERE r.estado IN %(ingreso)s), 0)::float8
+                       AS ingresos
+              FROM celdas AS ce
+         LEFT JOIN reservas AS r
+                ON r.cancha_id = ce.cancha_id
+               AND r.fecha = ce.fecha
+               AND r.hora_inicio < ce.hora + 1
+               AND r.hora_fin > ce.hora
+          GROUP BY ce.cancha_id, ce.tipo_deporte, ce.fecha, ce.hora
+        """ % {
+            'tabla': self._table,
+            'origen': origen,
+            'estados': self.env.cr.mogrify('%s', [ESTADOS_OCUPACION]).decode(),
+            'ingreso': self.env.cr.mogrify('%s', [ESTADOS_INGRESO]).decode(),
+            'apertura': HORA_APERTURA,
+            'cierre': HORA_CIERRE,
+        })
+        # REFRESH ... CONCURRENTLY necesita un índice único
+        self.env.cr.execute("CREATE UNIQUE INDEX %s_clave_index ON %s (cancha_id, fecha, hora)"
+                            % (self._table, self._table))
+
+    @api.model
+    def _cron_refrescar(self):
+        """Recalcula la vista; el refresco concurrente deja consultar el
+        informe mientras tanto"""
+        self.env['reserva.reserva'].flush_model()
+        self.env.cr.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY %s" % self._table)
+        self.invalidate_model()
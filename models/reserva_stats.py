@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+from odoo import models, fields, api
+
+
+class ReservaStatsDaily(models.Model):
+    _name = 'reserva.stats.daily'
+    _description = 'Estadísticas Diarias de Reservas'
+    _log_access = False
+    _order = 'fecha desc, hora'
+
+    # Una fila por cancha, día, hora de inicio y estado
+    cancha_id = fields.Many2one('reserva.cancha', string='Cancha', required=True, ondelete='cascade')
+    fecha = fields.Date(string='Fecha', required=True, index=True)
+    hora = fields.Integer(string='Hora', required=True)
+    estado = fields.Selection(selection='_selection_estado', string='Estado', required=True)
+
+    reservas_count = fields.Integer(string='Reservas', default=0)
+    monto_total = fields.Float(string='Monto Total', default=0.0)
+
+    _sql_constraints = [
+        ('clave_unique', 'UNIQUE(cancha_id, fecha, hora, estado)',
+         '¡Ya existe una fila de estadísticas para esa cancha, fecha, hora y estado!')
+    ]
+
+    @api.model
+    def _selection_estado(self):
+        return self.env['reserva.reserva']._fields['estado'].selection
+
+    def init(self):
+        self.env.cr.execute("SELECT 1 FROM reserva_stats_daily LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._reconstruir()
+
+    @api.model
+    def _reconstruir(self):
+        """Recalcula la tabla completa a partir de las reservas, incluidas las archivadas"""
+        self.env['reserva.reserva'].flush_model()
+        origen = self.env['reserva.reserva.historico']._origen_sql(
+            ['cancha_id', 'fecha', 'hora_inicio', 'estado', 'monto_total'])
+        self.env.cr.execute("""
+            DELETE FROM reserva_stats_daily;
+            INSERT INTO reserva_stats_daily (cancha_id, fecha, hora, estado, reservas_count, monto_total)
+                 SELECT cancha_id, fecha, FLOOR(hora_inicio)::int, estado,
+                        COUNT(*), COALESCE(SUM(monto_total), 0)
+                   FROM %s AS r
+               GROUP BY 1, 2, 3, 4
+        """ % origen)
+        self.invalidate_model()
+
+    @api.model
+    def _actualizar(self, antes, despues):
+        """Aplica por deltas la diferencia entre dos fotos de reservas"""
+        deltas = defaultdict(lambda: [0, 0.0])
+        for signo, fotos in ((-1, antes), (1, despues)):
+            for foto in fotos:
+                delta = deltas[(foto.cancha_id, foto.fecha, int(foto.hora_inicio), foto.estado)]
+                delta[0] += signo
+                delta[1] += signo * foto.monto_total
+
+        filas = [clave + tuple(delta) for clave, delta in deltas.items() if any(delta)]
+        if not filas:
+            return
+
+        self.env.cr.execute("""
+            INSERT INTO reserva_stats_daily AS s (cancha_id, fecha, hora, estado, reservas_count, monto_total)
+                 VALUES %s
+            ON CONFLICT (cancha_id, fecha, hora, estado) DO UPDATE
+                    SET reservas_count = s.reservas_count + EXCLUDED.reservas_count,
+                        monto_total = s.monto_total + EXCLUDED.monto_total
+        """ % ', '.join(['%s'] * len(filas)), filas)
+        self.invalidate_model()
@@ -0,0 +1,105 @@
+import math
+
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+
+from .reserva_ocupacion import HORA_APERTURA, HORA_CIERRE
+
+# Franjas de 30 minutos de un día y de una semana (lunes = día 0)
+FRANJAS_DIA = 48
+FRANJAS_SEMANA = 7 * FRANJAS_DIA
+
+DIAS_SEMANA = [
+    ('todos', 'Todos los días'),
+    ('0', 'Lunes'),
+    ('1', 'Martes'),
+    ('2', 'Miércoles'),
+    ('3', 'Jueves'),
+    ('4', 'Viernes'),
+    ('5', 'Sábado'),
+    ('6', 'Domingo'),
+]
+
+
+def compilar_tabla(precio_hora, tarifas):
+    """Precio por hora de cada franja de la semana: el precio base de la
+    cancha, pisado por las bandas de todos los días y luego por las de un día"""
+    tabla = [precio_hora] * FRANJAS_SEMANA
+    for tarifa in sorted(tarifas, key=lambda t: t.dia_semana != 'todos'):
+        dias = range(7) if tarifa.dia_semana == 'todos' else [int(tarifa.dia_semana)]
+        for dia in dias:
+            inicio = dia * FRANJAS_DIA
+            for franja in range(int(tarifa.hora_inicio * 2), int(tarifa.hora_fin * 2)):
+                tabla[inicio + franja] = tarifa.precio
+    return tabla
+
+
+def precio_reserva(tabla, fecha, hora_inicio, hora_fin):
+    """Monto de una reserva: suma de cada franja por la fracción de hora que ocupa"""
+    if not tabla or not fecha or hora_fin <= hora_inicio:
+        return 0.0
+    inicio = fecha.weekday() * FRANJAS_DIA
+    total = 0.0
+    for franja in range(int(math.floor(hora_inicio * 2)), int(math.ceil(hora_fin * 2))):
+        horas = min(hora_fin, (franja + 1) / 2.0) - max(hora_inicio, franja / 2.0)
+        total += tabla[inicio + franja] * horas
+    return total
+
+
+def precios_por_hora(tabla, dia):
+    """Precio de cada hora de apertura de un día de la semana"""
+    inicio = dia * FRANJAS_DIA
+    return [(tabla[inicio + 2 * hora] + tabla[inicio + 2 * hora + 1]) / 2.0
+            for hora in range(HORA_APERTURA, HORA_CIERRE)]
+
+
+# Misma cuenta que precio_reserva, en SQL, para repreciar reservas en bloque.
+# Los arreglos jsonb empiezan en 0.
+SQL_PRECIO_RESERVA = """
+    (SELECT COALESCE(SUM((c.tabla_precios->>((EXTRACT(ISODOW FROM r.fecha)::int - 1) * %(franjas)s + f))::float8
+                         * (LEAST(r.hora_fin, (f + 1) / 2.0) - GREATEST(r.hora_inicio, f / 2.0))), 0)
+       FROM generate_series(FLOOR(r.hora_inicio * 2)::int, CEIL(r.hora_fin * 2)::int - 1) AS f)
+""" % {'franjas': FRANJAS_DIA}
+
+
+class ReservaTarifa(models.Model):
+    _name = 'reserva.tarifa'
+    _description = 'Tarifa por Franja Horaria'
+    _order = 'cancha_id, dia_semana, hora_inicio'
+
+    cancha_id = fields.Many2one('reserva.cancha', string='Cancha', required=True, ondelete='cascade', index=True)
+    dia_semana = fields.Selection(DIAS_SEMANA, string='Día', required=True, default='todos')
+    hora_inicio = fields.Float(string='Desde', required=True)
+    hora_fin = fields.Float(string='Hasta', required=True)
+    precio = fields.Float(string='Precio por Hora', required=True)
+
+    @api.constrains('hora_inicio', 'hora_fin', 'precio')
+    def _check_franja(self):
+        for record in self:
+            if record.hora_inicio < HORA_APERTURA or record.hora_fin > HORA_CIERRE:
+                raise ValidationError('Las tarifas deben estar entre las %s:00 y las %s:00'
+                                      % (HORA_APERTURA, HORA_CIERRE))
+            if record.hora_inicio >= record.hora_fin:
+                raise ValidationError('La hora de inicio de la tarifa debe ser menor a la hora de fin')
+            if (record.hora_inicio * 2) % 1 or (record.hora_fin * 2) % 1:
+                raise ValidationError('Las tarifas van en horas o medias horas')
+            if record.precio < 0:
+                raise ValidationError('El precio no puede ser negativo')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        tarifas = super(ReservaTarifa, self).create(vals_list)
+        tarifas.cancha_id._repreciar()
+        return tarifas
+
+    def write(self, vals):
+        canchas = self.cancha_id
+        res = super(ReservaTarifa, self).write(vals)
+        (canchas | self.cancha_id)._repreciar()
+        return res
+
+    def unlink(self):
+        canchas = self.cancha_id
+        res = super(ReservaTarifa, self).unlink()
+        canchas._repreciar()
+        return res
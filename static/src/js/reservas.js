@@ -7,38 +7,46 @@ odoo.define('reserva_canchas.reservas', function (require) {
 
     var _t = core._t;
 
-    // Widget para filtrado de canchas
-    publicWidget.registry.CanchasFiltro = publicWidget.Widget.extend({
-        selector: '#canchas-grid',
-        events: {
-            'click .btn-outline-primary': '_onFilterClick',
-        },
+    // Días de disponibilidad que se precargan en el detalle de una cancha
+    var DIAS_PRECARGA = 14;
 
-        start: function () {
-            this._super.apply(this, arguments);
-            this.canchas = this.$el.find('.cancha-item');
+    // Notificaciones del bus con las horas ocupadas que cambiaron
+    var NOTIFICACION_OCUPACION = 'reserva_canchas/ocupacion';
+
+    // Widget para cargar más canchas del catálogo (el filtrado lo hace el servidor)
+    publicWidget.registry.CanchasCatalogo = publicWidget.Widget.extend({
+        selector: '#wrap',
+        events: {
+            'click #btn_mas_canchas': '_onMasClick',
         },
 
-        _onFilterClick: function (ev) {
+        _onMasClick: function (ev) {
             ev.preventDefault();
+            var self = this;
             var $button = $(ev.currentTarget);
-            var filter = $button.data('filter');
-
-            $button.siblings().removeClass('active');
-            $button.addClass('active');
-
-            if (filter === 'all') {
-                this.canchas.fadeIn();
-            } else {
-                this.canchas.each((i, el) => {
-                    var $cancha = $(el);
-                    if ($cancha.data('deporte') === filter) {
-                        $cancha.fadeIn();
-                    } else {
-                        $cancha.fadeOut();
-                    }
-                });
+            if ($button.hasClass('disabled')) {
+                return;
             }
+            // Se conservan los filtros de la URL y se avanza el cursor
+            var params = {};
+            new URLSearchParams(window.location.search).forEach(function (valor, clave) {
+                params[clave] = valor;
+            });
+            params.despues = $button.data('despues');
+
+            $button.addClass('disabled');
+            ajax.jsonRpc('/reservas/canchas/mas', 'call', params).then(function (result) {
+                if (result.error) {
+                    $button.removeClass('disabled');
+                    return;
+                }
+                self.$('#canchas-grid').append(result.html);
+                if (result.siguiente) {
+                    $button.data('despues', result.siguiente).removeClass('disabled');
+                } else {
+                    $button.closest('.row').remove();
+                }
+            });
         },
     });
 
@@ -54,9 +62,60 @@ odoo.define('reserva_canchas.reservas', function (require) {
         start: function () {
             this._super.apply(this, arguments);
             this.horariosSeleccionados = [];
+            // Grilla precargada: {fecha: máscara de horas ocupadas}
+            this.ocupacion = {};
+            // Días pedidos sueltos, fuera de la precarga: {fecha: {etag, ocupadas, precios}}
+            this.dias = {};
             
             if ($('#fecha_reserva').length && typeof cancha_id !== 'undefined') {
                 this._cargarHorarios();
+                // Las reservas de otros clientes llegan por el bus y se aplican sobre la grilla
+                this.call('bus_service', 'addChannel', 'reserva_canchas.cancha_' + cancha_id);
+                this.call('bus_service', 'addEventListener', 'notification', this._onNotificacion.bind(this));
+            }
+        },
+
+        _onNotificacion: function (ev) {
+            var self = this;
+            ev.detail.forEach(function (notificacion) {
+                if (notificacion.type !== NOTIFICACION_OCUPACION || notificacion.payload.cancha_id !== cancha_id) {
+                    return;
+                }
+                _.each(notificacion.payload.ocupadas, function (ocupadas, fecha) {
+                    // Solo se parchean los días ya cargados; el resto llega fresco al pedirlo
+                    if (!(fecha in self.ocupacion)) {
+                        return;
+                    }
+                    self.ocupacion[fecha] = ocupadas;
+                    if (fecha === $('#fecha_reserva').val()) {
+                        self._actualizarHorarios(ocupadas);
+                    }
+                });
+            });
+        },
+
+        _actualizarHorarios: function (ocupadas) {
+            var self = this;
+            var perdidos = false;
+            this._horariosDesdeMascara(ocupadas, this._preciosDia($('#fecha_reserva').val())).forEach(function (horario) {
+                var $slot = $('#horarios_disponibles .horario-slot[data-hora="' + horario.hora + '"]');
+                if ($slot.hasClass('disponible') === horario.disponible) {
+                    return;
+                }
+                if ($slot.hasClass('seleccionado')) {
+                    self.horariosSeleccionados = self.horariosSeleccionados.filter(h => h !== horario.hora);
+                    perdidos = true;
+                }
+                $slot.removeClass('disponible ocupado seleccionado')
+                    .addClass(horario.disponible ? 'disponible' : 'ocupado')
+                    .html(self._contenidoHorario(horario));
+            });
+            if (perdidos) {
+                // La selección tiene que seguir siendo consecutiva
+                this.horariosSeleccionados = [];
+                $('#horarios_disponibles .horario-slot.seleccionado').removeClass('seleccionado');
+                this._actualizarSeleccion();
+                alert(_t('Uno de los horarios que elegiste acaba de ser reservado'));
             }
         },
 
@@ -75,6 +134,19 @@ odoo.define('reserva_canchas.reservas', function (require) {
                 return;
             }
 
+            // Fecha ya precargada: se muestra al instante y se revalida con su
+            // ETag, por si se perdió algún aviso del bus
+            if (fecha in this.ocupacion) {
+                this._renderHorarios(this._horariosDesdeMascara(this.ocupacion[fecha], this._preciosDia(fecha)));
+                this._cargarDia(fecha, true);
+                return;
+            }
+            // Con la precarga hecha, los demás días se piden de a uno y se revalidan con su ETag
+            if (this.precios !== undefined) {
+                this._cargarDia(fecha);
+                return;
+            }
+
             $('#horarios_disponibles').html(
                 '<div class="text-center py-4">' +
                 '<div class="spinner-border text-primary" role="status"></div>' +
@@ -82,17 +154,18 @@ odoo.define('reserva_canchas.reservas', function (require) {
                 '</div>'
             );
 
-            // Llamada AJAX corregida
+            // Una sola llamada trae los próximos DIAS_PRECARGA días
             $.ajax({
-                url: '/reservas/disponibilidad',
+                url: '/reservas/disponibilidad/rango',
                 type: 'POST',
                 dataType: 'json',
                 data: JSON.stringify({
                     jsonrpc: '2.0',
                     method: 'call',
                     params: {
-                        cancha_id: cancha_id,
-                        fecha: fecha
+                        cancha_ids: [cancha_id],
+                        fecha_desde: fecha,
+                        dias: DIAS_PRECARGA
                     }
                 }),
                 contentType: 'application/json',
@@ -101,13 +174,21 @@ odoo.define('reserva_canchas.reservas', function (require) {
                     'X-CSRF-Token': $('input[name="csrf_token"]').val() || $('input[name="__o_csrf"]').val()
                 },
                 success: function(response) {
-                    if (response.result && response.result.horarios) {
-                        self._renderHorarios(response.result.horarios);
-                    } else if (response.error) {
+                    var result = response.result;
+                    if (result && !result.error && result.canchas[cancha_id]) {
+                        self.horaApertura = result.hora_apertura;
+                        self.horaCierre = result.hora_cierre;
+                        self.precios = result.canchas[cancha_id].precios;
+                        result.fechas.forEach(function (f, i) {
+                            self.ocupacion[f] = result.canchas[cancha_id].ocupadas[i];
+                        });
+                        self._renderHorarios(self._horariosDesdeMascara(self.ocupacion[fecha], self._preciosDia(fecha)));
+                    } else {
+                        var error = response.error || (result && result.error) || 'Cancha no disponible';
                         $('#horarios_disponibles').html(
                             '<div class="alert alert-warning">' +
                             '<i class="fa fa-exclamation-triangle"></i> ' + 
-                            (response.error.message || response.error) +
+                            (error.message || error) +
                             '</div>'
                         );
                     }
@@ -124,22 +205,104 @@ odoo.define('reserva_canchas.reservas', function (require) {
             });
         },
 
+        _cargarDia: function (fecha, precargado) {
+            var self = this;
+            var enCache = this.dias[fecha];
+            $.ajax({
+                url: '/reservas/disponibilidad/' + cancha_id + '/' + fecha,
+                type: 'GET',
+                dataType: 'json',
+                timeout: 5000,
+                headers: enCache ? {'If-None-Match': enCache.etag} : {},
+                success: function (datos, status, xhr) {
+                    // 304: el día no cambió desde la última vez
+                    if (xhr.status !== 304) {
+                        enCache = self.dias[fecha] = {
+                            etag: xhr.getResponseHeader('ETag'),
+                            error: datos.error,
+                            ocupadas: datos.ocupadas,
+                            precios: datos.precios,
+                        };
+                        if (precargado && !enCache.error) {
+                            // Se corrige la grilla sin perder la selección si el horario elegido sigue libre
+                            self.ocupacion[fecha] = enCache.ocupadas;
+                            if (fecha === $('#fecha_reserva').val()) {
+                                self._actualizarHorarios(enCache.ocupadas);
+                            }
+                        }
+                    }
+                    if (precargado || fecha !== $('#fecha_reserva').val()) {
+                        return;
+                    }
+                    if (enCache.error) {
+                        $('#horarios_disponibles').html(
+                            '<div class="alert alert-warning">' +
+                            '<i class="fa fa-exclamation-triangle"></i> ' + enCache.error +
+                            '</div>'
+                        );
+                        return;
+                    }
+                    self._renderHorarios(self._horariosDesdeMascara(enCache.ocupadas, enCache.precios));
+                },
+                error: function (xhr, status, error) {
+                    console.error('Error:', error);
+                    if (precargado) {
+                        // Queda a la vista la grilla precargada
+                        return;
+                    }
+                    $('#horarios_disponibles').html(
+                        '<div class="alert alert-danger">' +
+                        '<i class="fa fa-exclamation-triangle"></i> ' +
+                        'Error al cargar horarios. Por favor, intenta de nuevo.' +
+                        '</div>'
+                    );
+                }
+            });
+        },
+
+        // Precios por hora de la semana de la cancha: lunes = 0, como en el servidor
+        _preciosDia: function (fecha) {
+            return this.precios[(new Date(fecha + 'T00:00:00').getDay() + 6) % 7];
+        },
+
+        _horariosDesdeMascara: function (ocupadas, precios) {
+            var horarios = [];
+            for (var hora = this.horaApertura; hora < this.horaCierre; hora++) {
+                horarios.push({
+                    hora: hora,
+                    disponible: !(ocupadas & (1 << (hora - this.horaApertura))),
+                    precio: precios[hora - this.horaApertura]
+                });
+            }
+            return horarios;
+        },
+
+        _contenidoHorario: function (horario) {
+            var horaStr = horario.hora < 10 ? '0' + horario.hora : horario.hora;
+            var html = '<span class="hora">' + horaStr + ':00</span>';
+            if (horario.disponible) {
+                html += '<span class="precio">S/ ' + horario.precio.toFixed(2) + '</span>';
+            } else {
+                html += '<span class="text-danger"><small>Ocupado</small></span>';
+            }
+            return html;
+        },
+
         _renderHorarios: function (horarios) {
+            var self = this;
+            // Precio de cada hora del día mostrado, para el total de la selección
+            this.preciosHora = {};
+            horarios.forEach(function (horario) {
+                self.preciosHora[horario.hora] = horario.precio;
+            });
             var html = '<div class="horarios-grid">';
             
             horarios.forEach(function (horario) {
                 var clases = 'horario-slot ';
                 clases += horario.disponible ? 'disponible' : 'ocupado';
                 
-                var horaStr = horario.hora < 10 ? '0' + horario.hora : horario.hora;
-                
                 html += '<div class="' + clases + '" data-hora="' + horario.hora + '">';
-                html += '<span class="hora">' + horaStr + ':00</span>';
-                if (horario.disponible) {
-                    html += '<span class="precio">S/ ' + horario.precio.toFixed(2) + '</span>';
-                } else {
-                    html += '<span class="text-danger"><small>Ocupado</small></span>';
-                }
+                html += self._contenidoHorario(horario);
                 html += '</div>';
             });
             
@@ -183,7 +346,10 @@ odoo.define('reserva_canchas.reservas', function (require) {
             var horaInicio = Math.min(...this.horariosSeleccionados);
             var horaFin = Math.max(...this.horariosSeleccionados) + 1;
             var duracion = this.horariosSeleccionados.length;
-            var total = duracion * (typeof precio_hora !== 'undefined' ? precio_hora : 0);
+            var self = this;
+            var total = this.horariosSeleccionados.reduce(function (suma, hora) {
+                return suma + (self.preciosHora[hora] || 0);
+            }, 0);
 
             var fecha = $('#fecha_reserva').val();
             var fechaObj = new Date(fecha + 'T00:00:00');
@@ -230,6 +396,9 @@ odoo.define('reserva_canchas.reservas', function (require) {
         if (!this.checkValidity()) {
             e.preventDefault();
             e.stopPropagation();
+        } else {
+            // Evita dobles envíos; el servidor igualmente deduplica por token
+            $(this).find('button[type="submit"]').prop('disabled', true);
         }
         $(this).addClass('was-validated');
     });
@@ -243,7 +412,7 @@ odoo.define('reserva_canchas.reservas', function (require) {
     $('[data-toggle="tooltip"]').tooltip();
 
     return {
-        CanchasFiltro: publicWidget.registry.CanchasFiltro,
+        CanchasCatalogo: publicWidget.registry.CanchasCatalogo,
         DisponibilidadHorarios: publicWidget.registry.DisponibilidadHorarios,
     };
 });
@@ -0,0 +1,3 @@
+from . import test_reserva
+from . import test_consultas
+from . import test_controladores
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests.common import TransactionCase, new_test_user
+
+
+class ReservaCanchasDatos:
+    """Datos y utilidades comunes a las pruebas del módulo"""
+
+    @classmethod
+    def _preparar_datos(cls):
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True))
+        cls.hoy = fields.Date.today()
+        # Días libres para reservas nuevas, lejos de cualquier dato existente
+        cls._proximo_dia = cls.hoy + timedelta(days=400)
+        cls._proximo_dni = 0
+
+        cls.cancha = cls._crear_canchas(1)
+        cls.cliente = cls._crear_clientes(1)
+
+        cls.usuario_portal = new_test_user(cls.env, login='portal_reservas', groups='base.group_portal')
+        cls.cliente_portal = cls._crear_clientes(1, partner_id=cls.usuario_portal.partner_id.id)
+        cls.usuario_admin = new_test_user(
+            cls.env, login='admin_reservas',
+            groups='base.group_user,reserva_canchas.group_reserva_admin')
+
+    @classmethod
+    def _crear_canchas(cls, cantidad, **vals):
+        return cls.env['reserva.cancha'].create([dict({
+            'name': 'Cancha Prueba %s' % i,
+            'tipo_deporte': 'futbol',
+            'tipo_superficie': 'cesped_sintetico',
+            'precio_hora': 50.0,
+        }, **vals) for i in range(cantidad)])
+
+    @classmethod
+    def _crear_clientes(cls, cantidad, **vals):
+        clientes = []
+        for _i in range(cantidad):
+            cls._proximo_dni += 1
+            clientes.append(dict({
+                'name': 'Cliente Prueba %s' % cls._proximo_dni,
+                'dni': 'PRUEBA%06d' % cls._proximo_dni,
+                'telefono': '999000%03d' % cls._proximo_dni,
+            }, **vals))
+        return cls.env['reserva.cliente'].create(clientes)
+
+    @classmethod
+    def _dias_libres(cls, cantidad):
+        dias = [cls._proximo_dia + timedelta(days=i) for i in range(cantidad)]
+        cls._proximo_dia += timedelta(days=cantidad)
+        return dias
+
+    @classmethod
+    def _vals_reservas(cls, cantidad, cancha=None, cliente=None, **vals):
+        """Una reserva de 18:00 a 19:00 por día, en días que nadie ha usado"""
+        return [dict({
+            'cancha_id': (cancha or cls.cancha).id,
+            'cliente_id': (cliente or cls.cliente).id,
+            'fecha': dia,
+            'hora_inicio': 18.0,
+            'hora_fin': 19.0,
+            'estado': 'confirmada',
+        }, **vals) for dia in cls._dias_libres(cantidad)]
+
+    @classmethod
+    def _crear_reservas(cls, cantidad, **vals):
+        return cls.env['reserva.reserva'].create(cls._vals_reservas(cantidad, **vals))
+
+    def _consultas(self, funcion):
+        """Número de consultas SQL que hace `funcion`, partiendo de cachés vacías"""
+        self.env.flush_all()
+        self.env.invalidate_all()
+        antes = self.cr.sql_log_count
+        funcion()
+        self.env.flush_all()
+        return self.cr.sql_log_count - antes
+
+    def assertConsultasConstantes(self, funcion, calentamiento, pocos, muchos, presupuesto):
+        """`funcion` sobre pocos y sobre muchos registros debe hacer las mismas
+        consultas, y no más que el presupuesto. La primera llamada, sobre
+        `calentamiento`, llena las cachés del registro (plantillas, secuencias...)"""
+        funcion(calentamiento)
+        con_pocos = self._consultas(lambda: funcion(pocos))
+        con_muchos = self._consultas(lambda: funcion(muchos))
+        self.assertEqual(con_pocos, con_muchos,
+                         'El número de consultas crece con los datos: %s -> %s' % (con_pocos, con_muchos))
+        self.assertLessEqual(con_muchos, presupuesto, 'Presupuesto de consultas superado')
+
+
+class ReservaCanchasCase(ReservaCanchasDatos, TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._preparar_datos()
@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from odoo.tests import tagged
+
+from .common import ReservaCanchasCase
+
+
+@tagged('post_install', '-at_install')
+class TestConsultas(ReservaCanchasCase):
+    """Presupuestos de consultas SQL de los cálculos y operaciones por lote:
+    1 y 100 registros deben costar las mismas consultas"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.canchas = cls._crear_canchas(100)
+        cls.clientes = cls._crear_clientes(100)
+        for cancha, cliente in zip(cls.canchas, cls.clientes):
+            cls._crear_reservas(2, cancha=cancha, cliente=cliente)
+
+    def test_disponibilidad_hoy(self):
+        self.assertConsultasConstantes(
+            lambda canchas: canchas._compute_disponibilidad_hoy(),
+            self.canchas[:1], self.canchas[:1], self.canchas, presupuesto=3)
+
+    def test_contadores_cancha(self):
+        self.assertConsultasConstantes(
+            lambda canchas: canchas._compute_contadores(),
+            self.canchas[:1], self.canchas[:1], self.canchas, presupuesto=6)
+
+    def test_contadores_cliente(self):
+        self.assertConsultasConstantes(
+            lambda clientes: clientes._compute_contadores(),
+            self.clientes[:1], self.clientes[:1], self.clientes, presupuesto=8)
+
+    def test_crear_reservas(self):
+        self.assertConsultasConstantes(
+            self.env['reserva.reserva'].create,
+            self._vals_reservas(1), self._vals_reservas(1), self._vals_reservas(100), presupuesto=40)
+
+    def test_crear_canchas(self):
+        self.assertConsultasConstantes(
+            self._crear_canchas, 1, 1, 100, presupuesto=25)
+
+    def test_cambiar_estado(self):
+        reservas = self._crear_reservas(102)
+        self.assertConsultasConstantes(
+            lambda registros: registros.write({'estado': 'cancelada'}),
+            reservas[0], reservas[1], reservas[2:], presupuesto=35)
+
+    def test_repreciar(self):
+        precios = iter(range(60, 70))
+        self.assertConsultasConstantes(
+            lambda canchas: canchas.write({'precio_hora': next(precios)}),
+            self.canchas[:1], self.canchas[1], self.canchas[2:], presupuesto=25)
+
+    def test_cron_avanzar_estados(self):
+        Reserva = self.env['reserva.reserva'].with_context(reserva_historico=True)
+        ayer = self.hoy - timedelta(days=1)
+
+        def crear_vencidas(cantidad):
+            Reserva.create([{
+                'cancha_id': self.canchas[i % 100].id,
+                'cliente_id': self.cliente.id,
+                'fecha': ayer,
+                'hora_inicio': 6.0 + i // 100,
+                'hora_fin': 7.0 + i // 100,
+                'estado': 'confirmada',
+            } for i in range(cantidad)])
+
+        # Las vencidas dejan de estar activas al avanzar, así que sus franjas se pueden reutilizar
+        crear_vencidas(1)
+        Reserva._cron_avanzar_estados()
+        crear_vencidas(1)
+        con_una = self._consultas(Reserva._cron_avanzar_estados)
+        crear_vencidas(100)
+        con_cien = self._consultas(Reserva._cron_avanzar_estados)
+        self.assertEqual(con_una, con_cien)
+        self.assertLessEqual(con_cien, 40)
@@ -0,0 +1,206 @@
+import csv
+import io
+import json
+import re
+from datetime import timedelta
+
+from odoo import http
+from odoo.tests import HttpCase, tagged
+
+from .common import ReservaCanchasDatos
+
+# Consultas SQL máximas por petición, con las cachés del registro ya calientes
+PRESUPUESTOS = {
+    '/reservas': 45,
+    '/reservas/canchas/mas': 30,
+    '/reservas/cancha': 35,
+    '/reservas/disponibilidad': 15,
+    '/reservas/disponibilidad/rango': 15,
+    '/reservas/crear': 40,
+    '/reservas/confirmar': 45,
+    '/mis-reservas': 45,
+    '/reservas/dashboard': 45,
+    '/reservas/calendario': 15,
+}
+
+
+@tagged('post_install', '-at_install')
+class TestControladores(ReservaCanchasDatos, HttpCase):
+    """Cada ruta hace las mismas consultas con pocos y con muchos datos"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._preparar_datos()
+        cls._crear_reservas(2, cliente=cls.cliente_portal)
+
+    def _mas_datos(self):
+        """Más canchas, clientes y reservas (también del cliente del portal y pasadas)"""
+        canchas = self._crear_canchas(30)
+        for cancha in canchas:
+            self._crear_reservas(3, cancha=cancha, cliente=self.cliente_portal)
+        Reserva = self.env['reserva.reserva'].with_context(reserva_historico=True)
+        Reserva.create([dict(vals, fecha=self.hoy - timedelta(days=10), estado='completada')
+                        for vals in self._vals_reservas(30, cliente=self.cliente_portal)])
+        self._crear_clientes(30)
+
+    def assertRutaConstante(self, ruta, peticion):
+        """`peticion()` hace una petición a `ruta`: la misma cantidad de
+        consultas antes y después de multiplicar los datos"""
+        peticion()  # calentamiento: compila plantillas y llena cachés
+        con_pocos = self._consultas(peticion)
+        self._mas_datos()
+        con_muchos = self._consultas(peticion)
+        self.assertEqual(con_pocos, con_muchos,
+                         '%s: el número de consultas crece con los datos: %s -> %s' % (ruta, con_pocos, con_muchos))
+        self.assertLessEqual(con_muchos, PRESUPUESTOS[ruta], '%s: presupuesto de consultas superado' % ruta)
+
+    def _json(self, ruta, params):
+        respuesta = self.url_open(ruta, data=json.dumps({'jsonrpc': '2.0', 'method': 'call', 'params': params}),
+                                  headers={'Content-Type': 'application/json'})
+        self.assertEqual(respuesta.status_code, 200)
+        resultado = respuesta.json()['result']
+        self.assertFalse(resultado.get('error'))
+        return resultado
+
+    def _get(self, ruta):
+        respuesta = self.url_open(ruta)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_catalogo(self):
+        self.assertRutaConstante('/reservas', lambda: self._get('/reservas'))
+
+    def test_catalogo_mas(self):
+        self.assertRutaConstante('/reservas/canchas/mas', lambda: self._json('/reservas/canchas/mas', {}))
+
+    def test_detalle_cancha(self):
+        self.assertRutaConstante('/reservas/cancha', lambda: self._get('/reservas/cancha/%s' % self.cancha.id))
+
+    def test_disponibilidad(self):
+        fecha = str(self.hoy + timedelta(days=1))
+        self.assertRutaConstante('/reservas/disponibilidad', lambda: self._json(
+            '/reservas/disponibilidad', {'cancha_id': self.cancha.id, 'fecha': fecha}))
+
+    def test_disponibilidad_dia_condicional(self):
+        fecha = self._dias_libres(1)[0]
+        ruta = '/reservas/disponibilidad/%s/%s' % (self.cancha.id, fecha)
+        respuesta = self._get(ruta)
+        etag = respuesta.headers['ETag']
+        self.assertEqual(respuesta.json()['ocupadas'], 0)
+        self.assertEqual(self.url_open(ruta, headers={'If-None-Match': etag}).status_code, 304)
+
+        self.env['reserva.reserva'].create(self._vals_reservas(1)[0] | {'fecha': fecha})
+        respuesta = self.url_open(ruta, headers={'If-None-Match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta.json()['ocupadas'], 0)
+
+    def test_disponibilidad_rango(self):
+        fecha = str(self.hoy)
+        self.assertRutaConstante('/reservas/disponibilidad/rango', lambda: self._json(
+            '/reservas/disponibilidad/rango', {'fecha_desde': fecha, 'dias': 14}))
+
+    def test_crear(self):
+        self.authenticate('portal_reservas', 'portal_reservas')
+        self.assertRutaConstante('/reservas/crear', lambda: self._get('/reservas/crear?cancha_id=%s' % self.cancha.id))
+
+    def test_confirmar(self):
+        self.authenticate('portal_reservas', 'portal_reservas')
+        dias = iter(self._dias_libres(3))
+
+        def confirmar():
+            respuesta = self.url_open('/reservas/confirmar', data={
+                'csrf_token': http.Request.csrf_token(self),
+                'cancha_id': self.cancha.id,
+                'fecha': str(next(dias)),
+                'hora_inicio': 18.0,
+                'hora_fin': 19.0,
+                'telefono': '999000000',
+            }, allow_redirects=False)
+            self.assertIn('/reservas/confirmacion/', respuesta.headers.get('Location', ''))
+
+        self.assertRutaConstante('/reservas/confirmar', confirmar)
+
+    def test_mis_reservas(self):
+        self.authenticate('portal_reservas', 'portal_reservas')
+        self.assertRutaConstante('/mis-reservas', lambda: self._get('/mis-reservas'))
+
+    def test_mis_reservas_paginas(self):
+        """El historial se recorre por páginas sin repetir ni saltar reservas"""
+        Reserva = self.env['reserva.reserva'].with_context(reserva_historico=True)
+        pasadas = Reserva.create([dict(vals, fecha=self.hoy - timedelta(days=5), estado='completada')
+                                  for vals in self._vals_reservas(25, cliente=self.cliente_portal)])
+        self.authenticate('portal_reservas', 'portal_reservas')
+        vistas, ruta = [], '/mis-reservas?tab=pasadas'
+        while ruta:
+            html = self._get(ruta).text
+            vistas += [nombre for nombre in pasadas.mapped('name') if '>%s<' % nombre in html]
+            cursor = re.search(r'pasadas_antes=([\d-]+_\d+)', html)
+            ruta = cursor and '/mis-reservas?tab=pasadas&pasadas_antes=%s' % cursor.group(1)
+        self.assertEqual(sorted(vistas), sorted(pasadas.mapped('name')))
+
+    def test_dashboard(self):
+        self.authenticate('admin_reservas', 'admin_reservas')
+        self.assertRutaConstante('/reservas/dashboard', lambda: self._get('/reservas/dashboard'))
+
+    def test_exportar(self):
+        """La exportación incluye las reservas vivas y las archivadas, y es solo para administradores"""
+        Reserva = self.env['reserva.reserva'].with_context(reserva_historico=True)
+        pasadas = Reserva.create([dict(vals, fecha=self.hoy - timedelta(days=40), estado='completada')
+                                  for vals in self._vals_reservas(3)])
+        archivadas = pasadas.mapped('name')
+        self.env['ir.config_parameter'].set_param('reserva_canchas.dias_archivo', 30)
+        self.env['reserva.reserva.historico']._cron_archivar()
+        # Un nombre que una hoja de cálculo tomaría como fórmula
+        formula = self._crear_clientes(1, name='=1+1')
+        self.env['reserva.reserva'].create(dict(self._vals_reservas(1, cancha=self._crear_canchas(1), cliente=formula)[0],
+                                                fecha=self.hoy + timedelta(days=5)))
+        desde, hasta = self.hoy - timedelta(days=60), self.hoy + timedelta(days=60)
+        ruta = '/reservas/exportar?desde=%s&hasta=%s' % (desde, hasta)
+
+        self.authenticate('portal_reservas', 'portal_reservas')
+        self.assertEqual(self.url_open(ruta).status_code, 404)
+
+        self.authenticate('admin_reservas', 'admin_reservas')
+        filas = list(csv.reader(io.StringIO(self._get(ruta).content.decode('utf-8-sig'))))
+        numeros = [fila[0] for fila in filas[1:]]
+        esperadas = self.env['reserva.reserva'].search([('fecha', '>=', desde), ('fecha', '<=', hasta)])
+        self.assertEqual(sorted(numeros), sorted(esperadas.mapped('name') + archivadas))
+        self.assertEqual(len(filas[0]), len(filas[1]))
+        self.assertIn("'=1+1", [fila[7] for fila in filas])
+
+    def test_calendario(self):
+        ruta = '/reservas/calendario/cliente/%s.ics' % self.cliente_portal.token_calendario
+        self.assertRutaConstante('/reservas/calendario', lambda: self._get(ruta))
+
+    def test_calendario_condicional(self):
+        """304 mientras no cambie nada; la reserva cancelada sale del calendario"""
+        cancha = self._crear_canchas(1)
+        reserva = self.env['reserva.reserva'].create(
+            self._vals_reservas(1, cancha=cancha)[0] | {'fecha': self.hoy + timedelta(days=3)})
+        ruta = '/reservas/calendario/cancha/%s.ics' % cancha.token_calendario
+        respuesta = self._get(ruta)
+        self.assertIn('UID:%s-' % reserva.name, respuesta.text)
+        etag, modificado = respuesta.headers['ETag'], respuesta.headers['Last-Modified']
+        self.assertEqual(self.url_open(ruta, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.url_open(ruta, headers={'If-Modified-Since': modificado}).status_code, 304)
+
+        # El nombre del cliente sale en el evento: renombrarlo cambia el ETag.
+        # Todo el test corre en una transacción, así que la fecha se adelanta a mano
+        reserva.cliente_id.name = 'Cliente Renombrado'
+        self.env.flush_all()
+        self.env.cr.execute("UPDATE reserva_cliente SET write_date = write_date + interval '1 minute' WHERE id = %s",
+                            [reserva.cliente_id.id])
+        respuesta = self.url_open(ruta, headers={'If-None-Match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('Cliente Renombrado', respuesta.text)
+        etag = respuesta.headers['ETag']
+
+        reserva.action_cancelar()
+        respuesta = self.url_open(ruta, headers={'If-None-Match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn(reserva.name, respuesta.text)
+
+        cancha.action_regenerar_token()
+        self.assertEqual(self.url_open(ruta).status_code, 404)
+        self.assertEqual(self.url_open('/reservas/calendario/cancha/%s.ics' % cancha.token_calendario).status_code, 200)
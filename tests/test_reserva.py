@@ -0,0 +1,409 @@
+import base64
+import json
+import os
+from datetime import datetime, time, timedelta
+from unittest.mock import patch
+
+import pytz
+
+from odoo import fields
+from odoo.exceptions import AccessError, ValidationError
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+from odoo.tests import tagged
+
+from odoo.addons.reserva_canchas.models.reserva import ConflictoConcurrente, ahora_sede
+from odoo.addons.reserva_canchas.models.disponibilidad_cache import CacheDisponibilidad, cache_disponibilidad
+from odoo.addons.reserva_canchas.models.reserva_ocupacion import horas_ocupadas, mascara_franjas
+from odoo.addons.reserva_canchas.models.reserva_recurrencia import MAX_OCURRENCIAS
+from .common import ReservaCanchasCase
+
+
+@tagged('post_install', '-at_install')
+class TestReserva(ReservaCanchasCase):
+
+    def test_codigos_de_cancha_por_lote(self):
+        canchas = self._crear_canchas(3)
+        codigos = canchas.mapped('codigo')
+        self.assertEqual(len(set(codigos)), 3)
+        self.assertTrue(all(codigo.startswith('CANCHA-') for codigo in codigos))
+
+    def test_monto_total(self):
+        reserva = self._crear_reservas(1, hora_inicio=18.0, hora_fin=20.0)
+        self.assertEqual(reserva.duracion, 2.0)
+        self.assertEqual(reserva.monto_total, 100.0)
+        self.assertTrue(reserva.name.startswith('RES-'))
+
+    def test_tarifas(self):
+        reserva = self._crear_reservas(1, hora_inicio=18.0, hora_fin=20.0)
+        pasada = self.env['reserva.reserva'].with_context(reserva_historico=True).create(
+            dict(self._vals_reservas(1)[0], fecha=self.hoy - timedelta(days=7), estado='completada'))
+        # Hora punta de 19:00 a 21:00 el día de la reserva
+        self.env['reserva.tarifa'].create({
+            'cancha_id': self.cancha.id,
+            'dia_semana': str(reserva.fecha.weekday()),
+            'hora_inicio': 19.0,
+            'hora_fin': 21.0,
+            'precio': 80.0,
+        })
+        self.assertEqual(reserva.monto_total, 130.0)
+        self.assertEqual(pasada.monto_total, 50.0)
+        nueva = self.env['reserva.reserva'].create(dict(self._vals_reservas(1)[0], fecha=reserva.fecha,
+                                                        hora_inicio=20.5, hora_fin=21.5))
+        self.assertEqual(nueva.monto_total, 65.0)
+
+        self.cancha.precio_hora = 60.0
+        self.assertEqual(reserva.monto_total, 140.0)
+        self.assertEqual(pasada.monto_total, 50.0)
+        # Los agregados siguen el repreciado
+        contadores = self.cancha.read(['ingresos_total'])
+        self.cancha._compute_contadores()
+        self.assertEqual(contadores, self.cancha.read(['ingresos_total']))
+
+    def test_horarios_invalidos(self):
+        with self.assertRaises(ValidationError):
+            self._crear_reservas(1, hora_inicio=20.0, hora_fin=19.0)
+        with self.assertRaises(ValidationError):
+            self._crear_reservas(1, hora_inicio=22.0, hora_fin=24.0)
+        with self.assertRaises(ValidationError):
+            self._crear_reservas(1, hora_inicio=18.0, hora_fin=18.25)
+
+    def test_fecha_pasada(self):
+        vals = self._vals_reservas(1, estado='completada')[0]
+        vals['fecha'] = self.hoy - timedelta(days=3)
+        with self.assertRaises(ValidationError):
+            self.env['reserva.reserva'].create(dict(vals))
+        reserva = self.env['reserva.reserva'].with_context(reserva_historico=True).create(vals)
+        self.assertEqual(reserva.fecha, vals['fecha'])
+
+    def test_solapamiento(self):
+        reserva = self._crear_reservas(1)
+        vals = {
+            'cancha_id': self.cancha.id,
+            'cliente_id': self.cliente.id,
+            'fecha': reserva.fecha,
+            'estado': 'confirmada',
+        }
+        Reserva = self.env['reserva.reserva']
+        with self.assertRaises(ValidationError):
+            Reserva.create(dict(vals, hora_inicio=18.5, hora_fin=19.5))
+        # Contigua y cancelada no chocan
+        Reserva.create(dict(vals, hora_inicio=19.0, hora_fin=20.0))
+        Reserva.create(dict(vals, hora_inicio=18.0, hora_fin=19.0, estado='cancelada'))
+        # Al cancelar se libera la franja
+        reserva.action_cancelar()
+        Reserva.create(dict(vals, hora_inicio=18.0, hora_fin=19.0))
+
+    def test_agregados_por_deltas(self):
+        """Crear, editar y borrar deja las tablas agregadas igual que recalcularlas"""
+        reservas = self._crear_reservas(4)
+        reservas[0].write({'hora_fin': 20.0})
+        reservas[1].action_cancelar()
+        reservas[2].write({'estado': 'completada', 'cancha_id': self._crear_canchas(1).id})
+        reservas[3].unlink()
+
+        fecha = reservas[0].fecha
+        mapa = self.env['reserva.ocupacion']._leer_mapas([(self.cancha.id, fecha)])[(self.cancha.id, fecha)]
+        self.assertEqual(mapa, mascara_franjas(18.0, 20.0))
+
+        Stats = self.env['reserva.stats.daily']
+        campos = ['cancha_id', 'fecha', 'hora', 'estado', 'reservas_count', 'monto_total']
+        por_deltas = sorted(tuple(str(f[c]) for c in campos) for f in Stats.search_read([], campos)
+                            if f['reservas_count'])
+        Stats._reconstruir()
+        recalculadas = sorted(tuple(str(f[c]) for c in campos) for f in Stats.search_read([], campos))
+        self.assertEqual(por_deltas, recalculadas)
+
+        canchas = reservas.mapped('cancha_id')
+        contadores = canchas.read(['reservas_count', 'ingresos_total'])
+        canchas._compute_contadores()
+        self.assertEqual(contadores, canchas.read(['reservas_count', 'ingresos_total']))
+        self.assertEqual(self.cliente.total_reservas, 1)
+
+    def test_ocupacion_por_bus(self):
+        Bus = self.env['bus.bus']
+        canal = '"reserva_canchas.cancha_%s"' % self.cancha.id
+        antes = Bus.search_count([('channel', 'like', canal)])
+        reserva = self._crear_reservas(1)
+        reserva.action_cancelar()
+        mensajes = Bus.search([('channel', 'like', canal)], order='id')[antes:]
+        self.assertEqual(len(mensajes), 2)
+        fecha = str(reserva.fecha)
+        ocupadas = [json.loads(mensaje.message)['payload']['ocupadas'][fecha] for mensaje in mensajes]
+        self.assertEqual(ocupadas, [horas_ocupadas(mascara_franjas(18.0, 19.0)), 0])
+
+    def test_cache_disponibilidad(self):
+        cache = CacheDisponibilidad(tamano=2, ttl=60)
+        cache._pid, cache.escuchando = os.getpid(), True
+        cache.obtener('db', 1, '2030-01-01', lambda: 'a')
+        cache.obtener('db', 2, '2030-01-01', lambda: 'b')
+        self.assertEqual(cache.obtener('db', 1, '2030-01-01', lambda: 'x'), 'a')
+        # La entrada menos usada sale al superar el tamaño
+        cache.obtener('db', 3, '2030-01-01', lambda: 'c')
+        self.assertEqual(cache.obtener('db', 2, '2030-01-01', lambda: 'b2'), 'b2')
+        cache.invalidar('db', canchas=[2])
+        self.assertEqual(cache.obtener('db', 2, '2030-01-01', lambda: 'b3'), 'b3')
+        self.assertEqual(cache.estadisticas()['aciertos'], 1)
+
+        # Una reserva invalida su día en la caché del proceso
+        reserva = self._crear_reservas(1)
+        clave = (self.env.cr.dbname, self.cancha.id, str(reserva.fecha))
+        cache_disponibilidad._entradas[clave] = (float('inf'), {})
+        reserva.action_cancelar()
+        self.assertNotIn(clave, cache_disponibilidad._entradas)
+
+    def test_reservar_desde_portal_idempotente(self):
+        partner = self.usuario_portal.partner_id
+        vals = self._vals_reservas(1)[0]
+        del vals['cliente_id']
+        Reserva = self.env['reserva.reserva']
+        primera = Reserva._reservar_desde_portal(partner, vals, token='token-prueba')
+        segunda = Reserva._reservar_desde_portal(partner, vals, token='token-prueba')
+        self.assertEqual(primera, segunda)
+        self.assertEqual(primera.cliente_id, self.cliente_portal)
+        # El conflicto lanzado desde Python lo reintenta Odoo como uno de PostgreSQL
+        self.assertIn(ConflictoConcurrente('prueba').pgcode, PG_CONCURRENCY_ERRORS_TO_RETRY)
+
+    def test_cliente_de_partner(self):
+        Cliente = self.env['reserva.cliente']
+        # Un NIF igual al DNI de otro cliente no impide crear el del contacto
+        partner = self.env['res.partner'].create({'name': 'Contacto Nuevo', 'phone': '999111222',
+                                                  'vat': self.cliente.dni})
+        self.assertFalse(Cliente._de_partner(partner.id))
+        cliente = Cliente._obtener_o_crear(partner)
+        self.assertEqual(cliente.partner_id, partner)
+        self.assertEqual(cliente.dni, 'PORTAL-%s' % partner.id)
+        self.assertEqual(Cliente._obtener_o_crear(partner), cliente)
+        # La caché se invalida al cambiar el contacto del cliente
+        otro = self.env['res.partner'].create({'name': 'Otro Contacto'})
+        cliente.partner_id = otro
+        self.assertFalse(Cliente._de_partner(partner.id))
+        self.assertEqual(Cliente._de_partner(otro.id), cliente)
+
+    def test_cron_avanzar_estados(self):
+        Reserva = self.env['reserva.reserva'].with_context(reserva_historico=True)
+        ayer = self.hoy - timedelta(days=1)
+        vals = dict(self._vals_reservas(1)[0], fecha=ayer)
+        pagada = Reserva.create(dict(vals, pagado=True))
+        impaga = Reserva.create(dict(vals, hora_inicio=8.0, hora_fin=9.0))
+        en_curso = Reserva.create(dict(vals, hora_inicio=10.0, hora_fin=11.0, estado='en_curso'))
+
+        Reserva._cron_avanzar_estados()
+        self.assertEqual(pagada.estado, 'completada')
+        self.assertEqual(impaga.estado, 'no_asistio')
+        self.assertEqual(en_curso.estado, 'completada')
+        self.assertIn('automáticamente', impaga.message_ids[:1].body)
+
+    def test_ahora_sede(self):
+        self.env['ir.config_parameter'].set_param('reserva_canchas.zona_horaria', 'America/Lima')
+        diferencia = ahora_sede(self.env) - datetime.now(pytz.timezone('America/Lima')).replace(tzinfo=None)
+        self.assertLess(abs(diferencia), timedelta(minutes=1))
+        # Sin parámetro, la de la compañía
+        self.env['ir.config_parameter'].set_param('reserva_canchas.zona_horaria', False)
+        self.env.company.partner_id.tz = 'Asia/Tokyo'
+        diferencia = ahora_sede(self.env) - datetime.now(pytz.timezone('Asia/Tokyo')).replace(tzinfo=None)
+        self.assertLess(abs(diferencia), timedelta(minutes=1))
+
+    def test_auditoria_lote(self):
+        reservas = self._crear_reservas(3)
+        otra_cancha = self._crear_canchas(1)
+        antes = {reserva.id: len(reserva.message_ids) for reserva in reservas}
+        reservas._auditoria_lote('Mudanza de prueba').write({'cancha_id': otra_cancha.id, 'notas': 'x'})
+        for reserva in reservas:
+            self.assertEqual(len(reserva.message_ids), antes[reserva.id] + 1)
+            nota = reserva.message_ids[:1]
+            self.assertIn('Mudanza de prueba', nota.body)
+            self.assertIn(otra_cancha.name, nota.body)
+            self.assertFalse(nota.tracking_value_ids)
+
+    def test_archivo_conserva_agregados(self):
+        Reserva = self.env['reserva.reserva'].with_context(reserva_historico=True)
+        vieja = Reserva.create(dict(self._vals_reservas(1)[0], fecha=self.hoy - timedelta(days=200),
+                                    estado='completada'))
+        reserva_id = vieja.id
+        contadores = self.cancha.read(['reservas_count', 'ingresos_total'])
+
+        self.env['ir.config_parameter'].set_param('reserva_canchas.dias_archivo', 30)
+        self.env['reserva.reserva.historico']._cron_archivar()
+
+        self.assertFalse(self.env['reserva.reserva'].browse(reserva_id).exists())
+        self.assertFalse(self.env['mail.message'].search_count(
+            [('model', '=', 'reserva.reserva'), ('res_id', '=', reserva_id)]))
+        historico = self.env['reserva.reserva.historico'].search([('reserva_id', '=', reserva_id)])
+        self.assertEqual(historico.estado, 'completada')
+        self.assertEqual(contadores, self.cancha.read(['reservas_count', 'ingresos_total']))
+        self.cancha._compute_contadores()
+        self.assertEqual(contadores, self.cancha.read(['reservas_count', 'ingresos_total']))
+
+    def test_cancha_sin_ingresos_publicos(self):
+        publico = self.env.ref('base.public_user')
+        self.assertEqual(self.cancha.with_user(publico).read(['name'])[0]['name'], self.cancha.name)
+        for usuario in (publico, self.usuario_portal):
+            with self.assertRaises(AccessError):
+                self.cancha.with_user(usuario).read(['ingresos_total'])
+            with self.assertRaises(AccessError):
+                self.cancha.with_user(usuario).read(['reservas_count'])
+
+    def test_informe_ocupacion(self):
+        cancha = self._crear_canchas(1)
+        reserva = self._crear_reservas(1, cancha=cancha, hora_inicio=18.0, hora_fin=19.5)
+        # Un no_asistio ocupa la cancha pero no suma ingresos
+        ausente = self.env['reserva.reserva'].create({
+            'cancha_id': cancha.id, 'cliente_id': self.cliente.id, 'fecha': reserva.fecha,
+            'hora_inicio': 21.0, 'hora_fin': 22.0, 'estado': 'confirmada'})
+        ausente.action_no_asistio()
+        self.env['reserva.report.ocupacion']._cron_refrescar()
+        filas = self.env['reserva.report.ocupacion'].search_read(
+            [('cancha_id', '=', cancha.id), ('fecha', '=', reserva.fecha)],
+            ['hora', 'franja', 'horas_reservadas', 'ocupacion', 'ingresos'], order='hora')
+        self.assertEqual(len(filas), 17)
+        por_hora = {fila['hora']: fila for fila in filas}
+        self.assertEqual(por_hora[18]['horas_reservadas'], 1.0)
+        self.assertEqual(por_hora[19]['ocupacion'], 50.0)
+        self.assertEqual(por_hora[19]['franja'], 'noche')
+        self.assertAlmostEqual(sum(fila['ingresos'] for fila in filas), reserva.monto_total)
+        self.assertEqual(por_hora[21]['horas_reservadas'], 1.0)
+        self.assertFalse(por_hora[21]['ingresos'])
+        self.assertFalse(por_hora[6]['horas_reservadas'])
+
+        # Los ids no se mueven al sumar canchas; una cancha en mantenimiento no ofrece horas futuras
+        ids = {fila['id'] for fila in filas}
+        parada = self._crear_canchas(1, estado='mantenimiento')
+        self.env['reserva.report.ocupacion']._cron_refrescar()
+        self.assertEqual(ids, set(self.env['reserva.report.ocupacion'].search(
+            [('cancha_id', '=', cancha.id), ('fecha', '=', reserva.fecha)]).ids))
+        self.assertFalse(self.env['reserva.report.ocupacion'].search_count(
+            [('cancha_id', '=', parada.id), ('fecha', '>=', self.hoy)]))
+
+    def test_recurrencia(self):
+        inicio = self._dias_libres(28)[0]
+        ocupada = self._crear_reservas(1)
+        ocupada.fecha = inicio + timedelta(weeks=2)
+        serie = self.env['reserva.recurrencia'].create({
+            'cliente_id': self.cliente.id,
+            'cancha_id': self.cancha.id,
+            'hora_inicio': 18.0,
+            'hora_fin': 19.0,
+            'fecha_inicio': inicio,
+            'cantidad': 4,
+        })
+        serie.action_generar()
+        self.assertEqual(serie.reservas_count, 3)
+        self.assertIn(str(ocupada.fecha), serie.conflictos)
+
+        serie.write({'hora_inicio': 20.0, 'hora_fin': 21.0})
+        self.assertEqual(set(serie.reserva_ids.mapped('hora_inicio')), {20.0})
+
+        serie.action_cancelar()
+        self.assertEqual(set(serie.reserva_ids.mapped('estado')), {'cancelada'})
+
+    def test_recurrencia_hasta_fecha(self):
+        """Una serie hasta una fecha tiene el mismo tope de reservas que una por cantidad"""
+        vals = {
+            'cliente_id': self.cliente.id,
+            'cancha_id': self.cancha.id,
+            'hora_inicio': 18.0,
+            'hora_fin': 19.0,
+            'fecha_inicio': self.hoy,
+            'tipo_fin': 'fecha',
+        }
+        Recurrencia = self.env['reserva.recurrencia']
+        serie = Recurrencia.create(dict(vals, fecha_fin=self.hoy + timedelta(weeks=MAX_OCURRENCIAS - 1)))
+        self.assertEqual(len(serie._fechas()), MAX_OCURRENCIAS)
+        with self.assertRaises(ValidationError):
+            Recurrencia.create(dict(vals, fecha_fin=self.hoy + timedelta(weeks=MAX_OCURRENCIAS)))
+        with self.assertRaises(ValidationError):
+            Recurrencia.create(dict(vals, fecha_fin=self.hoy, hora_fin=19.25))
+        # Cada dos semanas, la misma fecha final cabe
+        quincenal = Recurrencia.create(dict(vals, frecuencia='quincenal',
+                                            fecha_fin=self.hoy + timedelta(weeks=MAX_OCURRENCIAS)))
+        self.assertEqual(len(quincenal._fechas()), MAX_OCURRENCIAS // 2 + 1)
+
+    def test_lista_espera(self):
+        """Cancelar solo encola el horario; el cron se lo da al primero de la lista que quepa"""
+        Espera = self.env['reserva.espera']
+        Trabajo = self.env['reserva.espera.trabajo']
+        reserva = self._crear_reservas(1)
+        vals = {'cancha_id': self.cancha.id, 'fecha': reserva.fecha, 'hora_inicio': 18.0, 'hora_fin': 19.0}
+        primero, segundo = Espera.create([dict(vals, cliente_id=cliente.id, modo='reservar')
+                                          for cliente in self._crear_clientes(2)])
+        solapado = Espera.create(dict(vals, cliente_id=self.cliente.id, hora_inicio=18.5, hora_fin=19.5))
+
+        reserva.action_cancelar()
+        self.assertEqual(Trabajo.search_count([]), 1)
+        self.assertEqual(primero.estado, 'esperando')
+
+        Trabajo._cron_promover()
+        self.assertFalse(Trabajo.search_count([]))
+        self.assertEqual(primero.estado, 'reservada')
+        self.assertEqual(primero.reserva_id.estado, 'confirmada')
+        self.assertEqual((segundo | solapado).mapped('estado'), ['esperando', 'esperando'])
+
+        primero.reserva_id.action_cancelar()
+        Trabajo._cron_promover()
+        self.assertEqual(segundo.estado, 'reservada')
+
+        # Terminar una reserva no libera su horario
+        segundo.reserva_id.action_completar()
+        self.assertFalse(Trabajo.search_count([]))
+
+    def test_lista_espera_horario_terminado(self):
+        """Un horario de hoy que ya terminó no se promueve"""
+        Espera = self.env['reserva.espera']
+        hoy = ahora_sede(self.env).date()
+        espera = Espera.create({'cancha_id': self.cancha.id, 'fecha': hoy, 'hora_inicio': 18.0, 'hora_fin': 19.0,
+                                'cliente_id': self.cliente.id, 'modo': 'reservar'})
+        trabajo = (self.cancha.id, hoy, 18.0, 19.0)
+        sede = 'odoo.addons.reserva_canchas.models.reserva_espera.ahora_sede'
+        with patch(sede, return_value=datetime.combine(hoy, time(19, 0))):
+            self.assertFalse(Espera._promover([trabajo]))
+        self.assertEqual(espera.estado, 'esperando')
+        with patch(sede, return_value=datetime.combine(hoy, time(17, 30))):
+            self.assertEqual(Espera._promover([trabajo]), espera)
+        self.assertEqual(espera.estado, 'reservada')
+
+    def test_lista_espera_aviso(self):
+        """Se avisa al primero; si no reserva a tiempo, se avisa al siguiente"""
+        Espera = self.env['reserva.espera']
+        Trabajo = self.env['reserva.espera.trabajo']
+        reserva = self._crear_reservas(1)
+        avisos = Espera.create([{
+            'cancha_id': self.cancha.id, 'fecha': reserva.fecha, 'hora_inicio': 18.0, 'hora_fin': 19.0,
+            'cliente_id': cliente.id, 'modo': 'avisar',
+        } for cliente in self._crear_clientes(2)])
+
+        reserva.action_cancelar()
+        Trabajo._cron_promover()
+        self.assertEqual(avisos.mapped('estado'), ['ofrecida', 'esperando'])
+        self.assertFalse(self.env['reserva.reserva'].search_count([
+            ('cancha_id', '=', self.cancha.id), ('fecha', '=', reserva.fecha), ('estado', '=', 'confirmada')]))
+
+        avisos[0].fecha_oferta = fields.Datetime.subtract(fields.Datetime.now(), minutes=31)
+        Trabajo._cron_promover()
+        self.assertEqual(avisos.mapped('estado'), ['vencida', 'ofrecida'])
+
+    def test_importar_reservas(self):
+        dias = self._dias_libres(2)
+        lineas = ['cancha,dni,fecha,hora_inicio,hora_fin']
+        lineas += ['%s,%s,%s,18:00,19:00' % (self.cancha.codigo, self.cliente.dni, dia) for dia in dias]
+        lineas.append('%s,%s,%s,18:30,19:30' % (self.cancha.codigo, self.cliente.dni, dias[0]))
+        lineas.append('NO-EXISTE,%s,%s,18:00,19:00' % (self.cliente.dni, dias[1]))
+        lineas.append('%s,%s,,18:00,19:00' % (self.cancha.codigo, self.cliente.dni))
+        asistente = self.env['reserva.importar'].create({
+            'archivo': base64.b64encode('\n'.join(lineas).encode()),
+            'nombre_archivo': 'reservas.csv',
+        })
+        Reserva = self.env['reserva.reserva']
+        asistente.action_importar()
+        self.assertFalse(Reserva.search_count([('cancha_id', '=', self.cancha.id), ('fecha', 'in', dias)]))
+        self.assertIn('Fila 4', asistente.resumen)
+        self.assertIn('Fila 5', asistente.resumen)
+        self.assertIn('Fila 6: Fecha inválida', asistente.resumen)
+
+        asistente.write({'omitir_errores': True})
+        asistente.action_importar()
+        self.assertEqual(Reserva.search_count([('cancha_id', '=', self.cancha.id), ('fecha', 'in', dias)]), 2)
+
+    def test_secuencia_por_lote(self):
+        nombres = self.env['ir.sequence']._next_by_code_lote('reserva.reserva', 5)
+        numeros = [int(nombre.split('-')[1]) for nombre in nombres]
+        self.assertEqual(numeros, list(range(numeros[0], numeros[0] + 5)))
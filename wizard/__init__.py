@@ -0,0 +1,2 @@
+from . import importar_reservas
+from . import exportar_reservas
@@ -0,0 +1,37 @@
+from urllib.parse import urlencode
+
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+
+
+class ExportarReservas(models.TransientModel):
+    _name = 'reserva.exportar'
+    _description = 'Exportar Reservas'
+
+    desde = fields.Date(string='Desde', required=True,
+                        default=lambda self: fields.Date.context_today(self).replace(day=1))
+    hasta = fields.Date(string='Hasta', required=True, default=fields.Date.context_today)
+    formato = fields.Selection([
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)')
+    ], string='Formato', required=True, default='csv')
+
+    @api.constrains('desde', 'hasta')
+    def _check_fechas(self):
+        for record in self:
+            if record.desde > record.hasta:
+                raise ValidationError('La fecha inicial debe ser anterior a la final')
+
+    def action_exportar(self):
+        """La descarga la hace el controlador, que envía las filas a medida
+        que las lee en lugar de armar el archivo en memoria"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/reservas/exportar?%s' % urlencode({
+                'desde': fields.Date.to_string(self.desde),
+                'hasta': fields.Date.to_string(self.hasta),
+                'formato': self.formato,
+            }),
+            'target': 'self',
+        }
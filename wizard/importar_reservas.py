@@ -0,0 +1,216 @@
+import base64
+import csv
+import io
+import logging
+from collections import defaultdict
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+
+from odoo.addons.reserva_canchas.models.reserva import ESTADOS_ACTIVOS
+from odoo.addons.reserva_canchas.models.reserva_ocupacion import (
+    HORA_APERTURA, HORA_CIERRE, mascara_franjas,
+)
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Reservas por cada create: acota la memoria y el tamaño de cada INSERT
+TAMANO_LOTE = 1000
+
+COLUMNAS = ['cancha', 'dni', 'fecha', 'hora_inicio', 'hora_fin', 'estado', 'metodo_pago', 'pagado', 'notas']
+
+
+class ImportarReservas(models.TransientModel):
+    _name = 'reserva.importar'
+    _description = 'Importar Reservas'
+
+    archivo = fields.Binary(string='Archivo', required=True)
+    nombre_archivo = fields.Char(string='Nombre del Archivo')
+    historico = fields.Boolean(string='Histórico',
+                               help='Permite importar reservas en fechas pasadas')
+    omitir_errores = fields.Boolean(string='Omitir Filas con Errores',
+                                    help='Importa las filas válidas aunque otras tengan errores')
+    estado = fields.Selection([
+        ('borrador', 'Borrador'),
+        ('hecho', 'Hecho')
+    ], string='Estado', default='borrador')
+    resumen = fields.Text(string='Resumen', readonly=True)
+
+    def action_importar(self):
+        self.ensure_one()
+        filas = self._leer_filas()
+        if not filas:
+            raise UserError('El archivo no contiene reservas.')
+
+        vals_list, errores = self._validar(filas)
+        if errores and not self.omitir_errores:
+            self.write({'resumen': self._resumen(0, errores)})
+            return self._reabrir()
+
+        Reserva = self.env['reserva.reserva'].with_context(
+            reserva_historico=self.historico,
+        )._auditoria_lote('Importada desde %s' % (self.nombre_archivo or 'archivo'))
+        creadas = 0
+        for lote in split_every(TAMANO_LOTE, vals_list, list):
+            Reserva.create(lote)
+            creadas += len(lote)
+            # Sin esto la caché retiene todas las reservas creadas
+            self.env.flush_all()
+            self.env.invalidate_all()
+        _logger.info('Importadas %s reservas desde %s', creadas, self.nombre_archivo)
+
+        self.write({'estado': 'hecho', 'resumen': self._resumen(creadas, errores)})
+        return self._reabrir()
+
+    def _leer_filas(self):
+        """Devuelve las filas del archivo como diccionarios con las COLUMNAS"""
+        contenido = base64.b64decode(self.archivo)
+        if (self.nombre_archivo or '').lower().endswith('.xlsx'):
+            if openpyxl is None:
+                raise UserError('Instale la librería openpyxl para importar archivos XLSX.')
+            libro = openpyxl.load_workbook(io.BytesIO(contenido), read_only=True, data_only=True)
+            hoja = libro.active
+            iterador = hoja.iter_rows(values_only=True)
+            cabecera = [str(c or '').strip().lower() for c in next(iterador, [])]
+            filas = [dict(zip(cabecera, fila)) for fila in iterador if any(fila)]
+            libro.close()
+        else:
+            texto = io.StringIO(contenido.decode('utf-8-sig'))
+            lector = csv.DictReader(texto)
+            lector.fieldnames = [c.strip().lower() for c in lector.fieldnames or []]
+            filas = list(lector)
+
+        faltantes = set(COLUMNAS[:5]) - set(filas[0]) if filas else set()
+        if faltantes:
+            raise UserError('Faltan columnas obligatorias: %s' % ', '.join(sorted(faltantes)))
+        return filas
+
+    def _validar(self, filas):
+        """Valida todo el lote de una vez: resuelve canchas y clientes con una
+        consulta cada uno y detecta solapamientos contra los mapas de ocupación
+        y entre las propias filas del archivo.
+        """
+        Reserva = self.env['reserva.reserva']
+        estados = dict(Reserva._fields['estado'].selection)
+        metodos = dict(Reserva._fields['metodo_pago'].selection)
+
+        codigos = {str(fila['cancha'] or '').strip() for fila in filas}
+        dnis = {str(fila['dni'] or '').strip() for fila in filas}
+        canchas = {c['codigo']: c['id'] for c in self.env['reserva.cancha'].search_read(
+            [('codigo', 'in', list(codigos))], ['codigo'])}
+        clientes = {c['dni']: c['id'] for c in self.env['reserva.cliente'].search_read(
+            [('dni', 'in', list(dnis))], ['dni'])}
+
+        hoy = fields.Date.today()
+        vals_list = []
+        errores = []
+        for linea, fila in enumerate(filas, start=2):
+            try:
+                vals = self._fila_a_vals(fila, canchas, clientes, estados, metodos)
+            except (ValueError, TypeError) as e:
+                errores.append((linea, str(e)))
+                continue
+            if vals['fecha'] < hoy and not self.historico:
+                errores.append((linea, 'Fecha pasada (marque Histórico para importarla)'))
+                continue
+            vals_list.append((linea, vals))
+
+        # Franjas ya ocupadas en la base y en las filas anteriores del archivo
+        activas = [(linea, vals) for linea, vals in vals_list if vals['estado'] in ESTADOS_ACTIVOS]
+        ocupadas = defaultdict(int)
+        for claves in split_every(TAMANO_LOTE, {(v['cancha_id'], v['fecha']) for _l, v in activas}, list):
+            ocupadas.update(self.env['reserva.ocupacion']._leer_mapas(claves))
+        rechazadas = set()
+        for linea, vals in activas:
+            clave = (vals['cancha_id'], vals['fecha'])
+            mascara = mascara_franjas(vals['hora_inicio'], vals['hora_fin'])
+            if ocupadas[clave] & mascara:
+                errores.append((linea, 'La cancha ya tiene una reserva en ese horario'))
+                rechazadas.add(linea)
+            else:
+                ocupadas[clave] |= mascara
+
+        errores.sort()
+        return [vals for linea, vals in vals_list if linea not in rechazadas], errores
+
+    @api.model
+    def _fila_a_vals(self, fila, canchas, clientes, estados, metodos):
+        codigo = str(fila['cancha'] or '').strip()
+        dni = str(fila['dni'] or '').strip()
+        if codigo not in canchas:
+            raise ValueError('Cancha desconocida: %s' % codigo)
+        if dni not in clientes:
+            raise ValueError('Cliente desconocido: %s' % dni)
+
+        fecha = self._a_fecha(fila['fecha'])
+        hora_inicio = self._a_horas(fila['hora_inicio'])
+        hora_fin = self._a_horas(fila['hora_fin'])
+        if hora_inicio < HORA_APERTURA or hora_fin > HORA_CIERRE:
+            raise ValueError('Los horarios disponibles son de 6:00 a 23:00')
+        if hora_inicio >= hora_fin:
+            raise ValueError('La hora de inicio debe ser menor a la hora de fin')
+        if (hora_inicio * 2) % 1 or (hora_fin * 2) % 1:
+            raise ValueError('Las reservas van en horas o medias horas')
+
+        estado = str(fila.get('estado') or 'confirmada').strip()
+        if estado not in estados:
+            raise ValueError('Estado desconocido: %s' % estado)
+        metodo_pago = str(fila.get('metodo_pago') or '').strip() or False
+        if metodo_pago and metodo_pago not in metodos:
+            raise ValueError('Método de pago desconocido: %s' % metodo_pago)
+
+        return {
+            'cancha_id': canchas[codigo],
+            'cliente_id': clientes[dni],
+            'fecha': fecha,
+            'hora_inicio': hora_inicio,
+            'hora_fin': hora_fin,
+            'estado': estado,
+            'metodo_pago': metodo_pago,
+            'pagado': str(fila.get('pagado') or '').strip().lower() in ('1', 'si', 'sí', 'true', 'x'),
+            'notas': fila.get('notas') or False,
+        }
+
+    @api.model
+    def _a_fecha(self, valor):
+        """Acepta fechas de Excel o texto AAAA-MM-DD"""
+        try:
+            fecha = fields.Date.to_date(str(valor).strip() if isinstance(valor, str) else valor)
+        except ValueError:
+            fecha = None
+        if not fecha:
+            raise ValueError('Fecha inválida: %s' % (valor or 'vacía'))
+        return fecha
+
+    @api.model
+    def _a_horas(self, valor):
+        """Acepta 18, 18.5 o '18:30'"""
+        if isinstance(valor, str) and ':' in valor:
+            horas, minutos = valor.strip().split(':')[:2]
+            return int(horas) + int(minutos) / 60.0
+        return float(valor)
+
+    @api.model
+    def _resumen(self, creadas, errores):
+        lineas = ['Reservas importadas: %s' % creadas]
+        if errores:
+            lineas.append('Filas con errores: %s' % len(errores))
+            lineas += ['  Fila %s: %s' % error for error in errores[:200]]
+            if len(errores) > 200:
+                lineas.append('  ... y %s más' % (len(errores) - 200))
+        return '\n'.join(lineas)
+
+    def _reabrir(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }